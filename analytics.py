@@ -0,0 +1,278 @@
+import logging
+from datetime import timedelta
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from availability import to_minutes
+from models import Booking, BookingArchive, DepartmentDayUsage, Hall, HallDayUsage, HourUsage
+
+# Hall usage is kept in three rollup tables, updated in the same transaction
+# as every booking or cancellation, so reports read a bounded number of
+# rollup rows (per hall, one per day, department or hour of each day in the
+# range) no matter how much booking history there is. Every rollup row
+# belongs to one hall, so bookings of different halls never write, and wait
+# on, the same rows. 'flask rebuild-analytics' recomputes them from the
+# booking and archive tables.
+
+GRANULARITIES = ('day', 'week', 'month')
+
+
+def _hour_minutes(start_time, end_time):
+    """Split a slot into (hour, minutes) pairs, one per hour it touches"""
+    start, end = to_minutes(start_time), to_minutes(end_time)
+    pairs = []
+    while start < end:
+        hour_end = min(end, (start // 60 + 1) * 60)
+        pairs.append((start // 60, hour_end - start))
+        start = hour_end
+    return pairs
+
+
+def _deltas(slots, sign):
+    """Sum booked minutes and counts of bookings per rollup key.
+
+    slots yields (hall_id, department, booking_date, start_time, end_time),
+    optionally followed by the number of bookings sharing that slot.
+    """
+    halls, departments, hours = {}, {}, {}
+    for hall_id, department, booking_date, start_time, end_time, *count in slots:
+        weight = sign * (count[0] if count else 1)
+        minutes = to_minutes(end_time) - to_minutes(start_time)
+        for totals, key in ((halls, (hall_id, booking_date)), (departments, (hall_id, department, booking_date))):
+            entry = totals.setdefault(key, [0, 0])
+            entry[0] += weight * minutes
+            entry[1] += weight
+        for hour, hour_minutes in _hour_minutes(start_time, end_time):
+            key = (hall_id, booking_date, hour)
+            hours[key] = hours.get(key, 0) + weight * hour_minutes
+    return halls, departments, hours
+
+
+def _add(model, key_columns, rows):
+    """Add rows of counters onto model's rollup rows, creating missing ones.
+
+    rows is a list of dicts holding the key columns and the amounts to add.
+    They are applied in key order so concurrent transactions lock rollup
+    rows in the same order.
+    """
+    if not rows:
+        return
+    rows = sorted(rows, key=lambda row: tuple(row[name] for name in key_columns))
+    value_columns = [name for name in rows[0] if name not in key_columns]
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        # One statement executed for all rows, so it is compiled once and
+        # cached rather than rebuilt with a VALUES entry per row
+        dialect_insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = dialect_insert(model.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={name: getattr(model, name) + getattr(stmt.excluded, name) for name in value_columns}
+        )
+        db.session.execute(stmt, rows)
+        return
+
+    # Generic fallback for other backends
+    for row in rows:
+        result = db.session.execute(
+            update(model)
+            .where(*[getattr(model, name) == row[name] for name in key_columns])
+            .values({name: getattr(model, name) + row[name] for name in value_columns})
+        )
+        if result.rowcount == 0:
+            db.session.execute(model.__table__.insert().values(row))
+
+
+def _rollup_rows(slots, sign):
+    """Return the rollup rows for slots as {model: (key columns, rows)}"""
+    halls, departments, hours = _deltas(slots, sign)
+    return {
+        HallDayUsage: (['hall_id', 'usage_date'], [
+            {'hall_id': hall_id, 'usage_date': usage_date, 'booked_minutes': minutes, 'booking_count': count}
+            for (hall_id, usage_date), (minutes, count) in halls.items()
+        ]),
+        DepartmentDayUsage: (['hall_id', 'department', 'usage_date'], [
+            {'hall_id': hall_id, 'department': department, 'usage_date': usage_date,
+             'booked_minutes': minutes, 'booking_count': count}
+            for (hall_id, department, usage_date), (minutes, count) in departments.items()
+        ]),
+        HourUsage: (['hall_id', 'usage_date', 'hour'], [
+            {'hall_id': hall_id, 'usage_date': usage_date, 'hour': hour, 'booked_minutes': minutes}
+            for (hall_id, usage_date, hour), minutes in hours.items()
+        ]),
+    }
+
+
+def record_slots(slots, sign=1):
+    """Add booked slots to the rollups, or remove them with sign=-1.
+
+    slots are (hall_id, department, booking_date, start_time, end_time)
+    tuples, optionally followed by the number of bookings to add (negative
+    to remove), so one call can record cancellations and new bookings
+    together. The caller commits.
+    """
+    for model, (key_columns, rows) in _rollup_rows(slots, sign).items():
+        _add(model, key_columns, rows)
+
+
+def record_bookings(bookings, sign=1):
+    """Add Booking objects to the rollups, or remove them with sign=-1"""
+    record_slots([
+        (booking.hall_id, booking.department, booking.booking_date, booking.start_time, booking.end_time)
+        for booking in bookings
+    ], sign)
+
+
+def _active_slots(hall_id=None):
+    """Yield the slots of active bookings in the booking table and its archive"""
+    for model in (Booking, BookingArchive):
+        query = (select(model.hall_id, model.department, model.booking_date, model.start_time, model.end_time)
+                 .where(model.status == 'active')
+                 .execution_options(yield_per=1000))
+        if hall_id:
+            query = query.where(model.hall_id == hall_id)
+        yield from db.session.execute(query)
+
+
+def remove_hall(hall_id):
+    """Take a hall's bookings out of the rollups before it is deleted.
+
+    Every rollup row belongs to one hall, so this is one bulk delete per
+    table and no booking is read.
+    """
+    for model in (HallDayUsage, DepartmentDayUsage, HourUsage):
+        db.session.execute(delete(model).where(model.hall_id == hall_id))
+
+
+def rebuild(commit=True):
+    """Recompute every rollup from the booking and archive tables"""
+    for model, (_, rows) in _rollup_rows(_active_slots(), 1).items():
+        db.session.execute(delete(model))
+        # The table is empty now, so plain bulk inserts are enough
+        if rows:
+            db.session.execute(model.__table__.insert(), rows)
+    if commit:
+        db.session.commit()
+
+
+def period_start(day, granularity):
+    """Return the first day of the day, ISO week or month containing day"""
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def occupancy(start_date, end_date, granularity, day_minutes, hall_id=None):
+    """Return booked minutes and occupancy percentage per hall per period.
+
+    day_minutes is the length of the bookable day that 100% stands for.
+    Periods are clipped to start_date..end_date. Halls without bookings in
+    a period are listed with zero usage.
+    """
+    query = select(HallDayUsage.hall_id, HallDayUsage.usage_date, HallDayUsage.booked_minutes,
+                   HallDayUsage.booking_count).where(
+        HallDayUsage.usage_date >= start_date,
+        HallDayUsage.usage_date <= end_date
+    )
+    halls_query = select(Hall.id, Hall.name).order_by(Hall.name)
+    if hall_id:
+        query = query.where(HallDayUsage.hall_id == hall_id)
+        halls_query = halls_query.where(Hall.id == hall_id)
+
+    usage = {}
+    for row in db.session.execute(query):
+        entry = usage.setdefault((row.hall_id, period_start(row.usage_date, granularity)), [0, 0])
+        entry[0] += row.booked_minutes
+        entry[1] += row.booking_count
+
+    # Days of each period that fall inside the range
+    period_days = {}
+    day = start_date
+    while day <= end_date:
+        key = period_start(day, granularity)
+        period_days[key] = period_days.get(key, 0) + 1
+        day += timedelta(days=1)
+
+    results = []
+    for hall in db.session.execute(halls_query):
+        periods = []
+        for start, days in period_days.items():
+            minutes, count = usage.get((hall.id, start), (0, 0))
+            periods.append({
+                'period_start': start.isoformat(),
+                'booked_hours': round(minutes / 60, 2),
+                'bookings': count,
+                'occupancy': round(100 * minutes / (days * day_minutes), 1)
+            })
+        results.append({'hall_id': hall.id, 'hall_name': hall.name, 'periods': periods})
+    return results
+
+
+def department_hours(start_date, end_date, hall_id=None):
+    """Return booked hours and bookings per department, busiest first.
+
+    Covers every hall, or only hall_id if given.
+    """
+    query = (
+        select(
+            DepartmentDayUsage.department,
+            func.sum(DepartmentDayUsage.booked_minutes).label('minutes'),
+            func.sum(DepartmentDayUsage.booking_count).label('bookings')
+        )
+        .where(DepartmentDayUsage.usage_date >= start_date, DepartmentDayUsage.usage_date <= end_date)
+        .group_by(DepartmentDayUsage.department)
+        .having(func.sum(DepartmentDayUsage.booked_minutes) > 0)
+        .order_by(func.sum(DepartmentDayUsage.booked_minutes).desc())
+    )
+    if hall_id:
+        query = query.where(DepartmentDayUsage.hall_id == hall_id)
+    rows = db.session.execute(query)
+    return [
+        {'department': row.department, 'booked_hours': round(row.minutes / 60, 2), 'bookings': row.bookings}
+        for row in rows
+    ]
+
+
+def heatmap(start_date, end_date, hall_id=None):
+    """Return booked hours across all halls, or only hall_id if given, as a
+    7x24 weekday-by-hour grid.
+
+    Row 0 is Monday; column n is the hour starting at n:00.
+    """
+    grid = [[0] * 24 for _ in range(7)]
+    query = (
+        select(HourUsage.usage_date, HourUsage.hour, func.sum(HourUsage.booked_minutes).label('booked_minutes'))
+        .where(HourUsage.usage_date >= start_date, HourUsage.usage_date <= end_date)
+        .group_by(HourUsage.usage_date, HourUsage.hour)
+    )
+    if hall_id:
+        query = query.where(HourUsage.hall_id == hall_id)
+    for row in db.session.execute(query):
+        grid[row.usage_date.weekday()][row.hour] += row.booked_minutes
+    return [[round(minutes / 60, 2) for minutes in hours] for hours in grid]
+
+
+def report(start_date, end_date, granularity, day_minutes, hall_id=None):
+    """Return the occupancy, department and heatmap sections for a range,
+    for every hall or only hall_id"""
+    return {
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'granularity': granularity,
+        'occupancy': occupancy(start_date, end_date, granularity, day_minutes, hall_id),
+        'departments': department_hours(start_date, end_date, hall_id),
+        'heatmap': heatmap(start_date, end_date, hall_id)
+    }
+
+
+@click.command('rebuild-analytics')
+@with_appcontext
+def rebuild_analytics_command():
+    """Recompute the hall usage rollups from all bookings"""
+    rebuild()
+    logging.info('Analytics rollups rebuilt')
@@ -1,56 +1,158 @@
 import os
 import logging
+import click
 from flask import Flask
+from flask.cli import with_appcontext
 from flask_sqlalchemy import SQLAlchemy
 from flask_mail import Mail
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
-
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+import database
 
 class Base(DeclarativeBase):
     pass
 
-db = SQLAlchemy(model_class=Base)
+db = SQLAlchemy(model_class=Base, session_options={'class_': database.RoutingSession})
 mail = Mail()
 
-# create the app
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
-app.config['WTF_CSRF_ENABLED'] = False  # Disable CSRF for simplicity
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
-
-# configure the database
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///hall_management.db")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
-
-# Configure Flask-Mail
-app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
-app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', '587'))
-app.config['MAIL_USE_TLS'] = os.environ.get('MAIL_USE_TLS', 'true').lower() in ['true', 'on', '1']
-app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME')
-app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
-app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('MAIL_DEFAULT_SENDER', os.environ.get('MAIL_USERNAME'))
-
-# initialize the app with extensions
-db.init_app(app)
-mail.init_app(app)
-
-with app.app_context():
-    # Import models to ensure tables are created
+
+def create_app(config=None):
+    """Create and configure the application.
+
+    Nothing here touches the database, so the app can be built once in a
+    gunicorn master (--preload) and forked into workers. Create or upgrade
+    the schema with 'flask migrate-db'.
+    """
+    # Configure logging
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper())
+
+    # create the app
+    app = Flask(__name__)
+    app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
+    app.config['WTF_CSRF_ENABLED'] = False  # Disable CSRF for simplicity
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+
+    # configure the database
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///hall_management.db")
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "pool_recycle": 300,
+        "pool_pre_ping": True,
+    }
+    # Connections kept open per process, and extra ones allowed under load
+    if os.environ.get("DATABASE_POOL_SIZE"):
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"]["pool_size"] = int(os.environ["DATABASE_POOL_SIZE"])
+    if os.environ.get("DATABASE_MAX_OVERFLOW"):
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"]["max_overflow"] = int(os.environ["DATABASE_MAX_OVERFLOW"])
+    # Read replica for read-only requests (see database.py); reads stay on
+    # the primary for DATABASE_REPLICA_STICKY seconds after a client writes
+    if os.environ.get("DATABASE_REPLICA_URL"):
+        app.config["SQLALCHEMY_BINDS"] = {"replica": os.environ["DATABASE_REPLICA_URL"]}
+    app.config["DATABASE_REPLICA_STICKY"] = float(os.environ.get("DATABASE_REPLICA_STICKY", "10"))
+    # SQLite runs in WAL mode so readers do not block the writer
+    app.config["SQLITE_WAL"] = os.environ.get("SQLITE_WAL", "true").lower() in ['true', 'on', '1']
+    app.config["SQLITE_BUSY_TIMEOUT"] = int(os.environ.get("SQLITE_BUSY_TIMEOUT", "5000"))  # milliseconds
+
+    # Configure Flask-Mail
+    app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
+    app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', '587'))
+    app.config['MAIL_USE_TLS'] = os.environ.get('MAIL_USE_TLS', 'true').lower() in ['true', 'on', '1']
+    app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME')
+    app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
+    app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('MAIL_DEFAULT_SENDER', os.environ.get('MAIL_USERNAME'))
+
+    # Configure the availability search
+    app.config['AVAILABILITY_DAY_START'] = os.environ.get('AVAILABILITY_DAY_START', '08:00')
+    app.config['AVAILABILITY_DAY_END'] = os.environ.get('AVAILABILITY_DAY_END', '20:00')
+    app.config['AVAILABILITY_MAX_DAYS'] = int(os.environ.get('AVAILABILITY_MAX_DAYS', '31'))
+
+    # Configure the dashboard fragment cache (see cache.py), in characters
+    # of rendered markup per process
+    app.config['FRAGMENT_CACHE_BYTES'] = int(os.environ.get('FRAGMENT_CACHE_BYTES', str(4 * 1024 * 1024)))
+
+    # Configure the JSON booking API (see idempotency.py)
+    app.config['API_BATCH_MAX_SIZE'] = int(os.environ.get('API_BATCH_MAX_SIZE', '100'))
+    app.config['IDEMPOTENCY_KEY_TTL'] = int(os.environ.get('IDEMPOTENCY_KEY_TTL', '24'))  # hours
+
+    # Configure the per-hall iCalendar feeds
+    app.config['CALENDAR_PAST_DAYS'] = int(os.environ.get('CALENDAR_PAST_DAYS', '90'))
+
+    # Configure utilization analytics (see analytics.py)
+    app.config['ANALYTICS_MAX_DAYS'] = int(os.environ.get('ANALYTICS_MAX_DAYS', '366'))
+
+    # Configure live event streaming ('local' for one process, 'postgres' to
+    # share events between workers through LISTEN/NOTIFY)
+    app.config['EVENT_BUS'] = os.environ.get('EVENT_BUS', 'local')
+    app.config['EVENT_STREAM_KEEPALIVE'] = float(os.environ.get('EVENT_STREAM_KEEPALIVE', '15'))
+
+    # Configure instrumentation (see metrics.py). Set METRICS_DIR to a directory
+    # shared by all gunicorn workers, emptied on deploy, to aggregate /metrics.
+    app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR')
+    app.config['METRICS_FLUSH_INTERVAL'] = float(os.environ.get('METRICS_FLUSH_INTERVAL', '10'))
+    app.config['SLOW_QUERY_THRESHOLD'] = float(os.environ.get('SLOW_QUERY_THRESHOLD', '0.25'))
+
+    # Configure the email outbox (see outbox.py)
+    app.config['OUTBOX_WORKERS'] = int(os.environ.get('OUTBOX_WORKERS', '2'))
+    app.config['OUTBOX_BATCH_SIZE'] = int(os.environ.get('OUTBOX_BATCH_SIZE', '20'))
+    app.config['OUTBOX_POLL_INTERVAL'] = float(os.environ.get('OUTBOX_POLL_INTERVAL', '30'))
+    app.config['OUTBOX_LEASE_SECONDS'] = int(os.environ.get('OUTBOX_LEASE_SECONDS', '300'))
+    app.config['OUTBOX_MAX_ATTEMPTS'] = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '8'))
+    app.config['OUTBOX_RETRY_BASE'] = int(os.environ.get('OUTBOX_RETRY_BASE', '30'))
+    app.config['OUTBOX_RETRY_MAX'] = int(os.environ.get('OUTBOX_RETRY_MAX', '3600'))
+
+    # Configure booking archival (see archive.py)
+    app.config['ARCHIVE_BATCH_SIZE'] = int(os.environ.get('ARCHIVE_BATCH_SIZE', '500'))
+    app.config['ARCHIVE_BATCH_PAUSE'] = float(os.environ.get('ARCHIVE_BATCH_PAUSE', '0.05'))
+
+    if config:
+        app.config.update(config)
+
+    # initialize the app with extensions
+    db.init_app(app)
+    database.init_app(app, db)
+    mail.init_app(app)
+
+    # Import models so their tables are registered, then the views; both
+    # are imported here rather than at module level so importing app.py
+    # stays cheap
     import models  # noqa: F401
-    db.create_all()
+    import analytics
+    import archive
+    import importer
+    import metrics
+    import migrations
+    import outbox
+    import routes
+    import search
+
+    app.register_blueprint(routes.bp)
+    metrics.init_app(app)
+
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(migrations.migrate_db_command)
+    app.cli.add_command(analytics.rebuild_analytics_command)
+    app.cli.add_command(archive.archive_bookings_command)
+    app.cli.add_command(importer.import_command)
+    app.cli.add_command(outbox.outbox_worker_command)
+    app.cli.add_command(search.rebuild_search_command)
+
+    # Make settings available in all templates
+    @app.context_processor
+    def inject_settings():
+        from cache import get_settings
+        return dict(settings=get_settings())
+
+    # Start background email delivery in each serving process
+    @app.before_request
+    def start_outbox_workers():
+        outbox.start_workers(app)
+
+    return app
 
-# Import routes after app initialization
-from routes import *  # noqa: F401, F403
 
-# Make settings available in all templates
-@app.context_processor
-def inject_settings():
-    from models import Settings
-    settings = Settings.query.first()
-    return dict(settings=settings)
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Create the schema, or bring an existing one up to date (as migrate-db)"""
+    import migrations
+    migrations.migrate()
+    logging.info('Database schema created')
@@ -0,0 +1,130 @@
+import logging
+import time
+from datetime import date, datetime
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import delete, func, insert, literal, or_, select, text
+from app import db
+from models import Booking, BookingArchive
+import search
+
+# Tables read by the admin history views, hot table first
+HISTORY_MODELS = (Booking, BookingArchive)
+
+
+def archivable_clause(cutoff):
+    """Return a filter matching bookings that belong in the archive:
+    cancelled ones and those dated before cutoff"""
+    return or_(Booking.status == 'cancelled', Booking.booking_date < cutoff)
+
+
+def _reuses_ids():
+    """Return True if the booking table can reuse the ids of deleted rows.
+
+    Only SQLite tables created without AUTOINCREMENT (before
+    sqlite_autoincrement was set on Booking) do; PostgreSQL sequences and
+    AUTOINCREMENT tables never hand out an id twice.
+    """
+    if db.session.get_bind().dialect.name != 'sqlite':
+        return False
+    table_sql = db.session.execute(
+        text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {'name': Booking.__tablename__}
+    ).scalar()
+    return 'AUTOINCREMENT' not in (table_sql or '').upper()
+
+
+def archive_batch(cutoff, batch_size):
+    """Move up to batch_size archivable bookings in one short transaction.
+
+    Returns the number of bookings moved. On PostgreSQL rows locked by a
+    concurrent booking or cancellation are skipped rather than waited on.
+    """
+    eligible = archivable_clause(cutoff)
+    id_query = select(Booking.id).where(eligible).order_by(Booking.id).limit(batch_size)
+    if _reuses_ids():
+        # The next id is max(id) + 1, so leaving the newest row in place
+        # keeps archived ids from being handed out again
+        newest = db.session.query(func.max(Booking.id)).scalar()
+        if newest is None:
+            return 0
+        id_query = id_query.where(Booking.id < newest)
+    if db.session.get_bind().dialect.name == 'postgresql':
+        id_query = id_query.with_for_update(skip_locked=True)
+    ids = db.session.execute(id_query).scalars().all()
+    if not ids:
+        db.session.rollback()
+        return 0
+
+    columns = [column.name for column in BookingArchive.__table__.columns if column.name != 'archived_at']
+    source = select(*[Booking.__table__.c[name] for name in columns], literal(datetime.utcnow()))
+    db.session.execute(
+        insert(BookingArchive).from_select(columns + ['archived_at'], source.where(Booking.id.in_(ids), eligible))
+    )
+    db.session.execute(delete(Booking).where(Booking.id.in_(ids), eligible))
+    db.session.commit()
+    return len(ids)
+
+
+def archive_bookings(cutoff=None, batch_size=None, pause=None):
+    """Archive bookings in batches until none are left; returns the total moved"""
+    cutoff = cutoff or date.today()
+    batch_size = batch_size or current_app.config['ARCHIVE_BATCH_SIZE']
+    pause = current_app.config['ARCHIVE_BATCH_PAUSE'] if pause is None else pause
+
+    total = 0
+    while True:
+        moved = archive_batch(cutoff, batch_size)
+        total += moved
+        if moved < batch_size:
+            return total
+        logging.debug(f'Archived {total} bookings so far')
+        # Let waiting writers in between batches
+        time.sleep(pause)
+
+
+def filter_history(query, model, criteria):
+    """Apply the admin booking filters to a query or select on model.
+
+    criteria holds q, hall_id, status, department, and date_from/date_to
+    as dates or None (see routes.booking_filters).
+    """
+    if criteria['hall_id']:
+        query = query.where(model.hall_id == criteria['hall_id'])
+    if criteria['status'] in ('active', 'cancelled'):
+        query = query.where(model.status == criteria['status'])
+    if criteria['department']:
+        query = query.where(model.department == criteria['department'])
+    if criteria['date_from']:
+        query = query.where(model.booking_date >= criteria['date_from'])
+    if criteria['date_to']:
+        query = query.where(model.booking_date <= criteria['date_to'])
+    search_clause = search.booking_search_clause(criteria['q'], model)
+    if search_clause is not None:
+        query = query.where(search_clause)
+    return query
+
+
+def merge_history(build_query, sort_key, limit, newest_first=True):
+    """Run build_query(model) against the booking table and its archive and
+    merge the results into one list of at most limit rows.
+
+    build_query must order its query the same way sort_key sorts.
+    """
+    rows = []
+    for model in HISTORY_MODELS:
+        rows.extend(build_query(model).limit(limit).all())
+    rows.sort(key=sort_key, reverse=newest_first)
+    return rows[:limit]
+
+
+@click.command('archive-bookings')
+@click.option('--batch-size', type=int, help='Bookings moved per transaction.')
+@click.option('--before', 'cutoff', type=click.DateTime(formats=['%Y-%m-%d']),
+              help='Archive active bookings dated before this day (default: today).')
+@with_appcontext
+def archive_bookings_command(batch_size, cutoff):
+    """Move past and cancelled bookings into the archive table"""
+    total = archive_bookings(cutoff.date() if cutoff else None, batch_size)
+    logging.info(f'Archived {total} bookings')
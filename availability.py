@@ -0,0 +1,132 @@
+from datetime import datetime, time, timedelta
+from sqlalchemy import select
+from app import db
+from models import Hall, Booking
+
+
+def to_minutes(value):
+    """Convert a time to minutes after midnight"""
+    return value.hour * 60 + value.minute
+
+
+# HH:MM labels for every minute of the day, so formatting is a list lookup
+MINUTE_LABELS = [f'{minute // 60:02d}:{minute % 60:02d}' for minute in range(24 * 60 + 1)]
+
+
+def from_minutes(minutes):
+    """Convert minutes after midnight to an HH:MM string"""
+    return MINUTE_LABELS[minutes]
+
+
+def free_windows(busy, day_start, day_end, duration):
+    """Sweep sorted busy intervals and return the gaps of at least duration.
+
+    busy is a list of (start, end) minute pairs sorted by start; overlapping
+    or touching intervals are merged as the sweep passes them.
+    """
+    windows = []
+    cursor = day_start
+    for start, end in busy:
+        if end <= cursor:
+            continue
+        if start >= day_end:
+            break
+        if start - cursor >= duration:
+            windows.append((cursor, start))
+        cursor = max(cursor, end)
+        if cursor >= day_end:
+            break
+    if day_end - cursor >= duration:
+        windows.append((cursor, day_end))
+    return windows
+
+
+def load_busy(hall_ids, start_date, end_date):
+    """Return sorted busy minute intervals keyed by (hall_id, date).
+
+    One query covers every hall in hall_ids over the whole range.
+    """
+    rows = db.session.connection().execute(
+        select(Booking.hall_id, Booking.booking_date, Booking.start_time, Booking.end_time)
+        .where(
+            Booking.hall_id.in_(hall_ids),
+            Booking.booking_date >= start_date,
+            Booking.booking_date <= end_date,
+            Booking.status == 'active'
+        )
+        .order_by(Booking.hall_id, Booking.booking_date, Booking.start_time)
+    )
+
+    busy = {}
+    for hall_id, booking_date, start_time, end_time in rows:
+        key = (hall_id, booking_date)
+        interval = (start_time.hour * 60 + start_time.minute, end_time.hour * 60 + end_time.minute)
+        if key in busy:
+            busy[key].append(interval)
+        else:
+            busy[key] = [interval]
+    return busy
+
+
+def find_availability(start_date, end_date, min_capacity, duration, day_start=time(8, 0), day_end=time(20, 0), limit=50):
+    """Return free windows per hall for a date range, best capacity fit first.
+
+    Halls are taken in order of capacity fit, limit at a time, and the
+    bookings for each group are loaded with one query and swept in memory.
+    Usually the first group fills the result, so a search costs two queries
+    however many halls and days it covers.
+    """
+    halls = db.session.execute(
+        select(Hall.id, Hall.name, Hall.capacity, Hall.location)
+        .where(Hall.capacity >= min_capacity, Hall.is_available.is_(True))
+        .order_by(Hall.capacity, Hall.name)
+    ).all()
+
+    open_minute = to_minutes(day_start)
+    close_minute = to_minutes(day_end)
+    days = [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+    day_labels = [day.isoformat() for day in days]
+
+    # Many hall/days share the same gaps (a free day most of all), so the
+    # serialized window lists are built once per distinct gap pattern
+    rendered = {}
+
+    def render(windows):
+        key = tuple(windows)
+        if key not in rendered:
+            rendered[key] = [{'start': MINUTE_LABELS[start], 'end': MINUTE_LABELS[end]} for start, end in windows]
+        return rendered[key]
+
+    whole_day = render(free_windows([], open_minute, close_minute, duration))
+
+    results = []
+    for offset in range(0, len(halls), limit):
+        group = halls[offset:offset + limit]
+        busy = load_busy([hall.id for hall in group], start_date, end_date)
+        for hall_id, name, capacity, location in group:
+            hall_days = []
+            for day, label in zip(days, day_labels):
+                intervals = busy.get((hall_id, day))
+                if intervals:
+                    windows = free_windows(intervals, open_minute, close_minute, duration)
+                    if windows:
+                        hall_days.append({'date': label, 'windows': render(windows)})
+                elif whole_day:
+                    hall_days.append({'date': label, 'windows': whole_day})
+            if hall_days:
+                results.append({
+                    'id': hall_id,
+                    'name': name,
+                    'capacity': capacity,
+                    'location': location,
+                    'capacity_slack': capacity - min_capacity,
+                    'days': hall_days
+                })
+                if len(results) >= limit:
+                    return results
+    return results
+
+
+def parse_time(value):
+    """Parse an HH:MM string"""
+    return datetime.strptime(value, '%H:%M').time()
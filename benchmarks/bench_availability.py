@@ -0,0 +1,95 @@
+"""Benchmark /api/availability against a seeded SQLite database.
+
+Usage: python benchmarks/bench_availability.py [--halls 500] [--days 30]
+
+Seeds a temporary database, then times repeated availability searches
+through the Flask test client. Exits non-zero if the p95 latency is over
+--budget-ms.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, time as dtime, timedelta
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument('--halls', type=int, default=500)
+parser.add_argument('--days', type=int, default=30)
+parser.add_argument('--bookings-per-day', type=int, default=4)
+parser.add_argument('--limit', type=int, default=50)
+parser.add_argument('--runs', type=int, default=20)
+parser.add_argument('--budget-ms', type=float, default=100.0)
+args = parser.parse_args()
+
+db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+os.environ.setdefault('OUTBOX_WORKERS', '0')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+from app import create_app, db  # noqa: E402
+from models import Hall, Booking, Settings  # noqa: E402
+
+app = create_app()
+logging.disable(logging.CRITICAL)
+
+
+def seed():
+    db.create_all()
+    rng = random.Random(42)
+    start = date.today() + timedelta(days=1)
+    db.session.add(Settings(college_name='Benchmark College', admin_emails='admin@example.com', is_setup_complete=True))
+    db.session.execute(insert(Hall), [
+        {'name': f'Hall {i}', 'capacity': rng.randint(20, 500), 'location': f'Block {i % 20}', 'is_available': True}
+        for i in range(args.halls)
+    ])
+    bookings = []
+    for hall_id in range(1, args.halls + 1):
+        for offset in range(args.days):
+            hour = 8
+            for _ in range(args.bookings_per_day):
+                hour += rng.randint(0, 1)
+                length = rng.randint(1, 2)
+                if hour + length > 20:
+                    break
+                bookings.append({
+                    'hall_id': hall_id, 'student_name': 'Bench', 'department': 'Dept',
+                    'purpose': 'Benchmark booking', 'booking_date': start + timedelta(days=offset),
+                    'start_time': dtime(hour), 'end_time': dtime(hour + length), 'status': 'active'
+                })
+                hour += length
+    db.session.execute(insert(Booking), bookings)
+    db.session.commit()
+    return start, len(bookings)
+
+
+def main():
+    with app.app_context():
+        start, booking_count = seed()
+    end = start + timedelta(days=args.days - 1)
+    url = f'/api/availability?start_date={start}&end_date={end}&min_capacity=100&duration=60&limit={args.limit}'
+
+    client = app.test_client()
+    response = client.get(url)
+    assert response.status_code == 200, response.data
+    hall_count = len(response.get_json()['halls'])
+
+    timings = []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        client.get(url)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    p95 = timings[max(0, int(len(timings) * 0.95) - 1)]
+
+    print(f'{args.halls} halls, {args.days} days, {booking_count} bookings, {hall_count} halls returned (limit {args.limit})')
+    print(f'median {statistics.median(timings):.1f} ms, p95 {p95:.1f} ms, max {timings[-1]:.1f} ms')
+    return 0 if p95 <= args.budget_ms else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
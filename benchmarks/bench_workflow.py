@@ -0,0 +1,234 @@
+"""Load benchmark for the booking workflow against a seeded SQLite database.
+
+Usage: python benchmarks/bench_workflow.py [--halls 200] [--bookings 20000]
+       [--requests 200] [--threads 16] [--output run.json] [--compare old.json]
+
+Seeds a temporary database with Settings, Hall and Booking rows, then
+drives the app in-process through the Flask test client. For each scenario
+it reports latency percentiles, throughput and SQL queries per request.
+The concurrent scenario fires bookings for the same slot from many threads
+and checks that exactly one succeeds. Runs offline; results can be saved
+as JSON and compared with an earlier run.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, time as dtime, timedelta
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument('--halls', type=int, default=200)
+parser.add_argument('--bookings', type=int, default=20000)
+parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+parser.add_argument('--threads', type=int, default=16, help='threads in the concurrent scenario')
+parser.add_argument('--output', help='write results to this JSON file')
+parser.add_argument('--compare', help='compare with a JSON file from an earlier run')
+args = parser.parse_args()
+
+db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+os.environ.setdefault('OUTBOX_WORKERS', '0')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging  # noqa: E402
+import sqlalchemy  # noqa: E402
+from sqlalchemy import event, insert  # noqa: E402
+from app import create_app, db  # noqa: E402
+from models import Hall, Booking, Settings  # noqa: E402
+
+app = create_app({'SETTINGS_VERSION_FILE': os.path.join(os.path.dirname(db_path), 'settings.version')})
+logging.disable(logging.CRITICAL)
+
+# SQL statements issued by the current thread
+_query_counts = threading.local()
+
+
+def _count_query(*_):
+    _query_counts.value = getattr(_query_counts, 'value', 0) + 1
+
+
+def seed():
+    db.create_all()
+    rng = random.Random(42)
+    today = date.today()
+    db.session.add(Settings(college_name='Benchmark College', admin_emails='admin@example.com', is_setup_complete=True))
+    db.session.execute(insert(Hall), [
+        {'name': f'Hall {i}', 'capacity': rng.randint(20, 500), 'location': f'Block {i % 20}', 'is_available': True}
+        for i in range(args.halls)
+    ])
+    # Bookings spread over the 30 days either side of today, 08:00-18:00.
+    # Each hall's bookings alternate after and before today (0, -1, 1, -2,
+    # ...), so upcoming bookings exist however few there are per hall
+    bookings = []
+    for i in range(args.bookings):
+        slot = i // args.halls
+        day = slot % 60
+        hour = 8 + (slot // 60) % 10
+        bookings.append({
+            'hall_id': i % args.halls + 1, 'student_name': f'Student {i}', 'department': f'Dept {i % 12}',
+            'purpose': 'Seeded benchmark booking',
+            'booking_date': today + timedelta(days=day // 2 if day % 2 == 0 else -(day // 2 + 1)),
+            'start_time': dtime(hour), 'end_time': dtime(hour + 1),
+            'status': 'active' if i % 10 else 'cancelled'
+        })
+    db.session.execute(insert(Booking), bookings)
+    db.session.commit()
+
+
+def booking_form(booking_date, start_hour, name='Bench Student'):
+    return {
+        'student_name': name, 'department': 'Benchmarking', 'purpose': 'Benchmark booking request',
+        'booking_date': booking_date.isoformat(), 'start_time': f'{start_hour:02d}:00', 'end_time': f'{start_hour + 1:02d}:00'
+    }
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(timings, queries, statuses, elapsed):
+    timings = sorted(timings)
+    return {
+        'requests': len(timings),
+        'p50_ms': round(percentile(timings, 0.50) * 1000, 3),
+        'p90_ms': round(percentile(timings, 0.90) * 1000, 3),
+        'p99_ms': round(percentile(timings, 0.99) * 1000, 3),
+        'max_ms': round(timings[-1] * 1000, 3) if timings else 0.0,
+        'throughput_rps': round(len(timings) / elapsed, 1) if elapsed else 0.0,
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else 0.0,
+        'status_codes': {str(code): statuses.count(code) for code in sorted(set(statuses))}
+    }
+
+
+def run_scenario(name, make_request, count):
+    """Run count requests sequentially; make_request(client, i) returns a response"""
+    client = app.test_client()
+    make_request(client, -1)  # warm up caches and compiled statements
+    timings, queries, statuses = [], [], []
+    started = time.perf_counter()
+    for i in range(count):
+        _query_counts.value = 0
+        request_started = time.perf_counter()
+        response = make_request(client, i)
+        timings.append(time.perf_counter() - request_started)
+        queries.append(_query_counts.value)
+        statuses.append(response.status_code)
+    return summarize(timings, queries, statuses, time.perf_counter() - started)
+
+
+def run_concurrent(threads):
+    """Fire bookings for one slot of one hall from many threads at once"""
+    slot_date = date.today() + timedelta(days=400)
+    barrier = threading.Barrier(threads)
+    timings, queries, statuses = [], [], []
+    lock = threading.Lock()
+
+    def worker(i):
+        client = app.test_client()
+        barrier.wait()
+        _query_counts.value = 0
+        request_started = time.perf_counter()
+        response = client.post('/book/1', data=booking_form(slot_date, 10, name=f'Racer {i}'))
+        elapsed = time.perf_counter() - request_started
+        with lock:
+            timings.append(elapsed)
+            queries.append(_query_counts.value)
+            statuses.append(response.status_code)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    result = summarize(timings, queries, statuses, time.perf_counter() - started)
+
+    with app.app_context():
+        result['bookings_created'] = Booking.query.filter_by(hall_id=1, booking_date=slot_date, status='active').count()
+    result['double_booked'] = result['bookings_created'] > 1
+    return result
+
+
+def main():
+    with app.app_context():
+        seed()
+        event.listen(db.engine, 'before_cursor_execute', _count_query)
+        active_ids = [row.id for row in Booking.query.filter(
+            Booking.status == 'active', Booking.booking_date >= date.today()
+        ).with_entities(Booking.id).order_by(Booking.id).limit(args.requests + 1)]
+        # The cancel scenario cancels a different upcoming booking per request
+        if len(active_ids) < args.requests + 1:
+            sys.exit(f'Only {len(active_ids)} upcoming active bookings were seeded; the cancel scenario needs '
+                     f'{args.requests + 1}. Raise --bookings or lower --requests.')
+        taken = db.session.get(Booking, active_ids[0])
+        taken_hall, taken_date, taken_hour = taken.hall_id, taken.booking_date, taken.start_time.hour
+
+    future = date.today() + timedelta(days=100)
+
+    def book_free(client, i):
+        # A fresh slot per request: cycle through halls, then hours, then days
+        i += 1
+        hall_id = i % args.halls + 1
+        slot = i // args.halls
+        return client.post(f'/book/{hall_id}', data=booking_form(future + timedelta(days=slot // 10), 8 + slot % 10))
+
+    scenarios = {
+        'index': lambda client, i: client.get('/'),
+        'admin': lambda client, i: client.get('/admin'),
+        'api_halls': lambda client, i: client.get('/api/halls'),
+        'book_hall': book_free,
+        'book_hall_conflict': lambda client, i: client.post(f'/book/{taken_hall}', data=booking_form(taken_date, taken_hour)),
+        'cancel_booking': lambda client, i: client.post(f'/admin/booking/{active_ids[i + 1]}/cancel'),
+    }
+
+    results = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlalchemy': sqlalchemy.__version__,
+            'database': 'sqlite',
+            'halls': args.halls,
+            'bookings': args.bookings,
+            'requests_per_scenario': args.requests,
+            'threads': args.threads
+        },
+        'scenarios': {}
+    }
+    for name, make_request in scenarios.items():
+        results['scenarios'][name] = run_scenario(name, make_request, args.requests)
+    results['scenarios']['concurrent_booking'] = run_concurrent(args.threads)
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)['scenarios']
+
+    print(f"{args.halls} halls, {args.bookings} bookings, {args.requests} requests per scenario")
+    print(f"{'scenario':<22}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'req/s':>9}{'queries':>9}")
+    for name, result in results['scenarios'].items():
+        line = (f"{name:<22}{result['p50_ms']:>9.2f}{result['p90_ms']:>9.2f}{result['p99_ms']:>9.2f}"
+                f"{result['throughput_rps']:>9.1f}{result['queries_per_request']:>9.1f}")
+        if previous and name in previous and previous[name]['p50_ms']:
+            change = (result['p50_ms'] - previous[name]['p50_ms']) / previous[name]['p50_ms'] * 100
+            line += f"  p50 {change:+.1f}%"
+        print(line)
+    concurrent = results['scenarios']['concurrent_booking']
+    print(f"concurrent: {concurrent['bookings_created']} of {args.threads} racing bookings created")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Results written to {args.output}')
+    return 1 if concurrent['double_booked'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,362 @@
+from datetime import date
+from sqlalchemy import insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from models import Booking, BookingSeries, HallDayLock, WaitlistEntry
+import analytics
+import sync
+
+# Upper bound on the occurrences one series may expand to
+MAX_SERIES_OCCURRENCES = 60
+
+
+class BookingConflictError(Exception):
+    """Raised when a requested slot overlaps an active booking"""
+
+    def __init__(self, booking, index=None):
+        super().__init__(f'Slot overlaps booking {booking.id}')
+        self.booking = booking
+        # Position of the clashing request, for create_bookings
+        self.index = index
+
+
+class SeriesConflictError(Exception):
+    """Raised when occurrences of a booking series overlap active bookings"""
+
+    def __init__(self, conflicts):
+        super().__init__(f'{len(conflicts)} occurrences overlap existing bookings')
+        # Sorted list of (date, [conflicting bookings]) pairs
+        self.conflicts = conflicts
+
+
+def lock_hall_days(hall_id, booking_dates):
+    """Lock one hall for the given days until the current transaction ends.
+
+    The lock is a write to the hall's HallDayLock rows. PostgreSQL holds a
+    row lock on each, so other halls and days are not blocked. SQLite takes
+    its database write lock here, before the conflict check reads anything,
+    so concurrent check-and-insert sequences are serialized.
+    """
+    # A fixed order keeps two transactions locking overlapping days from
+    # deadlocking
+    booking_dates = sorted(set(booking_dates))
+    if not booking_dates:
+        return
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        dialect_insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = dialect_insert(HallDayLock).values([
+            {'hall_id': hall_id, 'booking_date': booking_date, 'version': 1}
+            for booking_date in booking_dates
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['hall_id', 'booking_date'],
+            set_={'version': HallDayLock.version + 1}
+        )
+        db.session.execute(stmt)
+        return
+
+    # Generic fallback for other backends
+    for booking_date in booking_dates:
+        result = db.session.execute(
+            update(HallDayLock)
+            .where(HallDayLock.hall_id == hall_id, HallDayLock.booking_date == booking_date)
+            .values(version=HallDayLock.version + 1)
+        )
+        if result.rowcount == 0:
+            db.session.add(HallDayLock(hall_id=hall_id, booking_date=booking_date, version=1))
+            db.session.flush()
+
+
+def lock_hall_day(hall_id, booking_date):
+    """Lock one hall for one day until the current transaction ends"""
+    lock_hall_days(hall_id, [booking_date])
+
+
+def lock_many_hall_days(keys):
+    """Lock (hall_id, booking_date) pairs, hall by hall in id order.
+
+    A transaction changing several halls or days takes all its locks here,
+    before writing anything else, so it cannot deadlock with another.
+    """
+    booking_dates = {}
+    for hall_id, booking_date in keys:
+        booking_dates.setdefault(hall_id, set()).add(booking_date)
+    for hall_id, dates in sorted(booking_dates.items()):
+        lock_hall_days(hall_id, dates)
+
+
+def find_conflict(hall_id, booking_date, start_time, end_time):
+    """Return the first active booking overlapping the given slot, if any"""
+    return Booking.query.filter(
+        Booking.hall_id == hall_id,
+        Booking.booking_date == booking_date,
+        Booking.status == 'active',
+        Booking.start_time < end_time,
+        Booking.end_time > start_time
+    ).order_by(Booking.start_time).first()
+
+
+def _insert_booking(hall_id, student_name, department, purpose, booking_date, start_time, end_time):
+    """Check for conflicts and insert a booking; the caller holds the lock"""
+    existing_booking = find_conflict(hall_id, booking_date, start_time, end_time)
+    if existing_booking:
+        raise BookingConflictError(existing_booking)
+
+    booking = Booking()
+    booking.hall_id = hall_id
+    booking.student_name = student_name
+    booking.department = department
+    booking.purpose = purpose
+    booking.booking_date = booking_date
+    booking.start_time = start_time
+    booking.end_time = end_time
+    db.session.add(booking)
+    db.session.flush()
+    return booking
+
+
+def create_booking(hall_id, student_name, department, purpose, booking_date, start_time, end_time):
+    """Check for conflicts and insert a booking atomically.
+
+    Raises BookingConflictError if the slot is taken. The booking is flushed
+    but not committed; the caller commits or rolls back, which releases the
+    hall/day lock.
+    """
+    lock_hall_day(hall_id, booking_date)
+    booking = _insert_booking(hall_id, student_name, department, purpose, booking_date, start_time, end_time)
+    analytics.record_bookings([booking])
+    sync.touch_halls([hall_id])
+    return booking
+
+
+def create_bookings(items):
+    """Create several bookings atomically, all or none.
+
+    items are dicts of create_booking's arguments. Every hall/day is locked
+    first; the rollups and change numbers are updated once at the end.
+    Raises BookingConflictError, with the index of the first item clashing
+    with a stored booking or an earlier item. The caller commits or rolls
+    back.
+    """
+    lock_many_hall_days((item['hall_id'], item['booking_date']) for item in items)
+    bookings = []
+    for index, item in enumerate(items):
+        try:
+            bookings.append(_insert_booking(**item))
+        except BookingConflictError as conflict:
+            conflict.index = index
+            raise
+    analytics.record_bookings(bookings)
+    sync.touch_halls([booking.hall_id for booking in bookings])
+    return bookings
+
+
+def join_waitlist(hall_id, student_name, department, purpose, booking_date, start_time, end_time):
+    """Queue a request for a slot that clashes with an active booking.
+
+    The caller commits.
+    """
+    entry = WaitlistEntry()
+    entry.hall_id = hall_id
+    entry.student_name = student_name
+    entry.department = department
+    entry.purpose = purpose
+    entry.booking_date = booking_date
+    entry.start_time = start_time
+    entry.end_time = end_time
+    db.session.add(entry)
+    db.session.flush()
+    return entry
+
+
+def waitlist_position(entry):
+    """Return the 1-based position of a waiting entry among those it overlaps"""
+    return WaitlistEntry.query.filter(
+        WaitlistEntry.hall_id == entry.hall_id,
+        WaitlistEntry.booking_date == entry.booking_date,
+        WaitlistEntry.status == 'waiting',
+        WaitlistEntry.start_time < entry.end_time,
+        WaitlistEntry.end_time > entry.start_time,
+        WaitlistEntry.id <= entry.id
+    ).count()
+
+
+def promote_waitlist(hall_id, booking_date, start_time, end_time):
+    """Turn waiting entries that now fit into bookings, oldest first.
+
+    Only entries overlapping the freed slot can have become bookable, so
+    only those are read, through ix_waitlist_slot. The caller holds the
+    hall/day lock, adds the returned bookings to the rollups, touches the
+    hall and commits.
+    """
+    if booking_date < date.today():
+        return []
+    candidates = WaitlistEntry.query.filter(
+        WaitlistEntry.hall_id == hall_id,
+        WaitlistEntry.booking_date == booking_date,
+        WaitlistEntry.status == 'waiting',
+        WaitlistEntry.start_time < end_time,
+        WaitlistEntry.end_time > start_time
+    ).order_by(WaitlistEntry.created_at, WaitlistEntry.id).all()
+
+    promoted = []
+    for entry in candidates:
+        try:
+            booking = _insert_booking(entry.hall_id, entry.student_name, entry.department, entry.purpose,
+                                      entry.booking_date, entry.start_time, entry.end_time)
+        except BookingConflictError:
+            continue
+        entry.status = 'promoted'
+        entry.booking_id = booking.id
+        promoted.append(booking)
+    return promoted
+
+
+def _slot(booking, count=1):
+    return (booking.hall_id, booking.department, booking.booking_date, booking.start_time, booking.end_time, count)
+
+
+def cancel_bookings(bookings):
+    """Cancel active bookings and promote waitlisted requests into their slots.
+
+    Each status changes with a conditional update, so of two concurrent
+    cancellations only one takes effect. As in create_bookings, every
+    hall/day is locked first and the rollups and change numbers are
+    updated once at the end. Returns a dict mapping each booking id to the
+    bookings promoted into its slot, or to None if the booking was no
+    longer active; the caller commits.
+    """
+    lock_many_hall_days((booking.hall_id, booking.booking_date) for booking in bookings)
+    results, slots = {}, []
+    for booking in bookings:
+        result = db.session.execute(
+            update(Booking)
+            .where(Booking.id == booking.id, Booking.status == 'active')
+            .values(status='cancelled')
+        )
+        if result.rowcount == 0:
+            results[booking.id] = None
+            continue
+        promoted = promote_waitlist(booking.hall_id, booking.booking_date, booking.start_time, booking.end_time)
+        slots.append(_slot(booking, -1))
+        slots.extend(_slot(promoted_booking) for promoted_booking in promoted)
+        results[booking.id] = promoted
+    # One pass, so rollup rows are locked in key order
+    analytics.record_slots(slots)
+    sync.touch_halls([slot[0] for slot in slots])
+    return results
+
+
+def cancel_booking(booking):
+    """Cancel one booking; returns the bookings promoted into its slot, or
+    None if it was no longer active. The caller commits."""
+    return cancel_bookings([booking])[booking.id]
+
+
+def find_series_conflicts(hall_id, booking_dates, start_time, end_time):
+    """Return (date, [bookings]) pairs for every date with an overlap.
+
+    All dates are checked with one query.
+    """
+    clashes = Booking.query.filter(
+        Booking.hall_id == hall_id,
+        Booking.booking_date.in_(booking_dates),
+        Booking.status == 'active',
+        Booking.start_time < end_time,
+        Booking.end_time > start_time
+    ).order_by(Booking.booking_date, Booking.start_time).all()
+
+    conflicts = {}
+    for booking in clashes:
+        conflicts.setdefault(booking.booking_date, []).append(booking)
+    return sorted(conflicts.items())
+
+
+def create_series(hall_id, student_name, department, purpose, start_date, until_date, interval_weeks, start_time, end_time):
+    """Create a recurring series and all its bookings atomically.
+
+    Raises SeriesConflictError listing every clashing occurrence, or
+    ValueError if the rule expands to too many occurrences. As with
+    create_booking, the caller commits or rolls back.
+    """
+    series = BookingSeries()
+    series.hall_id = hall_id
+    series.student_name = student_name
+    series.department = department
+    series.purpose = purpose
+    series.start_date = start_date
+    series.until_date = until_date
+    series.interval_weeks = interval_weeks
+    series.start_time = start_time
+    series.end_time = end_time
+
+    booking_dates = series.occurrence_dates()
+    if len(booking_dates) > MAX_SERIES_OCCURRENCES:
+        raise ValueError(f'A series cannot have more than {MAX_SERIES_OCCURRENCES} occurrences')
+
+    lock_hall_days(hall_id, booking_dates)
+
+    conflicts = find_series_conflicts(hall_id, booking_dates, start_time, end_time)
+    if conflicts:
+        raise SeriesConflictError(conflicts)
+
+    db.session.add(series)
+    db.session.flush()
+    db.session.execute(insert(Booking), [
+        {
+            'hall_id': hall_id,
+            'series_id': series.id,
+            'student_name': student_name,
+            'department': department,
+            'purpose': purpose,
+            'booking_date': booking_date,
+            'start_time': start_time,
+            'end_time': end_time,
+            'status': 'active'
+        }
+        for booking_date in booking_dates
+    ])
+    analytics.record_slots([
+        (hall_id, department, booking_date, start_time, end_time) for booking_date in booking_dates
+    ])
+    sync.touch_halls([hall_id])
+    return series
+
+
+def cancel_series(series):
+    """Cancel a series and its remaining occurrences with one bulk update.
+
+    Occurrences before today are kept as history. Returns the number of
+    bookings cancelled and the bookings promoted from the waitlist into
+    the freed slots; the caller commits.
+    """
+    today = date.today()
+    # Lock every day the series may still hold before writing anything
+    lock_hall_days(series.hall_id, [day for day in series.occurrence_dates() if day >= today])
+    series.status = 'cancelled'
+    upcoming = (
+        Booking.series_id == series.id,
+        Booking.status == 'active',
+        Booking.booking_date >= today
+    )
+    stmt = update(Booking).where(*upcoming).values(status='cancelled')
+    options = {'synchronize_session': False}
+    # The rollups need the dates actually cancelled; RETURNING reads them
+    # in the same statement where the backend supports it
+    if db.session.get_bind().dialect.update_returning:
+        cancelled_dates = db.session.execute(stmt.returning(Booking.booking_date), execution_options=options).scalars().all()
+    else:
+        cancelled_dates = db.session.execute(select(Booking.booking_date).where(*upcoming)).scalars().all()
+        db.session.execute(stmt, execution_options=options)
+    slots = [
+        (series.hall_id, series.department, booking_date, series.start_time, series.end_time, -1)
+        for booking_date in cancelled_dates
+    ]
+    promoted = []
+    for booking_date in sorted(cancelled_dates):
+        promoted.extend(promote_waitlist(series.hall_id, booking_date, series.start_time, series.end_time))
+    slots.extend(_slot(booking) for booking in promoted)
+    analytics.record_slots(slots)
+    sync.touch_halls([series.hall_id])
+    return len(cancelled_dates), promoted
@@ -0,0 +1,111 @@
+import os
+import threading
+from collections import OrderedDict
+from flask import current_app, g
+from sqlalchemy.orm import Session
+from app import db
+from models import Settings
+
+# Settings row shared by every request in this process. Other workers are
+# told to reload it through a version file in the instance folder, which
+# setup replaces after each commit; checking it costs one stat() call.
+_settings_lock = threading.Lock()
+_settings_cache = {'version': None, 'loaded': False, 'settings': None}
+
+stats = {'settings_hits': 0, 'settings_misses': 0}
+
+
+def _settings_version_path():
+    return current_app.config.get('SETTINGS_VERSION_FILE') or os.path.join(current_app.instance_path, 'settings.version')
+
+
+def _read_settings_version():
+    try:
+        stat = os.stat(_settings_version_path())
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns)
+
+
+def get_settings():
+    """Return the Settings row from the process cache.
+
+    The returned instance is detached from the session and shared between
+    requests, so treat it as read-only; load the row with Settings.query
+    to modify it.
+    """
+    if '_cached_settings' in g:
+        return g._cached_settings
+
+    version = _read_settings_version()
+    with _settings_lock:
+        if _settings_cache['loaded'] and _settings_cache['version'] == version:
+            stats['settings_hits'] += 1
+            settings = _settings_cache['settings']
+        else:
+            stats['settings_misses'] += 1
+            # A private session keeps the cached instance out of the
+            # request session, where a commit would expire it
+            with Session(db.engine) as session:
+                settings = session.query(Settings).order_by(Settings.id).first()
+            if settings is not None:
+                settings.email_list  # parse once while the row is cached
+            _settings_cache.update(version=version, loaded=True, settings=settings)
+
+    g._cached_settings = settings
+    return settings
+
+
+def invalidate_settings():
+    """Drop the cached Settings in this process and bump the shared version"""
+    with _settings_lock:
+        _settings_cache.update(version=None, loaded=False, settings=None)
+    g.pop('_cached_settings', None)
+
+    path = _settings_version_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(os.urandom(8).hex())
+    # os.replace gives the file a new inode, so every worker sees a change
+    os.replace(tmp_path, path)
+
+
+# Rendered HTML fragments, least recently used first. Keys carry everything
+# the markup depends on (e.g. a hall's change_seq), so entries never need
+# invalidating: a change makes a new key and the old entry ages out. The
+# total size of cached markup is bounded by FRAGMENT_CACHE_BYTES.
+_fragment_lock = threading.Lock()
+_fragments = OrderedDict()
+_fragment_sizes = {'total': 0}
+
+stats.update(fragment_hits=0, fragment_misses=0)
+
+
+def get_fragment(key):
+    """Return the cached fragment for key, or None"""
+    with _fragment_lock:
+        fragment = _fragments.get(key)
+        if fragment is None:
+            stats['fragment_misses'] += 1
+            return None
+        _fragments.move_to_end(key)
+        stats['fragment_hits'] += 1
+        return fragment
+
+
+def set_fragment(key, fragment):
+    """Cache a rendered fragment, evicting the least recently used ones"""
+    max_bytes = current_app.config['FRAGMENT_CACHE_BYTES']
+    size = len(fragment)
+    if size > max_bytes:
+        return
+    with _fragment_lock:
+        old = _fragments.pop(key, None)
+        if old is not None:
+            _fragment_sizes['total'] -= len(old)
+        _fragments[key] = fragment
+        _fragment_sizes['total'] += size
+        while _fragment_sizes['total'] > max_bytes:
+            _, evicted = _fragments.popitem(last=False)
+            _fragment_sizes['total'] -= len(evicted)
@@ -0,0 +1,65 @@
+import time
+from flask import g, has_app_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+# Read-only requests (GET, HEAD, OPTIONS) are served from a read replica
+# when DATABASE_REPLICA_URL is set; everything else uses the primary. For a
+# few seconds after a client's write its reads stay on the primary too, so
+# it sees its own change despite replication lag.
+REPLICA_BIND = 'replica'
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PRIMARY_UNTIL_KEY = '_primary_until'
+
+
+class RoutingSession(Session):
+    """Session that sends the reads of read-only requests to the replica.
+
+    Flushes, INSERT/UPDATE/DELETE statements and SELECT ... FOR UPDATE
+    always go to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and has_app_context() and g.get('use_replica')
+                and not getattr(clause, 'is_dml', False) and getattr(clause, '_for_update_arg', None) is None):
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _sqlite_pragmas(busy_timeout):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # WAL lets readers run alongside a writer; NORMAL syncs at
+        # checkpoints rather than on every commit, which is still safe in
+        # WAL mode
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA busy_timeout={int(busy_timeout)}')
+        cursor.close()
+    return set_pragmas
+
+
+def init_app(app, db):
+    """Tune SQLite engines and route read-only requests to the replica"""
+    with app.app_context():
+        engines = db.engines.values()
+    if app.config['SQLITE_WAL']:
+        for engine in engines:
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', _sqlite_pragmas(app.config['SQLITE_BUSY_TIMEOUT']))
+
+    if REPLICA_BIND not in app.config.get('SQLALCHEMY_BINDS', {}):
+        return
+
+    @app.before_request
+    def choose_engine():
+        g.use_replica = (request.method in READ_METHODS
+                         and session.get(PRIMARY_UNTIL_KEY, 0) < time.time())
+
+    @app.after_request
+    def stick_to_primary(response):
+        if request.method not in READ_METHODS:
+            session[PRIMARY_UNTIL_KEY] = time.time() + app.config['DATABASE_REPLICA_STICKY']
+        return response
@@ -0,0 +1,178 @@
+import json
+import logging
+import os
+import queue
+import select
+import threading
+from flask import current_app
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from app import db
+
+# Events waiting for the current transaction to commit live in session.info
+PENDING_KEY = 'pending_events'
+
+
+class Subscription:
+    """One client's view of the bus; a bounded queue of events"""
+
+    def __init__(self, bus, maxsize=100):
+        self.bus = bus
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # A slow client loses events; it is told to resync instead
+            self.overflowed = True
+
+    def get(self, timeout):
+        """Return the next event, or None if nothing arrived in time"""
+        if self.overflowed:
+            self.overflowed = False
+            with self.queue.mutex:
+                self.queue.queue.clear()
+            return {'type': 'resync', 'data': {}}
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class LocalBus:
+    """In-process pub/sub fanning events out to every subscription"""
+
+    def __init__(self, app):
+        self.lock = threading.Lock()
+        self.subscriptions = set()
+
+    def subscribe(self):
+        subscription = Subscription(self)
+        with self.lock:
+            self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def publish(self, events):
+        self.deliver(events)
+
+    def deliver(self, events):
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            for item in events:
+                subscription.put(item)
+
+
+class PostgresBus(LocalBus):
+    """Bus shared by every worker through PostgreSQL LISTEN/NOTIFY.
+
+    Each process runs one listener thread holding a dedicated connection and
+    fans notifications out to its local subscriptions.
+    """
+
+    CHANNEL = 'hall_events'
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.app = app
+        listener = threading.Thread(target=self.listen, name='event-bus-listener', daemon=True)
+        listener.start()
+
+    def publish(self, events):
+        with db.engine.connect() as connection:
+            for item in events:
+                connection.execute(text('SELECT pg_notify(:channel, :payload)'), {
+                    'channel': self.CHANNEL,
+                    'payload': json.dumps(item)
+                })
+            connection.commit()
+
+    def listen(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    raw = db.engine.raw_connection()
+                try:
+                    connection = raw.driver_connection
+                    connection.autocommit = True
+                    connection.cursor().execute(f'LISTEN {self.CHANNEL}')
+                    while True:
+                        if select.select([connection], [], [], 30) == ([], [], []):
+                            continue
+                        connection.poll()
+                        events = []
+                        while connection.notifies:
+                            events.append(json.loads(connection.notifies.pop(0).payload))
+                        if events:
+                            self.deliver(events)
+                finally:
+                    raw.invalidate()
+            except Exception as e:
+                logging.error(f'Event bus listener error: {str(e)}')
+                threading.Event().wait(5)
+
+
+BACKENDS = {
+    'local': LocalBus,
+    'postgres': PostgresBus,
+}
+
+_bus = None
+_bus_pid = None
+_bus_lock = threading.Lock()
+
+
+def get_bus():
+    """Return this process's bus, created from the EVENT_BUS config"""
+    global _bus, _bus_pid
+    pid = os.getpid()
+    if _bus_pid != pid:
+        with _bus_lock:
+            if _bus_pid != pid:
+                app = current_app._get_current_object()
+                _bus = BACKENDS[app.config['EVENT_BUS']](app)
+                _bus_pid = pid
+    return _bus
+
+
+def emit(event_type, data, event_id=None):
+    """Queue an event to be published when the current transaction commits"""
+    db.session.info.setdefault(PENDING_KEY, []).append({'type': event_type, 'id': event_id, 'data': data})
+
+
+def subscribe():
+    return get_bus().subscribe()
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_pending(session):
+    events = session.info.pop(PENDING_KEY, None)
+    if events:
+        try:
+            get_bus().publish(events)
+        except Exception as e:
+            logging.error(f'Error publishing events: {str(e)}')
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session):
+    session.info.pop(PENDING_KEY, None)
+
+
+def format_sse(item):
+    """Serialize an event in text/event-stream format"""
+    lines = []
+    if item.get('id') is not None:
+        lines.append(f"id: {item['id']}")
+    lines.append(f"event: {item['type']}")
+    lines.append(f"data: {json.dumps(item['data'])}")
+    return '\n'.join(lines) + '\n\n'
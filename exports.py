@@ -0,0 +1,138 @@
+import csv
+import io
+from datetime import datetime
+from sqlalchemy import literal, select, union_all
+from app import db
+from models import Booking, BookingArchive, Hall
+import archive
+
+# Rows fetched per round trip. yield_per streams results (a server-side
+# cursor on PostgreSQL), so memory stays flat however many rows match.
+YIELD_PER = 1000
+
+CSV_COLUMNS = ['id', 'hall', 'student_name', 'department', 'purpose', 'booking_date',
+               'start_time', 'end_time', 'status', 'series_id', 'created_at', 'archived']
+
+# Spreadsheet apps run cells starting with these as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _csv_text(value):
+    """Neutralize free text that a spreadsheet would read as a formula"""
+    if value and value.startswith(FORMULA_PREFIXES):
+        return f"'{value}"
+    return value
+
+
+def _history_rows(criteria):
+    """Select bookings from the booking table and its archive matching the
+    admin filters, oldest date first"""
+    selects = []
+    for model in archive.HISTORY_MODELS:
+        stmt = (select(model.id, Hall.name.label('hall'), model.student_name, model.department, model.purpose,
+                       model.booking_date, model.start_time, model.end_time, model.status, model.series_id,
+                       model.created_at, literal('yes' if model is BookingArchive else 'no').label('archived'))
+                .join(Hall, Hall.id == model.hall_id))
+        selects.append(archive.filter_history(stmt, model, criteria))
+    rows = union_all(*selects).subquery()
+    return select(rows).order_by(rows.c.booking_date, rows.c.start_time, rows.c.id)
+
+
+def iter_bookings_csv(criteria):
+    """Yield a CSV export of matching bookings, one chunk per fetched batch"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    yield buffer.getvalue()
+
+    result = db.session.execute(_history_rows(criteria).execution_options(yield_per=YIELD_PER))
+    for partition in result.partitions():
+        buffer.seek(0)
+        buffer.truncate()
+        for row in partition:
+            writer.writerow([
+                row.id, _csv_text(row.hall), _csv_text(row.student_name), _csv_text(row.department),
+                _csv_text(row.purpose), row.booking_date.isoformat(), row.start_time.strftime('%H:%M'),
+                row.end_time.strftime('%H:%M'), row.status, row.series_id or '',
+                row.created_at.strftime('%Y-%m-%d %H:%M:%S') if row.created_at else '', row.archived
+            ])
+        yield buffer.getvalue()
+
+
+def _ical_text(value):
+    """Escape a TEXT value (RFC 5545 section 3.3.11)"""
+    value = value or ''
+    for char, escaped in (('\\', '\\\\'), (';', '\\;'), (',', '\\,'), ('\r\n', '\\n'), ('\n', '\\n')):
+        value = value.replace(char, escaped)
+    return value
+
+
+def _ical_line(line):
+    """Fold a content line at 75 octets and terminate it with CRLF"""
+    parts = []
+    current, size = '', 0
+    for char in line:
+        char_size = len(char.encode('utf-8'))
+        if size + char_size > 75:
+            parts.append(current)
+            # Continuation lines start with a space, which counts
+            current, size = ' ', 1
+        current += char
+        size += char_size
+    parts.append(current)
+    return '\r\n'.join(parts) + '\r\n'
+
+
+def calendar_etag(hall, since):
+    """Return the ETag of a hall's feed.
+
+    The hall's change_seq moves with every booking change (see
+    sync.touch_halls) and since moves the window daily.
+    """
+    return f'calendar-{hall.id}-{hall.change_seq}-{since.isoformat()}'
+
+
+def iter_hall_calendar(hall, since, host):
+    """Yield an iCalendar feed of a hall's active bookings from since on.
+
+    Past bookings may already be archived, so both tables are read.
+    """
+    yield ''.join(_ical_line(line) for line in [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:-//{host}//Hall Management//EN',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{_ical_text(hall.name)}'
+    ])
+
+    now = datetime.utcnow()
+    for model in (BookingArchive, Booking):
+        result = db.session.execute(
+            select(model.id, model.student_name, model.department, model.purpose,
+                   model.booking_date, model.start_time, model.end_time, model.created_at)
+            .where(model.hall_id == hall.id, model.status == 'active', model.booking_date >= since)
+            .order_by(model.booking_date, model.start_time)
+            .execution_options(yield_per=YIELD_PER)
+        )
+        for partition in result.partitions():
+            chunk = []
+            for row in partition:
+                # Booking times are local wall-clock times, so they are sent
+                # as floating times without a zone
+                day = row.booking_date.strftime('%Y%m%d')
+                chunk.extend([
+                    'BEGIN:VEVENT',
+                    f'UID:booking-{row.id}@{host}',
+                    f'DTSTAMP:{(row.created_at or now).strftime("%Y%m%dT%H%M%SZ")}',
+                    f'DTSTART:{day}T{row.start_time.strftime("%H%M%S")}',
+                    f'DTEND:{day}T{row.end_time.strftime("%H%M%S")}',
+                    f'SUMMARY:{_ical_text(f"{row.department} - {row.student_name}")}',
+                    f'DESCRIPTION:{_ical_text(row.purpose)}',
+                    f'LOCATION:{_ical_text(f"{hall.name}, {hall.location}")}',
+                    'STATUS:CONFIRMED',
+                    'END:VEVENT'
+                ])
+            yield ''.join(_ical_line(line) for line in chunk)
+
+    yield _ical_line('END:VCALENDAR')
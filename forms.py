@@ -70,6 +70,21 @@ class BookingForm(FlaskForm):
             if duration > 480:  # More than 8 hours
                 raise ValidationError('Maximum booking duration is 8 hours')
 
+class BookingSeriesForm(BookingForm):
+    """Form for booking a hall on the same weekday and time every N weeks"""
+    until_date = DateField('Repeat Until', validators=[
+        DataRequired(message='Repeat until date is required')
+    ])
+    interval_weeks = IntegerField('Repeat Every (weeks)', default=1, validators=[
+        DataRequired(message='Repeat interval is required'),
+        NumberRange(min=1, max=4, message='Repeat interval must be between 1 and 4 weeks')
+    ])
+
+    def validate_until_date(self, field):
+        """Validate that the series ends on or after its first date"""
+        if self.booking_date.data and field.data < self.booking_date.data:
+            raise ValidationError('Repeat until date cannot be before the booking date')
+
 class SettingsForm(FlaskForm):
     """Form for application settings"""
     college_name = StringField('College Name', validators=[
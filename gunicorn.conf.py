@@ -0,0 +1,7 @@
+# gunicorn loads this file before the app. With --preload the app is
+# imported in the master, ahead of the gevent worker's own monkey-patching,
+# so patch here: locks and events created at import time (outbox, metrics,
+# events) must be gevent-aware in the forked workers.
+from gevent import monkey
+
+monkey.patch_all()
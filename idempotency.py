@@ -0,0 +1,108 @@
+import hashlib
+import itertools
+import json
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import current_app, g, jsonify, request
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from app import db
+from models import IdempotencyKey
+
+# API write endpoints accept an Idempotency-Key header. A request claims its
+# key by inserting a pending row before doing anything else, and fills in
+# its response in the same transaction as its changes. A concurrent request
+# with the same key blocks on that row: if the first one commits, it gets
+# the stored response back without touching the booking tables; if the
+# first one rolls back, it goes ahead itself. Keys expire after
+# IDEMPOTENCY_KEY_TTL hours; expired rows are pruned every PRUNE_EVERY
+# claims, which bounds the table to the keys seen in one TTL.
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+PRUNE_EVERY = 100
+
+_claims = itertools.count(1)
+
+
+def _fingerprint():
+    digest = hashlib.sha256(f'{request.method} {request.path}\n'.encode())
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def _replay(stored, fingerprint):
+    if stored.fingerprint != fingerprint:
+        return jsonify({'error': f'{HEADER} was already used for a different request'}), 422
+    if stored.status_code is None:
+        return jsonify({'error': f'The first request with this {HEADER} did not finish'}), 409
+    response = current_app.response_class(stored.body, status=stored.status_code, mimetype='application/json')
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _lookup(key):
+    ttl = timedelta(hours=current_app.config['IDEMPOTENCY_KEY_TTL'])
+    stored = db.session.get(IdempotencyKey, key)
+    if stored is not None and stored.created_at < datetime.utcnow() - ttl:
+        return None
+    return stored
+
+
+def _claim(key, fingerprint):
+    """Insert a pending row for key, waiting for any concurrent claim of it.
+
+    Raises IntegrityError if another request with the key has committed.
+    """
+    cutoff = datetime.utcnow() - timedelta(hours=current_app.config['IDEMPOTENCY_KEY_TTL'])
+    if next(_claims) % PRUNE_EVERY == 0:
+        db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.created_at < cutoff))
+    else:
+        # An expired row for this key may still be there
+        db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key, IdempotencyKey.created_at < cutoff))
+    claim = IdempotencyKey(key=key, fingerprint=fingerprint)
+    db.session.add(claim)
+    db.session.flush()
+    return claim
+
+
+def idempotent(view):
+    """Replay the stored response when a request repeats an Idempotency-Key"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'{HEADER} cannot exceed {MAX_KEY_LENGTH} characters'}), 400
+
+        fingerprint = _fingerprint()
+        stored = _lookup(key)
+        if stored is not None:
+            return _replay(stored, fingerprint)
+
+        try:
+            g.idempotency = _claim(key, fingerprint)
+        except IntegrityError:
+            # A concurrent request with the same key committed first; its
+            # transaction made the changes, so answer with its response
+            db.session.rollback()
+            stored = _lookup(key)
+            if stored is None:
+                raise
+            return _replay(stored, fingerprint)
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def remember(payload, status_code):
+    """Store the response of the current request under its Idempotency-Key.
+
+    Call this before committing, so the response is stored if and only if
+    the changes are. Does nothing for requests without the header.
+    """
+    claim = g.get('idempotency')
+    if claim is None:
+        return
+    claim.status_code = status_code
+    claim.body = json.dumps(payload)
@@ -0,0 +1,286 @@
+import bisect
+import csv
+import logging
+from datetime import date
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import insert, select
+from werkzeug.datastructures import MultiDict
+from app import db
+from availability import to_minutes
+from forms import BookingForm, HallForm
+from models import Booking, BookingArchive, Hall
+import analytics
+import booking_service
+import sync
+
+# Rows written per transaction, and names or ids per IN (...) lookup
+CHUNK_SIZE = 1000
+
+HALL_COLUMNS = ['name', 'capacity', 'location', 'description']
+BOOKING_COLUMNS = ['hall', 'student_name', 'department', 'purpose', 'booking_date', 'start_time', 'end_time', 'status']
+
+
+class ImportBookingForm(BookingForm):
+    """BookingForm rules, except that historic (past) dates are allowed"""
+
+    class Meta:
+        csrf = False
+
+    def validate_booking_date(self, field):
+        pass
+
+
+class ImportHallForm(HallForm):
+    """HallForm rules for one imported row"""
+
+    class Meta:
+        csrf = False
+
+
+class ImportReport:
+    """Rows written and rows rejected, with reasons, for one import"""
+
+    def __init__(self):
+        self.imported = 0
+        self.errors = []  # (line number, message)
+
+    def reject(self, line, message):
+        self.errors.append((line, message))
+
+    def echo(self, kind, dry_run=False):
+        click.echo(f'{"Would import" if dry_run else "Imported"} {self.imported} {kind}.')
+        if self.errors:
+            click.echo(f'Rejected {len(self.errors)} rows:')
+            for line, message in sorted(self.errors):
+                click.echo(f'  line {line}: {message}')
+
+
+def _chunks(items, size=CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _read_rows(stream, columns, required):
+    """Yield (line number, MultiDict) for each CSV record, header first checked"""
+    reader = csv.DictReader(stream)
+    missing = [column for column in required if column not in (reader.fieldnames or [])]
+    if missing:
+        raise click.ClickException(f'Missing columns: {", ".join(missing)}')
+    for record in reader:
+        values = {column: (record.get(column) or '').strip() for column in columns}
+        yield reader.line_num, MultiDict(values)
+
+
+def _validate(form, line, formdata, report):
+    """Run form's validators on one row; returns False after reporting errors"""
+    form.process(formdata)
+    if form.validate():
+        return True
+    report.reject(line, '; '.join(
+        f'{name}: {message}' for name, messages in form.errors.items() for message in messages
+    ))
+    return False
+
+
+def _existing_names(names):
+    """Return which of names already belong to halls, with one query per chunk"""
+    existing = set()
+    for chunk in _chunks(sorted(names)):
+        existing.update(db.session.execute(select(Hall.name).where(Hall.name.in_(chunk))).scalars())
+    return existing
+
+
+def import_halls(stream, dry_run=False):
+    """Validate a CSV of halls in one pass, then insert the valid rows"""
+    report = ImportReport()
+    form = ImportHallForm()
+    rows, lines = [], {}
+    for line, formdata in _read_rows(stream, HALL_COLUMNS, ['name', 'capacity', 'location']):
+        if not _validate(form, line, formdata, report):
+            continue
+        if form.name.data in lines:
+            report.reject(line, f'name: Duplicate of line {lines[form.name.data]}')
+            continue
+        lines[form.name.data] = line
+        rows.append({
+            'name': form.name.data,
+            'capacity': form.capacity.data,
+            'location': form.location.data,
+            'description': form.description.data or None,
+            'is_available': True
+        })
+
+    taken = _existing_names(lines)
+    for row in rows:
+        if row['name'] in taken:
+            report.reject(lines[row['name']], 'name: A hall with this name already exists')
+    rows = [row for row in rows if row['name'] not in taken]
+
+    if dry_run:
+        report.imported = len(rows)
+        return report
+    for chunk in _chunks(rows):
+        hall_ids = db.session.execute(insert(Hall).returning(Hall.id), chunk).scalars().all()
+        sync.touch_halls(hall_ids)
+        db.session.commit()
+        report.imported += len(chunk)
+    return report
+
+
+def _find_overlaps(rows, existing):
+    """Split rows into those that fit and those that overlap.
+
+    rows and existing are dicts with hall_id, booking_date and start/end
+    minutes. existing holds active bookings already stored, which never
+    overlap each other. Each row is checked against them and against the
+    rows accepted before it, per hall and day.
+    """
+    taken = {}
+    for booking in existing:
+        taken.setdefault((booking['hall_id'], booking['booking_date']), []).append((booking['start'], booking['end']))
+    for intervals in taken.values():
+        intervals.sort()
+
+    accepted, overlapping = [], []
+    for row in sorted(rows, key=lambda row: (row['hall_id'], row['booking_date'], row['start'])):
+        if row['status'] != 'active':
+            accepted.append(row)
+            continue
+        intervals = taken.setdefault((row['hall_id'], row['booking_date']), [])
+        # Only the last interval starting before this row ends can overlap it
+        index = bisect.bisect_left(intervals, (row['end'],))
+        if index and intervals[index - 1][1] > row['start']:
+            overlapping.append(row)
+            continue
+        intervals.insert(index, (row['start'], row['end']))
+        accepted.append(row)
+    return accepted, overlapping
+
+
+def _stored_bookings(rows):
+    """Return the stored active bookings on the halls and days of rows.
+
+    Past days may already be archived, so both tables are read.
+    """
+    keys = {(row['hall_id'], row['booking_date']) for row in rows}
+    hall_ids = sorted({hall_id for hall_id, _ in keys})
+    dates = sorted({booking_date for _, booking_date in keys})
+    existing = []
+    for model in (Booking, BookingArchive):
+        result = db.session.execute(
+            select(model.hall_id, model.booking_date, model.start_time, model.end_time)
+            .where(model.hall_id.in_(hall_ids), model.booking_date.in_(dates), model.status == 'active')
+        )
+        existing.extend(
+            {'hall_id': hall_id, 'booking_date': booking_date,
+             'start': to_minutes(start_time), 'end': to_minutes(end_time)}
+            for hall_id, booking_date, start_time, end_time in result
+            if (hall_id, booking_date) in keys
+        )
+    return existing
+
+
+def import_bookings(stream, dry_run=False):
+    """Validate a CSV of bookings in one pass, then insert the valid rows.
+
+    Rows name their hall in the 'hall' column. Rows overlapping another
+    row of the file or a stored active booking are rejected.
+    """
+    report = ImportReport()
+    form = ImportBookingForm()
+    parsed = []
+    for line, formdata in _read_rows(stream, BOOKING_COLUMNS, BOOKING_COLUMNS[:-1]):
+        if not _validate(form, line, formdata, report):
+            continue
+        status = formdata['status'] or 'active'
+        if status not in ('active', 'cancelled'):
+            report.reject(line, 'status: Must be active or cancelled')
+            continue
+        parsed.append((line, formdata['hall'], {
+            'student_name': form.student_name.data,
+            'department': form.department.data,
+            'purpose': form.purpose.data,
+            'booking_date': form.booking_date.data,
+            'start_time': form.start_time.data,
+            'end_time': form.end_time.data,
+            'status': status,
+            'start': to_minutes(form.start_time.data),
+            'end': to_minutes(form.end_time.data),
+            'line': line
+        }))
+
+    hall_ids = {}
+    for chunk in _chunks(sorted({hall for _, hall, _ in parsed})):
+        hall_ids.update(db.session.execute(select(Hall.name, Hall.id).where(Hall.name.in_(chunk))).all())
+    rows = []
+    for line, hall, row in parsed:
+        if hall not in hall_ids:
+            report.reject(line, f'hall: No hall named "{hall}"')
+            continue
+        row['hall_id'] = hall_ids[hall]
+        rows.append(row)
+
+    rows, overlapping = _find_overlaps(rows, [])
+    for row in overlapping:
+        report.reject(row['line'], 'Overlaps another booking in the file')
+
+    # Rows are sorted by hall and day, so a chunk touches few hall/days.
+    # Each chunk locks its upcoming hall/days like a live booking would,
+    # then checks stored bookings, so it cannot race booking requests.
+    today = date.today()
+    for chunk in _chunks(rows):
+        upcoming = {}
+        for row in chunk:
+            if not dry_run and row['status'] == 'active' and row['booking_date'] >= today:
+                upcoming.setdefault(row['hall_id'], set()).add(row['booking_date'])
+        for hall_id, dates in sorted(upcoming.items()):
+            booking_service.lock_hall_days(hall_id, dates)
+
+        chunk, overlapping = _find_overlaps(chunk, _stored_bookings(chunk))
+        for row in overlapping:
+            report.reject(row['line'], 'Overlaps an existing booking')
+        if dry_run or not chunk:
+            db.session.rollback()
+            report.imported += len(chunk)
+            continue
+
+        db.session.execute(Booking.__table__.insert(), [
+            {key: row[key] for key in BOOKING_COLUMNS[1:] + ['hall_id']}
+            for row in chunk
+        ])
+        analytics.record_slots([
+            (row['hall_id'], row['department'], row['booking_date'], row['start_time'], row['end_time'])
+            for row in chunk if row['status'] == 'active'
+        ])
+        sync.touch_halls({row['hall_id'] for row in chunk})
+        db.session.commit()
+        report.imported += len(chunk)
+    return report
+
+
+IMPORTERS = {
+    'halls': import_halls,
+    'bookings': import_bookings,
+}
+
+
+@click.command('import')
+@click.argument('kind', type=click.Choice(sorted(IMPORTERS)))
+@click.argument('path', type=click.File('r', encoding='utf-8-sig'))
+@click.option('--dry-run', is_flag=True, help='Validate the file without writing anything.')
+@with_appcontext
+def import_command(kind, path, dry_run):
+    """Import halls or bookings from a CSV file.
+
+    Halls need name, capacity and location columns (description is
+    optional). Bookings need hall (the hall name), student_name,
+    department, purpose, booking_date (YYYY-MM-DD), start_time and end_time
+    (HH:MM); status (active or cancelled) is optional. Invalid rows are
+    skipped and listed at the end.
+    """
+    report = IMPORTERS[kind](path, dry_run=dry_run)
+    report.echo(kind, dry_run)
+    logging.info(f'Import of {kind} from {path.name}: {report.imported} imported, {len(report.errors)} rejected')
+    if report.errors:
+        raise click.exceptions.Exit(1)
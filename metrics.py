@@ -0,0 +1,248 @@
+import bisect
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import cache
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+CACHE_RESULTS = {'hits': 'hit', 'misses': 'miss'}
+
+# name -> (type, help text, histogram buckets)
+METRICS = {
+    'http_request_duration_seconds': ('histogram', 'Request latency by endpoint', LATENCY_BUCKETS),
+    'http_request_db_queries': ('histogram', 'SQL statements issued per request', QUERY_COUNT_BUCKETS),
+    'http_request_db_seconds': ('histogram', 'Time spent in SQL per request', LATENCY_BUCKETS),
+    'db_queries_total': ('counter', 'SQL statements executed', None),
+    'db_query_seconds_total': ('counter', 'Time spent executing SQL', None),
+    'db_slow_queries_total': ('counter', 'SQL statements slower than SLOW_QUERY_THRESHOLD', None),
+    'db_query_errors_total': ('counter', 'SQL statements that raised an error', None),
+    'smtp_send_seconds': ('histogram', 'Time to send one email over SMTP', LATENCY_BUCKETS),
+    'smtp_messages_total': ('counter', 'Emails handed to SMTP by result', None),
+    'cache_requests_total': ('counter', 'Cache lookups by cache and result', None),
+}
+
+
+class Registry:
+    """Process-local counters and histograms keyed by metric name and labels"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def inc(self, name, labels=(), amount=1):
+        key = (name, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def observe(self, name, value, labels=()):
+        buckets = METRICS[name][2]
+        key = (name, labels)
+        index = bisect.bisect_left(buckets, value)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = {'buckets': [0] * (len(buckets) + 1), 'sum': 0.0, 'count': 0}
+            entry['buckets'][index] += 1
+            entry['sum'] += value
+            entry['count'] += 1
+
+    def snapshot(self):
+        """Return a JSON-serializable copy of every value"""
+        with self.lock:
+            items = [
+                [name, list(labels), dict(value, buckets=list(value['buckets'])) if isinstance(value, dict) else value]
+                for (name, labels), value in self.values.items()
+            ]
+        # Cache counters are kept by the cache module itself, as
+        # '<cache>_hits' and '<cache>_misses'
+        for key, value in cache.stats.items():
+            cache_name, result = key.rsplit('_', 1)
+            items.append(['cache_requests_total', [['cache', cache_name], ['result', CACHE_RESULTS[result]]], value])
+        return items
+
+
+registry = Registry()
+_request_stats = threading.local()
+
+
+def _labels(**labels):
+    return tuple(sorted(labels.items()))
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start_time'].pop()
+    registry.inc('db_queries_total')
+    registry.inc('db_query_seconds_total', amount=elapsed)
+    if getattr(_request_stats, 'active', False):
+        _request_stats.queries += 1
+        _request_stats.db_seconds += elapsed
+    threshold = current_app.config['SLOW_QUERY_THRESHOLD'] if has_app_context() else None
+    if threshold and elapsed >= threshold:
+        registry.inc('db_slow_queries_total')
+        logging.warning(f'Slow query ({elapsed * 1000:.1f} ms): {" ".join(statement.split())[:500]}')
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    # after_cursor_execute does not run for a failed statement, so its
+    # start time is dropped here rather than left on the connection
+    if context.execution_context is None or context.connection is None:
+        return
+    started = context.connection.info.get('query_start_time')
+    if started:
+        started.pop()
+        registry.inc('db_query_errors_total')
+
+
+def _start_request_metrics():
+    start_flusher(current_app.config)
+    g._metrics_start = time.perf_counter()
+    _request_stats.active = True
+    _request_stats.queries = 0
+    _request_stats.db_seconds = 0.0
+
+
+def _record_request_metrics(response):
+    start = g.pop('_metrics_start', None)
+    if start is not None:
+        labels = _labels(endpoint=request.endpoint or 'unknown', method=request.method, status=str(response.status_code))
+        endpoint_labels = _labels(endpoint=request.endpoint or 'unknown')
+        registry.observe('http_request_duration_seconds', time.perf_counter() - start, labels)
+        registry.observe('http_request_db_queries', _request_stats.queries, endpoint_labels)
+        registry.observe('http_request_db_seconds', _request_stats.db_seconds, endpoint_labels)
+    _request_stats.active = False
+    return response
+
+
+def init_app(app):
+    """Time every request of app"""
+    app.before_request(_start_request_metrics)
+    app.after_request(_record_request_metrics)
+
+
+def observe_smtp_send(seconds, result):
+    """Record one SMTP send attempt"""
+    registry.observe('smtp_send_seconds', seconds)
+    registry.inc('smtp_messages_total', _labels(result=result))
+
+
+# Cross-worker aggregation: each process dumps its snapshot into METRICS_DIR
+# and the worker answering /metrics sums every file it finds there
+
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+
+
+def _snapshot_path(directory):
+    return os.path.join(directory, f'metrics-{os.getpid()}.json')
+
+
+def write_snapshot(config):
+    directory = config['METRICS_DIR']
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    path = _snapshot_path(directory)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(registry.snapshot(), f)
+    os.replace(tmp_path, path)
+
+
+def _flush_loop(config):
+    while True:
+        time.sleep(config['METRICS_FLUSH_INTERVAL'])
+        try:
+            write_snapshot(config)
+        except Exception as e:
+            logging.error(f'Error writing metrics snapshot: {str(e)}')
+
+
+def start_flusher(config):
+    """Start the snapshot writer thread for this process, once"""
+    global _flusher_pid
+    pid = os.getpid()
+    if _flusher_pid == pid or not config['METRICS_DIR']:
+        return
+    with _flusher_lock:
+        if _flusher_pid != pid:
+            threading.Thread(target=_flush_loop, args=(config,), name='metrics-flusher', daemon=True).start()
+            _flusher_pid = pid
+
+
+def _merge(totals, items):
+    for name, labels, value in items:
+        key = (name, tuple(tuple(label) for label in labels))
+        if isinstance(value, dict):
+            entry = totals.setdefault(key, {'buckets': [0] * len(value['buckets']), 'sum': 0.0, 'count': 0})
+            entry['buckets'] = [a + b for a, b in zip(entry['buckets'], value['buckets'])]
+            entry['sum'] += value['sum']
+            entry['count'] += value['count']
+        else:
+            totals[key] = totals.get(key, 0) + value
+
+
+def collect():
+    """Return metric values summed over every worker"""
+    totals = {}
+    directory = current_app.config['METRICS_DIR']
+    if not directory:
+        _merge(totals, registry.snapshot())
+        return totals
+    write_snapshot(current_app.config)
+    for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+        try:
+            with open(path) as f:
+                _merge(totals, json.load(f))
+        except (OSError, ValueError) as e:
+            logging.warning(f'Skipping metrics snapshot {path}: {str(e)}')
+    return totals
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=None):
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def render_prometheus():
+    """Render all metrics in the Prometheus text exposition format"""
+    totals = collect()
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        series = sorted(
+            ((labels, value) for (metric, labels), value in totals.items() if metric == name),
+            key=lambda item: item[0]
+        )
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in series:
+            if kind == 'histogram':
+                cumulative = 0
+                for bound, count in zip(list(buckets) + ['+Inf'], value['buckets']):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_format_labels(labels, ("le", bound))} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {value["sum"]}')
+                lines.append(f'{name}_count{_format_labels(labels)} {value["count"]}')
+            else:
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,202 @@
+import logging
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import inspect, select, text
+from app import db
+
+# db.create_all() creates missing tables but never changes tables that
+# already exist. Each step below brings one existing table up to date with
+# the models: it checks whether its change is still needed before making
+# it, so 'flask migrate-db' can run on every deploy and on any older
+# schema. Steps run in order, after create_all, in one transaction.
+
+MIGRATIONS = []
+
+
+def migration(step):
+    """Register step, which returns True if it changed the schema"""
+    MIGRATIONS.append(step)
+    return step
+
+
+def _inspector():
+    return inspect(db.session.connection())
+
+
+def _dialect():
+    return db.session.get_bind().dialect
+
+
+def has_table(table):
+    return _inspector().has_table(table)
+
+
+def has_column(table, name):
+    return name in {column['name'] for column in _inspector().get_columns(table)}
+
+
+def add_column(model, name, default=None):
+    """Add model's column name to its existing table.
+
+    A NOT NULL column needs default, which fills the existing rows.
+    """
+    column = model.__table__.c[name]
+    ddl = f'ALTER TABLE {model.__tablename__} ADD COLUMN {name} {column.type.compile(_dialect())}'
+    if default is not None:
+        ddl += f' DEFAULT {default}'
+    if not column.nullable:
+        ddl += ' NOT NULL'
+    for foreign_key in column.foreign_keys:
+        ddl += f' REFERENCES {foreign_key.column.table.name} ({foreign_key.column.name})'
+    db.session.execute(text(ddl))
+
+
+def create_indexes(table):
+    """Create the indexes declared on table that the database lacks.
+
+    Returns True if any was created.
+    """
+    existing = {index['name'] for index in _inspector().get_indexes(table.name)}
+    missing = [index for index in table.indexes if index.name not in existing]
+    for index in missing:
+        index.create(db.session.connection())
+    return bool(missing)
+
+
+def widen_to_bigint(model, name):
+    """Change an INTEGER column to BIGINT; SQLite integers are 64-bit already"""
+    if _dialect().name != 'postgresql':
+        return False
+    column = next(column for column in _inspector().get_columns(model.__tablename__) if column['name'] == name)
+    if column['type'].compile(_dialect()) == 'BIGINT':
+        return False
+    db.session.execute(text(f'ALTER TABLE {model.__tablename__} ALTER COLUMN {name} TYPE BIGINT'))
+    return True
+
+
+@migration
+def hall_change_seq():
+    """Add Hall.change_seq and stamp the existing halls"""
+    from models import Hall, HallTombstone
+    import sync
+    changed = widen_to_bigint(HallTombstone, 'change_seq')
+    if has_column('hall', 'change_seq'):
+        changed = widen_to_bigint(Hall, 'change_seq') or changed
+    else:
+        add_column(Hall, 'change_seq', default=0)
+        # Through touch_halls, so the stamps and the counter agree
+        sync.touch_halls(db.session.execute(select(Hall.id)).scalars().all())
+        changed = True
+    return create_indexes(Hall.__table__) or changed
+
+
+@migration
+def booking_series_id():
+    """Add Booking.series_id, linking bookings to their recurring series"""
+    from models import Booking
+    if has_column('booking', 'series_id'):
+        return False
+    add_column(Booking, 'series_id')
+    index = next(index for index in Booking.__table__.indexes if index.name == 'ix_booking_series_id')
+    index.create(db.session.connection())
+    return True
+
+
+@migration
+def usage_rollups_per_hall():
+    """Key the department and hour rollups by hall, and fill empty rollups.
+
+    The rollups are derived data, so tables of the old shape are dropped,
+    recreated and refilled from the bookings rather than converted. Rollup
+    tables just created for a database that already has bookings are
+    filled too.
+    """
+    from models import Booking, DepartmentDayUsage, HallDayUsage, HourUsage
+    import analytics
+    stale = [model for model in (DepartmentDayUsage, HourUsage) if not has_column(model.__tablename__, 'hall_id')]
+    for model in stale:
+        model.__table__.drop(db.session.connection())
+        model.__table__.create(db.session.connection())
+    unfilled = (db.session.execute(select(HallDayUsage.hall_id).limit(1)).first() is None
+                and db.session.execute(select(Booking.id).where(Booking.status == 'active').limit(1)).first() is not None)
+    if stale or unfilled:
+        analytics.rebuild(commit=False)
+        return True
+    return False
+
+
+@migration
+def booking_search_index():
+    """Create the full-text index of booking tables that predate it"""
+    import search
+    dialect = _dialect().name
+    if dialect == 'sqlite':
+        missing = not all(has_table(f'{table}_fts') for table in ('booking', 'booking_archive'))
+    elif dialect == 'postgresql':
+        missing = not all(has_column(table, 'search_vector') for table in ('booking', 'booking_archive'))
+    else:
+        return False
+    if missing:
+        search.rebuild_search_index(commit=False)
+    return missing
+
+
+@migration
+def pending_idempotency_keys():
+    """Let IdempotencyKey rows be stored without a response while pending"""
+    from models import IdempotencyKey
+    columns = {column['name']: column for column in _inspector().get_columns('idempotency_key')}
+    if columns['status_code']['nullable']:
+        return False
+    if _dialect().name == 'sqlite':
+        # SQLite cannot drop NOT NULL. The stored responses only serve
+        # retries within IDEMPOTENCY_KEY_TTL, so the table is recreated
+        IdempotencyKey.__table__.drop(db.session.connection())
+        IdempotencyKey.__table__.create(db.session.connection())
+    else:
+        db.session.execute(text('ALTER TABLE idempotency_key ALTER COLUMN status_code DROP NOT NULL'))
+        db.session.execute(text('ALTER TABLE idempotency_key ALTER COLUMN body DROP NOT NULL'))
+    return True
+
+
+@migration
+def waitlist_booking_id_without_foreign_key():
+    """Drop the foreign key from WaitlistEntry.booking_id to booking.id,
+    which made archiving promoted bookings fail. SQLite does not enforce
+    it unless foreign keys are switched on, and cannot drop it, so only
+    other backends are changed."""
+    if _dialect().name == 'sqlite':
+        return False
+    names = [foreign_key['name'] for foreign_key in _inspector().get_foreign_keys('waitlist_entry')
+             if foreign_key['referred_table'] == 'booking']
+    for name in names:
+        db.session.execute(text(f'ALTER TABLE waitlist_entry DROP CONSTRAINT {name}'))
+    return bool(names)
+
+
+@migration
+def model_indexes():
+    """Create every index the models declare on tables that predate it,
+    such as ix_booking_conflict on booking. Runs last, after the steps
+    that add or reshape columns."""
+    created = False
+    for table in db.metadata.sorted_tables:
+        created = create_indexes(table) or created
+    return created
+
+
+def migrate():
+    """Create missing tables, then apply every pending migration step"""
+    db.create_all()
+    for step in MIGRATIONS:
+        if step():
+            logging.info(f'Applied migration {step.__name__}')
+    db.session.commit()
+
+
+@click.command('migrate-db')
+@with_appcontext
+def migrate_db_command():
+    """Create missing tables and bring existing ones up to date"""
+    migrate()
+    logging.info('Database schema up to date')
@@ -1,6 +1,6 @@
 from app import db
-from datetime import datetime, date, time
-from sqlalchemy import String, Integer, Text, DateTime, Boolean, Date, Time
+from datetime import datetime, date, time, timedelta
+from sqlalchemy import String, Integer, BigInteger, Text, DateTime, Boolean, Date, Time, DDL, event
 
 class Hall(db.Model):
     """Model for managing college halls"""
@@ -11,9 +11,12 @@ class Hall(db.Model):
     description = db.Column(Text)
     is_available = db.Column(Boolean, default=True, nullable=False)
     created_at = db.Column(DateTime, default=datetime.utcnow)
+    change_seq = db.Column(BigInteger, default=0, nullable=False, index=True)  # See sync.touch_halls
 
-    # Relationship with bookings
-    bookings = db.relationship('Booking', backref='hall', lazy=True, cascade='all, delete-orphan')
+    # Relationship with bookings. passive_deletes keeps a hall delete from
+    # loading its bookings; delete_hall removes them with bulk deletes
+    bookings = db.relationship('Booking', backref='hall', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    series = db.relationship('BookingSeries', backref='hall', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
 
     def __repr__(self):
         return f'<Hall {self.name}>'
@@ -21,7 +24,7 @@ class Hall(db.Model):
 class Booking(db.Model):
     """Model for managing hall bookings with date and time slots"""
     id = db.Column(Integer, primary_key=True)
-    hall_id = db.Column(Integer, db.ForeignKey('hall.id'), nullable=False)
+    hall_id = db.Column(Integer, db.ForeignKey('hall.id', ondelete='CASCADE'), nullable=False)
     student_name = db.Column(String(100), nullable=False)
     department = db.Column(String(100), nullable=False)
     purpose = db.Column(Text, nullable=False)
@@ -30,10 +33,270 @@ class Booking(db.Model):
     end_time = db.Column(Time, nullable=False)
     created_at = db.Column(DateTime, default=datetime.utcnow)
     status = db.Column(String(20), default='active', nullable=False)  # active, cancelled
+    series_id = db.Column(Integer, db.ForeignKey('booking_series.id'), index=True)
+
+    # ix_booking_conflict covers the conflict check in
+    # booking_service.find_conflict; the others serve the admin browser
+    __table_args__ = (
+        db.Index('ix_booking_conflict', 'hall_id', 'booking_date', 'status', 'start_time', 'end_time'),
+        db.Index('ix_booking_date', 'booking_date'),
+        db.Index('ix_booking_department', 'department'),
+        # Never reuse the id of a deleted row: archived rows keep their id
+        {'sqlite_autoincrement': True},
+    )
+
+    is_archived = False
 
     def __repr__(self):
         return f'<Booking {self.student_name}>'
 
+# Full-text index over student_name, department and purpose (see search.py),
+# kept for the booking table and its archive. SQLite keeps an FTS5 table in
+# step with triggers; PostgreSQL uses a generated tsvector column with a GIN
+# index. All statements are idempotent so 'flask rebuild-search' can apply
+# them to an existing database.
+def _search_ddl(table):
+    return {
+        'sqlite': [
+            f"""CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5(
+                student_name, department, purpose, content='{table}', content_rowid='id'
+            )""",
+            f"""CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO {table}_fts(rowid, student_name, department, purpose)
+                VALUES (new.id, new.student_name, new.department, new.purpose);
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN
+                INSERT INTO {table}_fts({table}_fts, rowid, student_name, department, purpose)
+                VALUES ('delete', old.id, old.student_name, old.department, old.purpose);
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF student_name, department, purpose ON {table} BEGIN
+                INSERT INTO {table}_fts({table}_fts, rowid, student_name, department, purpose)
+                VALUES ('delete', old.id, old.student_name, old.department, old.purpose);
+                INSERT INTO {table}_fts(rowid, student_name, department, purpose)
+                VALUES (new.id, new.student_name, new.department, new.purpose);
+            END""",
+        ],
+        'postgresql': [
+            f"""ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector
+                GENERATED ALWAYS AS (
+                    to_tsvector('simple', coalesce(student_name, '') || ' ' || coalesce(department, '') || ' ' || coalesce(purpose, ''))
+                ) STORED""",
+            f"""CREATE INDEX IF NOT EXISTS ix_{table}_search ON {table} USING GIN (search_vector)""",
+        ],
+    }
+
+class BookingArchive(db.Model):
+    """Model for past and cancelled bookings moved out of the booking table.
+
+    Rows keep their original booking id, so ids are unique across both
+    tables (see archive.py).
+    """
+    __tablename__ = 'booking_archive'
+    id = db.Column(Integer, primary_key=True, autoincrement=False)
+    hall_id = db.Column(Integer, db.ForeignKey('hall.id', ondelete='CASCADE'), nullable=False)
+    student_name = db.Column(String(100), nullable=False)
+    department = db.Column(String(100), nullable=False)
+    purpose = db.Column(Text, nullable=False)
+    booking_date = db.Column(Date, nullable=False)
+    start_time = db.Column(Time, nullable=False)
+    end_time = db.Column(Time, nullable=False)
+    created_at = db.Column(DateTime)
+    status = db.Column(String(20), nullable=False)  # active, cancelled
+    series_id = db.Column(Integer, index=True)
+    archived_at = db.Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    hall = db.relationship('Hall')
+
+    __table_args__ = (
+        db.Index('ix_booking_archive_hall_date', 'hall_id', 'booking_date'),
+        db.Index('ix_booking_archive_date', 'booking_date'),
+        db.Index('ix_booking_archive_department', 'department'),
+    )
+
+    is_archived = True
+
+    def __repr__(self):
+        return f'<BookingArchive {self.student_name}>'
+
+SEARCH_DDL = {
+    'booking': _search_ddl('booking'),
+    'booking_archive': _search_ddl('booking_archive'),
+}
+
+for _model in (Booking, BookingArchive):
+    for _dialect, _statements in SEARCH_DDL[_model.__tablename__].items():
+        for _statement in _statements:
+            event.listen(_model.__table__, 'after_create', DDL(_statement).execute_if(dialect=_dialect))
+
+class BookingSeries(db.Model):
+    """Model for recurring bookings, expanded into one Booking per occurrence"""
+    id = db.Column(Integer, primary_key=True)
+    hall_id = db.Column(Integer, db.ForeignKey('hall.id', ondelete='CASCADE'), nullable=False)
+    student_name = db.Column(String(100), nullable=False)
+    department = db.Column(String(100), nullable=False)
+    purpose = db.Column(Text, nullable=False)
+    start_date = db.Column(Date, nullable=False)
+    until_date = db.Column(Date, nullable=False)
+    interval_weeks = db.Column(Integer, default=1, nullable=False)  # Weekly rule: every N weeks
+    start_time = db.Column(Time, nullable=False)
+    end_time = db.Column(Time, nullable=False)
+    created_at = db.Column(DateTime, default=datetime.utcnow)
+    status = db.Column(String(20), default='active', nullable=False)  # active, cancelled
+
+    bookings = db.relationship('Booking', backref='series', lazy='dynamic')
+
+    def occurrence_dates(self):
+        """Return every date matched by the recurrence rule"""
+        dates = []
+        step = timedelta(weeks=self.interval_weeks or 1)
+        current = self.start_date
+        while current <= self.until_date:
+            dates.append(current)
+            current += step
+        return dates
+
+    def __repr__(self):
+        return f'<BookingSeries {self.student_name}>'
+
+class WaitlistEntry(db.Model):
+    """Model for a booking request queued behind a clashing booking.
+
+    Entries are promoted to bookings, oldest first, when a cancellation
+    frees their slot (see booking_service.promote_waitlist).
+    """
+    id = db.Column(Integer, primary_key=True)
+    hall_id = db.Column(Integer, db.ForeignKey('hall.id', ondelete='CASCADE'), nullable=False)
+    student_name = db.Column(String(100), nullable=False)
+    department = db.Column(String(100), nullable=False)
+    purpose = db.Column(Text, nullable=False)
+    booking_date = db.Column(Date, nullable=False)
+    start_time = db.Column(Time, nullable=False)
+    end_time = db.Column(Time, nullable=False)
+    created_at = db.Column(DateTime, default=datetime.utcnow, nullable=False)
+    status = db.Column(String(20), default='waiting', nullable=False)  # waiting, promoted
+    # Set on promotion. Not a foreign key: the booking may since have been
+    # moved to booking_archive
+    booking_id = db.Column(Integer)
+
+    hall = db.relationship('Hall')
+
+    # Covers the promotion lookup: waiting entries of one hall and day
+    # overlapping the freed slot
+    __table_args__ = (
+        db.Index('ix_waitlist_slot', 'hall_id', 'booking_date', 'status', 'start_time', 'end_time'),
+    )
+
+    def __repr__(self):
+        return f'<WaitlistEntry {self.student_name}>'
+
+class HallDayLock(db.Model):
+    """Lock row serializing bookings for one hall on one day"""
+    hall_id = db.Column(Integer, db.ForeignKey('hall.id', ondelete='CASCADE'), primary_key=True)
+    booking_date = db.Column(Date, primary_key=True)
+    version = db.Column(Integer, default=1, nullable=False)
+
+    def __repr__(self):
+        return f'<HallDayLock {self.hall_id} {self.booking_date}>'
+
+class HallDayUsage(db.Model):
+    """Rollup of active booked minutes per hall per day (see analytics.py)"""
+    hall_id = db.Column(Integer, db.ForeignKey('hall.id', ondelete='CASCADE'), primary_key=True)
+    usage_date = db.Column(Date, primary_key=True)
+    booked_minutes = db.Column(Integer, default=0, nullable=False)
+    booking_count = db.Column(Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_hall_day_usage_date', 'usage_date'),
+    )
+
+    def __repr__(self):
+        return f'<HallDayUsage {self.hall_id} {self.usage_date}>'
+
+class DepartmentDayUsage(db.Model):
+    """Rollup of active booked minutes per hall per department per day.
+
+    Keyed by hall so that a booking only writes rows of its own hall.
+    """
+    hall_id = db.Column(Integer, db.ForeignKey('hall.id', ondelete='CASCADE'), primary_key=True)
+    department = db.Column(String(100), primary_key=True)
+    usage_date = db.Column(Date, primary_key=True)
+    booked_minutes = db.Column(Integer, default=0, nullable=False)
+    booking_count = db.Column(Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_department_day_usage_date', 'usage_date'),
+    )
+
+    def __repr__(self):
+        return f'<DepartmentDayUsage {self.hall_id} {self.department} {self.usage_date}>'
+
+class HourUsage(db.Model):
+    """Rollup of active booked minutes per hall per hour of each day"""
+    hall_id = db.Column(Integer, db.ForeignKey('hall.id', ondelete='CASCADE'), primary_key=True)
+    usage_date = db.Column(Date, primary_key=True)
+    hour = db.Column(Integer, primary_key=True)  # 0-23
+    booked_minutes = db.Column(Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_hour_usage_date', 'usage_date'),
+    )
+
+    def __repr__(self):
+        return f'<HourUsage {self.hall_id} {self.usage_date} {self.hour}>'
+
+class EmailOutbox(db.Model):
+    """Model for queued outgoing emails, delivered by the outbox workers"""
+    id = db.Column(Integer, primary_key=True)
+    subject = db.Column(String(300), nullable=False)
+    recipients = db.Column(Text, nullable=False)  # Comma-separated email addresses
+    body = db.Column(Text, nullable=False)
+    status = db.Column(String(20), default='pending', nullable=False)  # pending, sending, sent, failed
+    attempts = db.Column(Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(DateTime, default=datetime.utcnow, nullable=False)
+    claim_token = db.Column(String(32))
+    last_error = db.Column(Text)
+    created_at = db.Column(DateTime, default=datetime.utcnow)
+    sent_at = db.Column(DateTime)
+
+    __table_args__ = (
+        db.Index('ix_email_outbox_due', 'status', 'next_attempt_at'),
+    )
+
+    @property
+    def recipient_list(self):
+        """Return list of recipient emails"""
+        return [email.strip() for email in self.recipients.split(',') if email.strip()]
+
+    def __repr__(self):
+        return f'<EmailOutbox {self.id} {self.status}>'
+
+class ChangeCounter(db.Model):
+    """Model for named counters that grow on every committed change"""
+    name = db.Column(String(50), primary_key=True)
+    value = db.Column(Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f'<ChangeCounter {self.name}={self.value}>'
+
+class HallTombstone(db.Model):
+    """Model recording deleted halls so delta syncs can report them"""
+    hall_id = db.Column(Integer, primary_key=True)
+    change_seq = db.Column(BigInteger, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<HallTombstone {self.hall_id}>'
+
+class IdempotencyKey(db.Model):
+    """Model recording API responses by Idempotency-Key so retries are replayed"""
+    key = db.Column(String(255), primary_key=True)
+    fingerprint = db.Column(String(64), nullable=False)  # SHA-256 of method, path and body
+    status_code = db.Column(Integer)  # None while the first request is pending
+    body = db.Column(Text)
+    created_at = db.Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<IdempotencyKey {self.key}>'
+
 class Settings(db.Model):
     """Model for storing application settings"""
     id = db.Column(Integer, primary_key=True)
@@ -46,10 +309,15 @@ class Settings(db.Model):
 
     @property
     def email_list(self):
-        """Return list of admin emails"""
-        if self.admin_emails:
-            return [email.strip() for email in self.admin_emails.split(',')]
-        return []
+        """Return list of admin emails, parsed once per admin_emails value"""
+        cached = self.__dict__.get('_email_list_cache')
+        if cached is None or cached[0] != self.admin_emails:
+            emails = []
+            if self.admin_emails:
+                emails = [email.strip() for email in self.admin_emails.split(',')]
+            cached = (self.admin_emails, emails)
+            self.__dict__['_email_list_cache'] = cached
+        return list(cached[1])
 
     def __repr__(self):
         return f'<Settings {self.college_name}>'
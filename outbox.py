@@ -0,0 +1,179 @@
+import logging
+import os
+import smtplib
+import threading
+import time
+from datetime import datetime, timedelta
+from uuid import uuid4
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from flask_mail import Message
+from sqlalchemy import select, update
+from app import db, mail
+from models import EmailOutbox
+import metrics
+
+# Statuses a message can be claimed from; 'sending' rows whose lease has
+# expired belong to a worker that died mid-batch and are picked up again
+CLAIMABLE_STATUSES = ('pending', 'sending')
+
+_wakeup = threading.Event()
+_workers = []
+_workers_pid = None
+_workers_lock = threading.Lock()
+
+
+def queue_email(subject, recipients, body):
+    """Add an email to the outbox in the current transaction"""
+    message = EmailOutbox()
+    message.subject = subject
+    message.recipients = ','.join(recipients)
+    message.body = body
+    db.session.add(message)
+    return message
+
+
+def wake_workers():
+    """Tell idle workers that new messages were committed"""
+    _wakeup.set()
+
+
+def claim_batch(batch_size, lease_seconds):
+    """Claim up to batch_size due messages for this worker.
+
+    The claim is a single conditional UPDATE, so two workers (or two
+    processes) racing for the same rows cannot both win them.
+    """
+    now = datetime.utcnow()
+    due = (
+        EmailOutbox.status.in_(CLAIMABLE_STATUSES),
+        EmailOutbox.next_attempt_at <= now,
+    )
+    due_ids = db.session.execute(
+        select(EmailOutbox.id)
+        .where(*due)
+        .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+    if not due_ids:
+        db.session.commit()
+        return []
+
+    token = uuid4().hex
+    db.session.execute(
+        update(EmailOutbox)
+        .where(EmailOutbox.id.in_(due_ids), *due)
+        .values(status='sending', claim_token=token, next_attempt_at=now + timedelta(seconds=lease_seconds)),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.commit()
+    return EmailOutbox.query.filter_by(claim_token=token).order_by(EmailOutbox.id).all()
+
+
+def _mark_sent(message):
+    message.status = 'sent'
+    message.sent_at = datetime.utcnow()
+    message.claim_token = None
+    message.last_error = None
+
+
+def _mark_failed(message, error, config):
+    """Record a failed attempt and schedule a retry with exponential backoff"""
+    message.attempts += 1
+    message.claim_token = None
+    message.last_error = str(error)[:1000]
+    if message.attempts >= config['OUTBOX_MAX_ATTEMPTS']:
+        message.status = 'failed'
+        logging.error(f'Giving up on outbox message {message.id} after {message.attempts} attempts: {error}')
+        return
+    delay = min(config['OUTBOX_RETRY_BASE'] * 2 ** (message.attempts - 1), config['OUTBOX_RETRY_MAX'])
+    message.status = 'pending'
+    message.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+    logging.warning(f'Outbox message {message.id} failed (attempt {message.attempts}), retrying in {delay}s: {error}')
+
+
+def deliver_pending(config):
+    """Drain due outbox messages in batches over one SMTP connection.
+
+    Returns the number of messages sent. A failure on one message only
+    reschedules that message; a failure of the connection itself
+    reschedules everything still claimed and ends the run.
+    """
+    batch = claim_batch(config['OUTBOX_BATCH_SIZE'], config['OUTBOX_LEASE_SECONDS'])
+    if not batch:
+        return 0
+
+    sent = 0
+    unfinished = list(batch)
+    try:
+        with mail.connect() as connection:
+            while batch:
+                unfinished = list(batch)
+                for message in batch:
+                    started = time.perf_counter()
+                    try:
+                        connection.send(Message(
+                            subject=message.subject,
+                            recipients=message.recipient_list,
+                            body=message.body
+                        ))
+                    except (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError):
+                        metrics.observe_smtp_send(time.perf_counter() - started, 'error')
+                        raise
+                    except Exception as e:
+                        metrics.observe_smtp_send(time.perf_counter() - started, 'failed')
+                        _mark_failed(message, e, config)
+                    else:
+                        metrics.observe_smtp_send(time.perf_counter() - started, 'sent')
+                        _mark_sent(message)
+                        sent += 1
+                    unfinished.remove(message)
+                db.session.commit()
+                batch = claim_batch(config['OUTBOX_BATCH_SIZE'], config['OUTBOX_LEASE_SECONDS'])
+            unfinished = []
+    except Exception as e:
+        logging.error(f'Outbox SMTP connection error: {str(e)}')
+        for message in unfinished:
+            _mark_failed(message, e, config)
+        db.session.commit()
+    return sent
+
+
+def _worker_loop(app):
+    while True:
+        try:
+            with app.app_context():
+                while deliver_pending(app.config):
+                    pass
+        except Exception as e:
+            logging.error(f'Outbox worker error: {str(e)}')
+        _wakeup.wait(app.config['OUTBOX_POLL_INTERVAL'])
+        _wakeup.clear()
+
+
+def start_workers(app):
+    """Start the background delivery threads for this process, once"""
+    global _workers_pid
+    pid = os.getpid()
+    if _workers_pid == pid:
+        return
+    with _workers_lock:
+        if _workers_pid == pid:
+            return
+        # Threads do not survive a fork, so a forked worker starts its own
+        _workers.clear()
+        for i in range(app.config['OUTBOX_WORKERS']):
+            worker = threading.Thread(target=_worker_loop, args=(app,), name=f'outbox-worker-{i}', daemon=True)
+            worker.start()
+            _workers.append(worker)
+        _workers_pid = pid
+
+
+@click.command('outbox-worker')
+@with_appcontext
+def outbox_worker_command():
+    """Deliver queued emails in the foreground until interrupted"""
+    logging.info('Outbox worker started')
+    _worker_loop(current_app._get_current_object())
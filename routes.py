@@ -1,46 +1,95 @@
-from flask import render_template, request, redirect, url_for, flash, jsonify
-from flask_mail import Message
-from app import app, db, mail
-from models import Hall, Booking, Settings
-from forms import HallForm, BookingForm, SettingsForm
+from flask import Blueprint, current_app, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context
+from app import db
+from models import Hall, Booking, BookingArchive, BookingSeries, HallDayLock, Settings, WaitlistEntry
+from forms import BookingForm, BookingSeriesForm, SettingsForm
+from booking_service import BookingConflictError, SeriesConflictError
+import analytics
+import archive
+import availability
+import booking_service
+import events
+import exports
+import idempotency
+import metrics
+import outbox
+import sync
+from cache import get_fragment, get_settings, invalidate_settings, set_fragment
+from markupsafe import Markup
+from werkzeug.datastructures import MultiDict
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import joinedload
 from datetime import datetime
 import logging
 
-@app.route('/')
+bp = Blueprint('main', __name__)
+
+def render_hall_cards(halls, today):
+    """Return the dashboard card markup for halls, in the same order.
+
+    Cards are cached per hall, day and change_seq, which every change to a
+    hall or its bookings moves (see sync.touch_halls), so only the cards of
+    changed halls are rendered again.
+    """
+    card_keys = [('hall_card', hall.id, today, hall.change_seq) for hall in halls]
+    cards = [get_fragment(key) for key in card_keys]
+    stale = [hall for hall, card in zip(halls, cards) if card is None]
+    if stale:
+        # Get today's bookings for the stale halls in one query and group them in memory
+        hall_bookings = {}
+        for booking in Booking.query.filter(
+            Booking.hall_id.in_([hall.id for hall in stale]),
+            Booking.booking_date == today,
+            Booking.status == 'active'
+        ).order_by(Booking.hall_id, Booking.start_time):
+            hall_bookings.setdefault(booking.hall_id, []).append(booking)
+        for index, (hall, key) in enumerate(zip(halls, card_keys)):
+            if cards[index] is None:
+                cards[index] = Markup(render_template('hall_card.html', hall=hall,
+                                                      today_bookings=hall_bookings.get(hall.id, [])))
+                set_fragment(key, cards[index])
+    return cards
+
+@bp.route('/')
 def index():
     """Main dashboard showing all halls and their availability"""
     # Check if setup is complete
-    settings = Settings.query.first()
+    settings = get_settings()
     if not settings or not settings.is_setup_complete:
-        return redirect(url_for('setup'))
+        return redirect(url_for('main.setup'))
     
     halls = Hall.query.all()
-    # Get today's bookings for each hall
     from datetime import date
     today = date.today()
-    hall_bookings = {}
-    
-    for hall in halls:
-        today_bookings = Booking.query.filter(
-            Booking.hall_id == hall.id,
+
+    cards = render_hall_cards(halls, today)
+
+    # The summary changes only when a hall or its bookings change, which
+    # moves sync.version
+    stats_key = ('dashboard_stats', today, sync.version())
+    stats = get_fragment(stats_key)
+    if stats is None:
+        today_counts = dict(db.session.query(Booking.hall_id, func.count(Booking.id)).filter(
             Booking.booking_date == today,
             Booking.status == 'active'
-        ).order_by(Booking.start_time).all()
-        hall_bookings[hall.id] = today_bookings
-    
-    # Calculate total bookings for today
-    total_bookings = sum(len(bookings) for bookings in hall_bookings.values())
-    
-    return render_template('dashboard.html', halls=halls, settings=settings, hall_bookings=hall_bookings, today=today, total_bookings=total_bookings)
+        ).group_by(Booking.hall_id).all())
+        stats = Markup(render_template('dashboard_stats.html', total_halls=len(halls),
+                                       available_halls=len(halls) - len(today_counts),
+                                       total_bookings=sum(today_counts.values())))
+        set_fragment(stats_key, stats)
 
-@app.route('/setup', methods=['GET', 'POST'])
+    return render_template('dashboard.html', halls=halls, settings=settings, hall_cards=cards, stats=stats)
+
+@bp.route('/setup', methods=['GET', 'POST'])
 def setup():
     """Initial setup page for admin configuration"""
-    settings = Settings.query.first()
+    settings = get_settings()
     
     if request.method == 'POST':
         form = SettingsForm()
         if form.validate_on_submit():
+            # The cached settings are read-only; load the row to update it
+            settings = Settings.query.first()
             # Create or update settings
             if not settings:
                 settings = Settings()
@@ -53,8 +102,9 @@ def setup():
             
             try:
                 db.session.commit()
+                invalidate_settings()
                 flash('Setup completed successfully!', 'success')
-                return redirect(url_for('admin'))
+                return redirect(url_for('main.admin'))
             except Exception as e:
                 db.session.rollback()
                 flash(f'Error saving settings: {str(e)}', 'danger')
@@ -73,19 +123,113 @@ def setup():
     
     return render_template('setup.html', form=form)
 
-@app.route('/admin')
+@bp.route('/admin')
 def admin():
     """Admin panel for managing halls and settings"""
-    settings = Settings.query.first()
+    settings = get_settings()
     if not settings or not settings.is_setup_complete:
-        return redirect(url_for('setup'))
+        return redirect(url_for('main.setup'))
     
     halls = Hall.query.all()
-    recent_bookings = Booking.query.order_by(Booking.created_at.desc()).limit(10).all()
+    recent_bookings = archive.merge_history(
+        lambda model: model.query.options(joinedload(model.hall)).order_by(model.created_at.desc()),
+        sort_key=lambda booking: booking.created_at or datetime.min,
+        limit=10
+    )
     
     return render_template('admin.html', halls=halls, bookings=recent_bookings, settings=settings)
 
-@app.route('/admin/hall/add', methods=['GET', 'POST'])
+def booking_filters():
+    """Read the admin booking filters from the query string.
+
+    Returns the filters as given, for forms and links, and the same filters
+    with dates parsed for archive.filter_history. Raises ValueError on a
+    malformed date.
+    """
+    from datetime import date
+    filters = {
+        'q': request.args.get('q', '').strip(),
+        'hall_id': request.args.get('hall_id', type=int),
+        'status': request.args.get('status', ''),
+        'department': request.args.get('department', '').strip(),
+        'date_from': request.args.get('date_from', ''),
+        'date_to': request.args.get('date_to', '')
+    }
+    criteria = dict(filters)
+    for key in ('date_from', 'date_to'):
+        criteria[key] = date.fromisoformat(filters[key]) if filters[key] else None
+    return filters, criteria
+
+@bp.route('/admin/bookings')
+def admin_bookings():
+    """Browse, filter and search all bookings with keyset pagination.
+
+    Pages are ordered by newest booking id first; before=<id> and
+    after=<id> move to the next and previous pages.
+    """
+    settings = get_settings()
+    if not settings or not settings.is_setup_complete:
+        return redirect(url_for('main.setup'))
+    
+    try:
+        filters, criteria = booking_filters()
+    except ValueError:
+        flash('Dates must be in YYYY-MM-DD format.', 'danger')
+        return redirect(url_for('main.admin_bookings'))
+    before = request.args.get('before', type=int)
+    after = request.args.get('after', type=int)
+    per_page = max(1, min(request.args.get('per_page', 50, type=int), 200))
+    
+    def build_query(model):
+        # Same filters against the booking table and its archive; ids are
+        # unique across both, so one keyset pages through them together
+        query = archive.filter_history(model.query.options(joinedload(model.hall)), model, criteria)
+        if after:
+            return query.filter(model.id > after).order_by(model.id.asc())
+        if before:
+            query = query.filter(model.id < before)
+        return query.order_by(model.id.desc())
+    
+    # Fetch one extra row to learn whether another page exists
+    bookings = archive.merge_history(build_query, sort_key=lambda booking: booking.id,
+                                     limit=per_page + 1, newest_first=not after)
+    if after:
+        has_newer = len(bookings) > per_page
+        bookings = list(reversed(bookings[:per_page]))
+        has_older = True
+    else:
+        has_older = len(bookings) > per_page
+        bookings = bookings[:per_page]
+        has_newer = bool(before)
+    
+    page_args = {key: value for key, value in filters.items() if value}
+    link_args = dict(page_args, per_page=request.args.get('per_page', type=int))
+    older_url = url_for('main.admin_bookings', before=bookings[-1].id, **link_args) if bookings and has_older else None
+    newer_url = url_for('main.admin_bookings', after=bookings[0].id, **link_args) if bookings and has_newer else None
+    
+    halls = Hall.query.with_entities(Hall.id, Hall.name).order_by(Hall.name).all()
+    
+    return render_template('admin_bookings.html', bookings=bookings, halls=halls, filters=filters,
+                           export_args=page_args, older_url=older_url, newer_url=newer_url, settings=settings)
+
+@bp.route('/admin/export/bookings.csv')
+def export_bookings_csv():
+    """Stream bookings, including archived ones, as CSV.
+
+    Takes the same filters as the booking browser.
+    """
+    from datetime import date
+    try:
+        _, criteria = booking_filters()
+    except ValueError:
+        flash('Dates must be in YYYY-MM-DD format.', 'danger')
+        return redirect(url_for('main.admin_bookings'))
+    
+    return Response(stream_with_context(exports.iter_bookings_csv(criteria)), mimetype='text/csv', headers={
+        'Content-Disposition': f'attachment; filename=bookings-{date.today().isoformat()}.csv'
+    })
+
+@bp.route('/admin/hall/add', methods=['GET', 'POST'])
 def add_hall():
     """Add new hall"""
     if request.method == 'POST':
@@ -98,19 +242,19 @@ def add_hall():
         # Basic validation
         if not name or not capacity or not location:
             flash('All required fields must be filled!', 'danger')
-            return redirect(url_for('admin'))
+            return redirect(url_for('main.admin'))
         
         try:
             capacity = int(capacity)
         except ValueError:
             flash('Capacity must be a valid number!', 'danger')
-            return redirect(url_for('admin'))
+            return redirect(url_for('main.admin'))
         
         # Check if hall name already exists
         existing_hall = Hall.query.filter_by(name=name).first()
         if existing_hall:
             flash('A hall with this name already exists!', 'danger')
-            return redirect(url_for('admin'))
+            return redirect(url_for('main.admin'))
         
         hall = Hall()
         hall.name = name
@@ -120,6 +264,8 @@ def add_hall():
             
         try:
             db.session.add(hall)
+            db.session.flush()
+            sync.touch_halls([hall.id])
             db.session.commit()
             flash(f'Hall "{hall.name}" added successfully!', 'success')
         except Exception as e:
@@ -127,15 +273,23 @@ def add_hall():
             flash(f'Error adding hall: {str(e)}', 'danger')
             logging.error(f'Add hall error: {str(e)}')
     
-    return redirect(url_for('admin'))
+    return redirect(url_for('main.admin'))
 
-@app.route('/admin/hall/<int:hall_id>/delete', methods=['POST'])
+@bp.route('/admin/hall/<int:hall_id>/delete', methods=['POST'])
 def delete_hall(hall_id):
-    """Delete a hall"""
+    """Delete a hall and its booking history.
+
+    Dependent rows go with one bulk delete per table, children first, so
+    no booking is loaded into the session.
+    """
     hall = Hall.query.get_or_404(hall_id)
     
     try:
+        analytics.remove_hall(hall.id)
+        for model in (WaitlistEntry, BookingArchive, Booking, BookingSeries, HallDayLock):
+            model.query.filter_by(hall_id=hall.id).delete(synchronize_session=False)
         db.session.delete(hall)
+        sync.touch_halls([hall.id], deleted=True)
         db.session.commit()
         flash(f'Hall "{hall.name}" deleted successfully!', 'success')
     except Exception as e:
@@ -143,13 +297,13 @@ def delete_hall(hall_id):
         flash(f'Error deleting hall: {str(e)}', 'danger')
         logging.error(f'Delete hall error: {str(e)}')
     
-    return redirect(url_for('admin'))
+    return redirect(url_for('main.admin'))
 
-@app.route('/book/<int:hall_id>', methods=['GET', 'POST'])
+@bp.route('/book/<int:hall_id>', methods=['GET', 'POST'])
 def book_hall(hall_id):
     """Book a specific hall with date and time conflict checking"""
     hall = Hall.query.get_or_404(hall_id)
-    settings = Settings.query.first()
+    settings = get_settings()
     
     if request.method == 'POST':
         form = BookingForm()
@@ -157,54 +311,40 @@ def book_hall(hall_id):
             # Debug: Log the booking attempt
             logging.info(f'Booking attempt: Hall {hall.id}, Date {form.booking_date.data}, Time {form.start_time.data}-{form.end_time.data}')
             
-            # Check for booking conflicts using proper overlap logic
-            conflict_query = db.session.query(Booking).filter(
-                Booking.hall_id == hall.id,
-                Booking.booking_date == form.booking_date.data,
-                Booking.status == 'active',
-                Booking.start_time < form.end_time.data,
-                Booking.end_time > form.start_time.data
-            )
-            
-            existing_booking = conflict_query.first()
-            
-            # Debug: Log conflict check result
-            if existing_booking:
+            try:
+                # Conflict check and insert run under the hall/day lock
+                booking = booking_service.create_booking(
+                    hall.id,
+                    form.student_name.data,
+                    form.department.data,
+                    form.purpose.data,
+                    form.booking_date.data,
+                    form.start_time.data,
+                    form.end_time.data
+                )
+                # Queue the admin notification in the same transaction
+                send_booking_notification(booking)
+                db.session.commit()
+            except BookingConflictError as conflict:
+                existing_booking = conflict.booking
                 logging.info(f'Conflict found: Existing booking {existing_booking.id} from {existing_booking.start_time} to {existing_booking.end_time}')
-            else:
-                logging.info('No conflicts found')
-            
-            if existing_booking:
                 conflict_time = f"{existing_booking.start_time.strftime('%H:%M')} - {existing_booking.end_time.strftime('%H:%M')}"
-                flash(f'This hall is already booked from {conflict_time} by {existing_booking.student_name}. Please choose another time slot.', 'danger')
+                flash(f'This hall is already booked from {conflict_time} by {existing_booking.student_name}. Please choose another time slot or join the waitlist.', 'danger')
+                db.session.rollback()
                 from datetime import date
-                return render_template('booking.html', hall=hall, form=form, settings=settings, today=date.today())
-            
-            # Create new booking
-            booking = Booking()
-            booking.hall_id = hall.id
-            booking.student_name = form.student_name.data
-            booking.department = form.department.data
-            booking.purpose = form.purpose.data
-            booking.booking_date = form.booking_date.data
-            booking.start_time = form.start_time.data
-            booking.end_time = form.end_time.data
-            
-            try:
-                db.session.add(booking)
-                db.session.commit()
-                
-                # Send email notification
-                send_booking_notification(booking)
-                
-                start_time_str = form.start_time.data.strftime("%H:%M") if form.start_time.data else "N/A"
-                end_time_str = form.end_time.data.strftime("%H:%M") if form.end_time.data else "N/A"
-                flash(f'Hall "{hall.name}" booked successfully for {form.booking_date.data} from {start_time_str} to {end_time_str}!', 'success')
-                return redirect(url_for('index'))
+                return render_template('booking.html', hall=hall, form=form, settings=settings, today=date.today(), offer_waitlist=True)
             except Exception as e:
                 db.session.rollback()
                 flash(f'Error booking hall: {str(e)}', 'danger')
                 logging.error(f'Booking error: {str(e)}')
+            else:
+                logging.info(f'Booking {booking.id} created')
+                outbox.wake_workers()
+                
+                start_time_str = form.start_time.data.strftime("%H:%M") if form.start_time.data else "N/A"
+                end_time_str = form.end_time.data.strftime("%H:%M") if form.end_time.data else "N/A"
+                flash(f'Hall "{hall.name}" booked successfully for {form.booking_date.data} from {start_time_str} to {end_time_str}!', 'success')
+                return redirect(url_for('main.index'))
         else:
             # Show form validation errors
             for field, errors in form.errors.items():
@@ -215,45 +355,545 @@ def book_hall(hall_id):
     from datetime import date
     return render_template('booking.html', hall=hall, form=form, settings=settings, today=date.today())
 
-@app.route('/admin/booking/<int:booking_id>/cancel', methods=['POST'])
+@bp.route('/book/<int:hall_id>/waitlist', methods=['POST'])
+def join_waitlist(hall_id):
+    """Queue a clashing booking request until a cancellation frees the slot"""
+    hall = Hall.query.get_or_404(hall_id)
+    settings = get_settings()
+    form = BookingForm()
+    from datetime import date
+
+    if not form.validate_on_submit():
+        for field, errors in form.errors.items():
+            for error in errors:
+                flash(f'{field}: {error}', 'danger')
+        return render_template('booking.html', hall=hall, form=form, settings=settings, today=date.today())
+
+    try:
+        # Under the hall/day lock, so a slot freed meanwhile is booked
+        # directly rather than queued behind nothing
+        booking_service.lock_hall_day(hall.id, form.booking_date.data)
+        if not booking_service.find_conflict(hall.id, form.booking_date.data, form.start_time.data, form.end_time.data):
+            db.session.rollback()
+            flash('This slot is free now. Please confirm the booking.', 'info')
+            return render_template('booking.html', hall=hall, form=form, settings=settings, today=date.today())
+        entry = booking_service.join_waitlist(
+            hall.id,
+            form.student_name.data,
+            form.department.data,
+            form.purpose.data,
+            form.booking_date.data,
+            form.start_time.data,
+            form.end_time.data
+        )
+        position = booking_service.waitlist_position(entry)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error joining the waitlist: {str(e)}', 'danger')
+        logging.error(f'Waitlist error: {str(e)}')
+        return render_template('booking.html', hall=hall, form=form, settings=settings, today=date.today())
+
+    logging.info(f'Waitlist entry {entry.id} created for hall {hall.id}')
+    flash(f'You are number {position} on the waitlist for "{hall.name}" on {form.booking_date.data}. '
+          f'The booking is made automatically if the slot is cancelled.', 'success')
+    return redirect(url_for('main.index'))
+
+@bp.route('/book/<int:hall_id>/series', methods=['GET', 'POST'])
+def book_series(hall_id):
+    """Book a hall every N weeks, checking all occurrences for conflicts at once"""
+    from datetime import date
+    hall = Hall.query.get_or_404(hall_id)
+    settings = get_settings()
+    
+    if request.method == 'POST':
+        form = BookingSeriesForm()
+        if form.validate_on_submit():
+            try:
+                series = booking_service.create_series(
+                    hall.id,
+                    form.student_name.data,
+                    form.department.data,
+                    form.purpose.data,
+                    form.booking_date.data,
+                    form.until_date.data,
+                    form.interval_weeks.data,
+                    form.start_time.data,
+                    form.end_time.data
+                )
+                occurrences = series.occurrence_dates()
+                send_series_notification(series, occurrences)
+                db.session.commit()
+            except SeriesConflictError as conflict:
+                # Report every clashing occurrence in one message
+                clashes = []
+                for booking_date, bookings in conflict.conflicts:
+                    taken = ', '.join(
+                        f"{b.start_time.strftime('%H:%M')} - {b.end_time.strftime('%H:%M')} by {b.student_name}"
+                        for b in bookings
+                    )
+                    clashes.append(f"{booking_date.strftime('%b %d, %Y')} ({taken})")
+                db.session.rollback()
+                flash(f'{len(clashes)} dates in this series are already booked: {"; ".join(clashes)}. Please choose another time slot or date range.', 'danger')
+                return render_template('booking.html', hall=hall, form=form, settings=settings, today=date.today(), series=True)
+            except ValueError as e:
+                db.session.rollback()
+                flash(str(e), 'danger')
+                return render_template('booking.html', hall=hall, form=form, settings=settings, today=date.today(), series=True)
+            except Exception as e:
+                db.session.rollback()
+                flash(f'Error booking hall: {str(e)}', 'danger')
+                logging.error(f'Series booking error: {str(e)}')
+            else:
+                logging.info(f'Booking series {series.id} created with {len(occurrences)} occurrences')
+                outbox.wake_workers()
+                flash(f'Hall "{hall.name}" booked for {len(occurrences)} dates from {occurrences[0]} to {occurrences[-1]}!', 'success')
+                return redirect(url_for('main.index'))
+        else:
+            for field, errors in form.errors.items():
+                for error in errors:
+                    flash(f'{field}: {error}', 'danger')
+    
+    form = BookingSeriesForm()
+    return render_template('booking.html', hall=hall, form=form, settings=settings, today=date.today(), series=True)
+
+@bp.route('/admin/booking/<int:booking_id>/cancel', methods=['POST'])
 def cancel_booking(booking_id):
     """Cancel a booking"""
     booking = Booking.query.get_or_404(booking_id)
     hall = booking.hall
     
     try:
-        booking.status = 'cancelled'
-        db.session.commit()
-        flash(f'Booking for "{hall.name}" on {booking.booking_date} cancelled successfully!', 'success')
+        promoted = booking_service.cancel_booking(booking)
+        if promoted is not None:
+            # The promoted bookings are new requests for the admins
+            for promoted_booking in promoted:
+                send_booking_notification(promoted_booking)
+            db.session.commit()
+            flash(f'Booking for "{hall.name}" on {booking.booking_date} cancelled successfully!', 'success')
+            if promoted:
+                outbox.wake_workers()
+                flash(f'{len(promoted)} waitlisted request(s) moved into the freed slot.', 'info')
+        else:
+            db.session.rollback()
+            flash('This booking has already been cancelled.', 'warning')
     except Exception as e:
         db.session.rollback()
         flash(f'Error cancelling booking: {str(e)}', 'danger')
         logging.error(f'Cancel booking error: {str(e)}')
     
-    return redirect(url_for('admin'))
+    return redirect(url_for('main.admin'))
+
+@bp.route('/admin/series/<int:series_id>/cancel', methods=['POST'])
+def cancel_series(series_id):
+    """Cancel all upcoming bookings of a recurring series"""
+    series = BookingSeries.query.get_or_404(series_id)
+    
+    try:
+        cancelled, promoted = booking_service.cancel_series(series)
+        for promoted_booking in promoted:
+            send_booking_notification(promoted_booking)
+        db.session.commit()
+        flash(f'Series for "{series.hall.name}" cancelled ({cancelled} upcoming bookings)!', 'success')
+        if promoted:
+            outbox.wake_workers()
+            flash(f'{len(promoted)} waitlisted request(s) moved into the freed slots.', 'info')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error cancelling series: {str(e)}', 'danger')
+        logging.error(f'Cancel series error: {str(e)}')
+    
+    return redirect(url_for('main.admin'))
+
+@bp.route('/halls/<int:hall_id>/calendar.ics')
+def hall_calendar(hall_id):
+    """iCalendar feed of a hall's bookings for calendar apps to subscribe to.
+
+    Covers the last CALENDAR_PAST_DAYS days and everything after. Answers
+    If-None-Match with 304 while the hall's bookings are unchanged.
+    """
+    from datetime import date, timedelta
+    hall = Hall.query.get_or_404(hall_id)
+    since = date.today() - timedelta(days=current_app.config['CALENDAR_PAST_DAYS'])
+    
+    etag = exports.calendar_etag(hall, since)
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    
+    response = Response(stream_with_context(exports.iter_hall_calendar(hall, since, request.host)),
+                        mimetype='text/calendar')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
-@app.route('/api/halls')
+@bp.route('/api/halls')
 def api_halls():
-    """API endpoint to get all halls with their status"""
-    halls = Hall.query.all()
-    halls_data = []
-    
-    for hall in halls:
-        halls_data.append({
-            'id': hall.id,
-            'name': hall.name,
-            'capacity': hall.capacity,
-            'location': hall.location,
-            'description': hall.description,
-            'is_available': hall.is_available
+    """API endpoint to get all halls with their status.
+
+    Responses carry an ETag built from sync.version and answer
+    If-None-Match with 304. Without parameters the body is the full list of
+    halls. With since=<seq> (delta mode), limit and/or after=<hall id>
+    (keyset pagination) the body is an object with the matching halls, the
+    ids of halls deleted since <seq>, the current seq to pass as since on
+    the next sync and next_after for the following page. A delta may
+    repeat halls sent by the previous sync.
+    """
+    from datetime import date
+    today = date.today()
+    
+    # Read the sequence before the halls so a change committed in between
+    # is sent again next time rather than skipped. The ETag leaves it out:
+    # on PostgreSQL it moves with unrelated transactions, and a client
+    # answered 304 can keep syncing from its own since
+    seq = sync.current_seq()
+    etag = f'halls-{sync.version()}-{today.isoformat()}-{request.query_string.decode()}'
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    
+    paged = any(arg in request.args for arg in ('since', 'limit', 'after'))
+    try:
+        since = int(request.args.get('since', 0))
+        limit = max(1, min(int(request.args.get('limit', 500)), 500))
+        after = int(request.args.get('after', 0))
+    except ValueError:
+        return jsonify({'error': 'since, limit and after must be integers'}), 400
+    
+    query = Hall.query
+    if paged:
+        if since:
+            query = query.filter(Hall.change_seq > since)
+        query = query.filter(Hall.id > after).order_by(Hall.id).limit(limit + 1)
+    halls = query.all()
+    next_after = None
+    if paged and len(halls) > limit:
+        halls = halls[:limit]
+        next_after = halls[-1].id
+    
+    halls_data = sync.hall_payloads(halls, today)
+    
+    if paged:
+        response = jsonify({
+            'seq': seq,
+            'date': today.isoformat(),
+            'halls': halls_data,
+            'deleted': sync.deleted_since(since) if since and not after else [],
+            'next_after': next_after
         })
+    else:
+        response = jsonify(halls_data)
+    response.set_etag(etag)
+    response.headers['X-Change-Seq'] = str(seq)
+    return response
+
+@bp.route('/api/hall-cards')
+def api_hall_cards():
+    """API endpoint for the rendered dashboard cards of some halls.
+
+    Takes ids, a comma-separated list of at most 500 hall ids, and returns
+    the card markup keyed by hall id; halls that no longer exist are left
+    out. The dashboard uses it to redraw the cards of changed halls.
+    """
+    from datetime import date
+    try:
+        hall_ids = [int(hall_id) for hall_id in request.args.get('ids', '').split(',') if hall_id]
+    except ValueError:
+        return jsonify({'error': 'ids must be comma-separated integers'}), 400
+    if len(hall_ids) > 500:
+        return jsonify({'error': 'At most 500 ids can be requested at once'}), 400
+
+    halls = Hall.query.filter(Hall.id.in_(hall_ids)).all() if hall_ids else []
+    cards = render_hall_cards(halls, date.today())
+    return jsonify({'cards': {hall.id: str(card) for hall, card in zip(halls, cards)}})
+
+@bp.route('/api/stream')
+def api_stream():
+    """Server-Sent Events stream of hall changes.
+
+    Sends hall.updated and hall.deleted events (with the change seq as the
+    event id) as bookings and halls change, a resync event if the client
+    fell too far behind, and a comment line as a keepalive.
+    """
+    subscription = events.subscribe()
+    keepalive = current_app.config['EVENT_STREAM_KEEPALIVE']
+    
+    def stream():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                item = subscription.get(timeout=keepalive)
+                if item is None:
+                    yield ': keepalive\n\n'
+                else:
+                    yield events.format_sse(item)
+        finally:
+            subscription.close()
     
-    return jsonify(halls_data)
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@bp.route('/api/availability')
+def api_availability():
+    """API endpoint to find free time windows across halls.
+
+    Query parameters: start_date and end_date (YYYY-MM-DD), min_capacity,
+    duration in minutes, optional day_start/day_end (HH:MM) bounding the
+    bookable hours and limit (default 50) on the number of halls returned.
+    Halls are ranked by how closely their capacity fits.
+    """
+    from datetime import date
+    try:
+        start_date = date.fromisoformat(request.args['start_date'])
+        end_date = date.fromisoformat(request.args.get('end_date', request.args['start_date']))
+        min_capacity = int(request.args.get('min_capacity', 1))
+        duration = int(request.args.get('duration', 60))
+        day_start = availability.parse_time(request.args.get('day_start', current_app.config['AVAILABILITY_DAY_START']))
+        day_end = availability.parse_time(request.args.get('day_end', current_app.config['AVAILABILITY_DAY_END']))
+        limit = int(request.args.get('limit', 50))
+    except KeyError:
+        return jsonify({'error': 'start_date is required'}), 400
+    except ValueError as e:
+        return jsonify({'error': f'Invalid parameter: {str(e)}'}), 400
+    
+    # Same limits as BookingForm
+    if duration < 60 or duration > 480:
+        return jsonify({'error': 'duration must be between 60 and 480 minutes'}), 400
+    if end_date < start_date:
+        return jsonify({'error': 'end_date cannot be before start_date'}), 400
+    if (end_date - start_date).days >= current_app.config['AVAILABILITY_MAX_DAYS']:
+        return jsonify({'error': f"Date range cannot exceed {current_app.config['AVAILABILITY_MAX_DAYS']} days"}), 400
+    if day_end <= day_start:
+        return jsonify({'error': 'day_end must be after day_start'}), 400
+    if limit < 1 or limit > 1000:
+        return jsonify({'error': 'limit must be between 1 and 1000'}), 400
+    
+    halls = availability.find_availability(start_date, end_date, min_capacity, duration, day_start, day_end, limit)
+    
+    return jsonify({
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'min_capacity': min_capacity,
+        'duration': duration,
+        'halls': halls
+    })
+
+def analytics_report():
+    """Build the analytics report for the current request's query parameters.
+
+    Parameters: start_date and end_date (YYYY-MM-DD, default the last four
+    weeks), granularity (day, week or month) and optional hall_id. Raises
+    ValueError with a message for the user on invalid input.
+    """
+    from datetime import date, timedelta
+    try:
+        end_date = date.fromisoformat(request.args.get('end_date') or date.today().isoformat())
+        start_date = date.fromisoformat(request.args.get('start_date') or (end_date - timedelta(days=27)).isoformat())
+    except ValueError:
+        raise ValueError('Dates must be in YYYY-MM-DD format')
+    granularity = request.args.get('granularity', 'week')
+    if granularity not in analytics.GRANULARITIES:
+        raise ValueError('granularity must be day, week or month')
+    if end_date < start_date:
+        raise ValueError('end_date cannot be before start_date')
+    if (end_date - start_date).days >= current_app.config['ANALYTICS_MAX_DAYS']:
+        raise ValueError(f"Date range cannot exceed {current_app.config['ANALYTICS_MAX_DAYS']} days")
+    
+    # Occupancy is measured against the bookable day
+    day_minutes = (availability.to_minutes(availability.parse_time(current_app.config['AVAILABILITY_DAY_END']))
+                   - availability.to_minutes(availability.parse_time(current_app.config['AVAILABILITY_DAY_START'])))
+    return analytics.report(start_date, end_date, granularity, day_minutes, request.args.get('hall_id', type=int))
+
+BOOKING_FIELDS = ('student_name', 'department', 'purpose', 'booking_date', 'start_time', 'end_time')
+
+def booking_payload(booking):
+    """Serialize a booking for the JSON API"""
+    return {
+        'id': booking.id,
+        'hall_id': booking.hall_id,
+        'student_name': booking.student_name,
+        'department': booking.department,
+        'purpose': booking.purpose,
+        'booking_date': booking.booking_date.isoformat(),
+        'start_time': booking.start_time.strftime('%H:%M'),
+        'end_time': booking.end_time.strftime('%H:%M'),
+        'status': booking.status
+    }
+
+def parse_booking_json(data):
+    """Validate one JSON booking with the BookingForm rules.
+
+    Dates are YYYY-MM-DD and times HH:MM, as in the form. Returns the
+    arguments for booking_service.create_booking and a dict of errors.
+    """
+    if not isinstance(data, dict):
+        return None, {'booking': ['Must be a JSON object']}
+    form = BookingForm(formdata=MultiDict({
+        name: str(data[name]) for name in BOOKING_FIELDS if data.get(name) is not None
+    }))
+    errors = {} if form.validate() else dict(form.errors)
+    hall_id = data.get('hall_id')
+    if type(hall_id) is not int or db.session.get(Hall, hall_id) is None:
+        errors['hall_id'] = ['Unknown hall']
+    if errors:
+        return None, errors
+    return dict(hall_id=hall_id, **{name: getattr(form, name).data for name in BOOKING_FIELDS}), {}
+
+def create_bookings_json(items, single=False):
+    """Validate and create bookings in one transaction, all or none.
+
+    Returns the response payload and status code; with single=True the
+    payload describes items[0] alone.
+    """
+    errors, values = {}, []
+    for index, item in enumerate(items):
+        fields, item_errors = parse_booking_json(item)
+        if item_errors:
+            errors[index] = item_errors
+        else:
+            values.append(fields)
+    if errors:
+        return {'error': 'Invalid booking', 'errors': errors[0] if single else errors}, 400
+
+    try:
+        # Same conflict check and hall/day locks as the booking form
+        created = booking_service.create_bookings(values)
+    except BookingConflictError as conflict:
+        payload = {'error': 'This hall is already booked for that time', 'index': conflict.index,
+                   'conflict': booking_payload(conflict.booking)}
+        db.session.rollback()
+        return payload, 409
+    for booking in created:
+        send_booking_notification(booking)
+
+    bookings = [booking_payload(booking) for booking in created]
+    payload = bookings[0] if single else {'bookings': bookings}
+    idempotency.remember(payload, 201)
+    db.session.commit()
+    logging.info(f'API created bookings {[booking["id"] for booking in bookings]}')
+    outbox.wake_workers()
+    return payload, 201
+
+def batch_items(data, name):
+    """Return data[name] if it is a non-empty list within the batch limit"""
+    items = data.get(name) if isinstance(data, dict) else None
+    max_size = current_app.config['API_BATCH_MAX_SIZE']
+    if not isinstance(items, list) or not 0 < len(items) <= max_size:
+        return None, (jsonify({'error': f'{name} must be a list of 1 to {max_size} items'}), 400)
+    return items, None
+
+@bp.route('/api/bookings', methods=['POST'])
+@idempotency.idempotent
+def api_create_booking():
+    """Create one booking from a JSON object.
+
+    Takes hall_id, student_name, department, purpose, booking_date,
+    start_time and end_time. Send an Idempotency-Key header to retry safely.
+    """
+    payload, status = create_bookings_json([request.get_json(silent=True)], single=True)
+    return jsonify(payload), status
+
+@bp.route('/api/bookings/batch', methods=['POST'])
+@idempotency.idempotent
+def api_create_bookings():
+    """Create {"bookings": [...]} in one transaction, all or none.
+
+    A conflict with a stored booking or another booking of the batch
+    answers 409 with the index of the offending item.
+    """
+    items, error = batch_items(request.get_json(silent=True), 'bookings')
+    if error:
+        return error
+    payload, status = create_bookings_json(items)
+    return jsonify(payload), status
+
+@bp.route('/api/bookings/cancel', methods=['POST'])
+@idempotency.idempotent
+def api_cancel_bookings():
+    """Cancel {"ids": [...]} in one transaction.
+
+    Each id is reported as cancelled, already_cancelled or not_found,
+    along with the ids of waitlisted requests promoted into its slot.
+    """
+    ids, error = batch_items(request.get_json(silent=True), 'ids')
+    if error:
+        return error
+    if any(type(booking_id) is not int for booking_id in ids):
+        return jsonify({'error': 'ids must be integers'}), 400
+
+    bookings = Booking.query.filter(Booking.id.in_(ids)).order_by(Booking.id).all()
+    results = {}
+    promoted_any = False
+    for booking_id, promoted in booking_service.cancel_bookings(bookings).items():
+        if promoted is None:
+            results[booking_id] = {'status': 'already_cancelled'}
+            continue
+        for promoted_booking in promoted:
+            send_booking_notification(promoted_booking)
+        promoted_any = promoted_any or bool(promoted)
+        results[booking_id] = {'status': 'cancelled', 'promoted': [promoted_booking.id for promoted_booking in promoted]}
+    payload = {'results': [
+        dict(id=booking_id, **results.get(booking_id, {'status': 'not_found'})) for booking_id in ids
+    ]}
+    idempotency.remember(payload, 200)
+    db.session.commit()
+    if promoted_any:
+        outbox.wake_workers()
+    return jsonify(payload)
+
+@bp.route('/admin/analytics')
+def admin_analytics():
+    """Hall utilization: occupancy per period, department hours and peak times"""
+    settings = get_settings()
+    if not settings or not settings.is_setup_complete:
+        return redirect(url_for('main.setup'))
+    
+    try:
+        report = analytics_report()
+    except ValueError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('main.admin_analytics'))
+    
+    halls = Hall.query.with_entities(Hall.id, Hall.name).order_by(Hall.name).all()
+    peak = max((hours for row in report['heatmap'] for hours in row), default=0)
+    # Heatmap columns: the bookable day, widened to any hour with bookings
+    busy_hours = [hour for hour in range(24) if any(row[hour] for row in report['heatmap'])]
+    first_hour = min(busy_hours + [availability.parse_time(current_app.config['AVAILABILITY_DAY_START']).hour])
+    last_hour = max(busy_hours + [availability.parse_time(current_app.config['AVAILABILITY_DAY_END']).hour - 1])
+    
+    return render_template('analytics.html', report=report, halls=halls, peak=peak,
+                           hours=range(first_hour, last_hour + 1), weekdays=['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'],
+                           hall_id=request.args.get('hall_id', type=int), settings=settings)
+
+@bp.route('/api/analytics')
+def api_analytics():
+    """API endpoint for hall utilization, served from the usage rollups.
+
+    Takes the same parameters as the analytics page. The heatmap is a 7x24
+    grid of booked hours, Monday first.
+    """
+    try:
+        return jsonify(analytics_report())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@bp.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics for every worker"""
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
 
 def send_booking_notification(booking):
-    """Send email notification to admin about new booking"""
+    """Queue email notification to admin about new booking.
+
+    The message goes into the outbox in the caller's transaction and is
+    delivered by the outbox workers after commit.
+    """
     try:
-        settings = Settings.query.first()
+        settings = get_settings()
         if not settings or not settings.admin_emails:
             logging.warning('No admin emails configured for notifications')
             return
@@ -304,33 +944,87 @@ This is an automated notification from the Hall Management System.
 Please review the booking in the admin panel for further actions.
         """
         
-        msg = Message(
-            subject=subject,
-            recipients=settings.email_list,
-            body=body
-        )
-        
-        # Try to send email, but don't fail the booking if email fails
-        try:
-            mail.send(msg)
-            logging.info(f'Booking notification sent for booking ID: {booking.id}')
-        except Exception as email_error:
-            logging.error(f'Failed to send email notification: {str(email_error)}')
-            # Don't raise the exception - booking should still succeed
+        outbox.queue_email(subject, settings.email_list, body)
+        logging.info(f'Booking notification queued for booking ID: {booking.id}')
         
     except Exception as e:
         logging.error(f'Error in send_booking_notification: {str(e)}')
 
-@app.errorhandler(404)
+def send_series_notification(series, occurrences):
+    """Queue email notification to admin about a new recurring booking"""
+    try:
+        settings = get_settings()
+        if not settings or not settings.admin_emails:
+            logging.warning('No admin emails configured for notifications')
+            return
+        
+        start_time = series.start_time.strftime('%I:%M %p')
+        end_time = series.end_time.strftime('%I:%M %p')
+        dates = '\n'.join(f"- {occurrence.strftime('%A, %B %d, %Y')}" for occurrence in occurrences)
+        
+        subject = f'Request for Recurring Hall Booking – {series.hall.name}'
+        
+        body = f"""Respected Sir/Madam,
+
+I am writing to request the recurring booking of the {series.hall.name} at {settings.college_name} from {start_time} to {end_time} on the following {len(occurrences)} dates:
+
+{dates}
+
+Student Details:
+- Name: {series.student_name}
+- Department: {series.department}
+
+Event Details:
+- Hall Requested: {series.hall.name}
+- Repeats: Every {series.interval_weeks} week(s)
+- Purpose: {series.purpose}
+- Hall Capacity: {series.hall.capacity} people
+- Location: {series.hall.location}
+
+Kindly confirm the availability of the hall for the mentioned dates and time.
+
+Regards,
+{series.student_name}
+{series.department}
+Submitted via {settings.college_name} Hall Management System
+
+---
+This is an automated notification from the Hall Management System.
+Please review the booking in the admin panel for further actions.
+        """
+        
+        outbox.queue_email(subject, settings.email_list, body)
+        logging.info(f'Series notification queued for series ID: {series.id}')
+        
+    except Exception as e:
+        logging.error(f'Error in send_series_notification: {str(e)}')
+
+@bp.app_errorhandler(404)
 def not_found_error(error):
     """Handle 404 errors"""
     flash('The requested page was not found.', 'warning')
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def internal_error(error):
     """Handle 500 errors"""
     db.session.rollback()
     flash('An internal error occurred. Please try again.', 'danger')
     logging.error(f'Internal error: {str(error)}')
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
+
+@bp.app_errorhandler(OperationalError)
+def database_busy(error):
+    """Handle lock timeouts and broken deadlocks.
+
+    API clients get a JSON 503 they can retry, safely with an
+    Idempotency-Key; pages fall back to the 500 handler.
+    """
+    if not request.path.startswith('/api/'):
+        return internal_error(error)
+    db.session.rollback()
+    logging.warning(f'Database busy: {str(error)}')
+    response = jsonify({'error': 'The database is busy, please retry'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
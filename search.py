@@ -0,0 +1,68 @@
+import logging
+import re
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import Integer, column, or_, text
+from app import db
+from models import Booking, SEARCH_DDL
+
+
+def _terms(query_text):
+    """Split user input into plain word tokens safe to embed in a query"""
+    return re.findall(r'\w+', query_text or '')
+
+
+def booking_search_clause(query_text, model=Booking):
+    """Return a filter matching bookings whose name, department or purpose
+    contain every word of query_text (each word as a prefix).
+
+    model is Booking or BookingArchive; both carry the same index.
+
+    Uses the FTS5 table on SQLite and the tsvector column on PostgreSQL,
+    falling back to ILIKE elsewhere. Returns None for an empty query.
+    """
+    terms = _terms(query_text)
+    if not terms:
+        return None
+
+    table = model.__tablename__
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        match = ' '.join(f'"{term}"*' for term in terms)
+        return model.id.in_(
+            text(f'SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH :match')
+            .bindparams(match=match)
+            .columns(column('rowid', Integer))
+        )
+    if dialect == 'postgresql':
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        return text(f"{table}.search_vector @@ to_tsquery('simple', :tsquery)").bindparams(tsquery=tsquery)
+
+    return db.and_(*[
+        or_(
+            model.student_name.ilike(f'%{term}%'),
+            model.department.ilike(f'%{term}%'),
+            model.purpose.ilike(f'%{term}%')
+        )
+        for term in terms
+    ])
+
+
+def rebuild_search_index(commit=True):
+    """Create the full-text index objects if missing and repopulate them"""
+    dialect = db.session.get_bind().dialect.name
+    for table, statements in SEARCH_DDL.items():
+        for statement in statements.get(dialect, []):
+            db.session.execute(text(statement))
+        if dialect == 'sqlite':
+            db.session.execute(text(f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')"))
+    if commit:
+        db.session.commit()
+
+
+@click.command('rebuild-search')
+@with_appcontext
+def rebuild_search_command():
+    """Create and repopulate the booking and archive full-text indexes"""
+    rebuild_search_index()
+    logging.info('Booking search index rebuilt')
@@ -90,7 +90,11 @@ function validateBookingDate(event) {
 function initializeAutoRefresh() {
     // Only auto-refresh on dashboard
     if (window.location.pathname === '/' || window.location.pathname === '/dashboard') {
-        // Auto-refresh every 5 minutes
+        if (window.EventSource) {
+            subscribeHallEvents();
+            return;
+        }
+        // Fall back to polling every 5 minutes
         setInterval(function() {
             console.log('Auto-refreshing hall status...');
             refreshHallStatus();
@@ -99,14 +103,55 @@ function initializeAutoRefresh() {
 }
 
 /**
- * Refresh hall status via AJAX
+ * Subscribe to live hall changes and redraw the changed hall cards
+ */
+function subscribeHallEvents() {
+    const source = new EventSource('/api/stream');
+    let disconnected = false;
+
+    source.addEventListener('hall.updated', function(event) {
+        updateHallCards([JSON.parse(event.data)]).catch(error => {
+            console.error('Error updating hall card:', error);
+        });
+    });
+    source.addEventListener('hall.deleted', function(event) {
+        removeHallCards([JSON.parse(event.data).id]);
+    });
+    // Sent when this client fell behind and missed events
+    source.addEventListener('resync', function() {
+        refreshHallStatus();
+    });
+
+    source.onerror = function() {
+        disconnected = true;
+    };
+    source.onopen = function() {
+        // Catch up on anything that changed while the stream was down
+        if (disconnected) {
+            disconnected = false;
+            refreshHallStatus();
+        }
+    };
+}
+
+// State for incremental /api/halls syncs
+const hallSync = {
+    seq: null,      // Change sequence of the last complete sync
+    date: null,     // Server date of the last complete sync
+    etag: null      // ETag of the last first-page response
+};
+
+/**
+ * Refresh hall status via AJAX, fetching only halls changed since the last sync
  */
 function refreshHallStatus() {
-    fetch('/api/halls')
-        .then(response => response.json())
-        .then(data => {
-            updateHallCards(data);
-            console.log('Hall status updated');
+    fetchHallChanges(hallSync.seq, null, null)
+        .then(result => {
+            if (result) {
+                console.log(`Hall status updated (${result.changed} changed)`);
+            } else {
+                console.log('Hall status unchanged');
+            }
         })
         .catch(error => {
             console.error('Error refreshing hall status:', error);
@@ -114,36 +159,113 @@ function refreshHallStatus() {
 }
 
 /**
- * Update hall cards with new data
+ * Fetch one page of hall changes and follow the keyset pagination cursor
  */
-function updateHallCards(halls) {
-    halls.forEach(function(hall) {
-        const hallCard = document.querySelector(`[data-hall-id="${hall.id}"]`);
-        if (hallCard) {
-            const statusBadge = hallCard.querySelector('.badge');
-            const bookButton = hallCard.querySelector('.btn');
-            
-            if (hall.is_available) {
-                statusBadge.className = 'badge bg-success';
-                statusBadge.innerHTML = '<i class="fas fa-check me-1"></i>Available';
-                if (bookButton) {
-                    bookButton.className = 'btn btn-success w-100';
-                    bookButton.innerHTML = '<i class="fas fa-calendar-plus me-1"></i>Book Now';
-                    bookButton.disabled = false;
-                }
-            } else {
-                statusBadge.className = 'badge bg-danger';
-                statusBadge.innerHTML = '<i class="fas fa-times me-1"></i>Booked';
-                if (bookButton) {
-                    bookButton.className = 'btn btn-secondary w-100';
-                    bookButton.innerHTML = '<i class="fas fa-ban me-1"></i>Currently Booked';
-                    bookButton.disabled = true;
-                }
+function fetchHallChanges(since, after, syncState) {
+    const params = new URLSearchParams({ limit: 200 });
+    if (since !== null) {
+        params.set('since', since);
+    }
+    if (after !== null) {
+        params.set('after', after);
+    }
+
+    const headers = {};
+    const firstPage = after === null;
+    if (firstPage && hallSync.etag) {
+        headers['If-None-Match'] = hallSync.etag;
+    }
+
+    return fetch(`/api/halls?${params}`, { headers: headers, cache: 'no-store' })
+        .then(response => {
+            if (response.status === 304) {
+                return null;
+            }
+            if (!response.ok) {
+                throw new Error(`Unexpected status ${response.status}`);
+            }
+            if (firstPage) {
+                hallSync.etag = response.headers.get('ETag');
             }
+            return response.json();
+        })
+        .then(data => {
+            if (data === null) {
+                return null;
+            }
+
+            // Today's booking counts reset at midnight, so start over on a new day
+            if (since !== null && hallSync.date !== data.date) {
+                hallSync.etag = null;
+                return fetchHallChanges(null, null, null);
+            }
+
+            const state = syncState || { seq: data.seq, date: data.date, changed: 0 };
+            removeHallCards(data.deleted);
+            state.changed += data.halls.length + data.deleted.length;
+
+            return updateHallCards(data.halls).then(() => {
+                if (data.next_after !== null) {
+                    return fetchHallChanges(since, data.next_after, state);
+                }
+                hallSync.seq = state.seq;
+                hallSync.date = state.date;
+                return state;
+            });
+        });
+}
+
+/**
+ * Remove cards of deleted halls
+ */
+function removeHallCards(hallIds) {
+    hallIds.forEach(function(hallId) {
+        const hallCard = document.querySelector(`[data-hall-id="${hallId}"]`);
+        if (hallCard && hallCard.parentNode) {
+            hallCard.parentNode.remove();
         }
     });
 }
 
+/**
+ * Redraw the cards of changed halls from their server-rendered markup,
+ * adding cards for halls this page has not shown yet
+ */
+function updateHallCards(halls) {
+    const container = document.getElementById('halls-container');
+    if (!container || halls.length === 0) {
+        return Promise.resolve();
+    }
+    const hallIds = halls.map(hall => hall.id);
+
+    return fetch(`/api/hall-cards?ids=${hallIds.join(',')}`, { cache: 'no-store' })
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`Unexpected status ${response.status}`);
+            }
+            return response.json();
+        })
+        .then(data => {
+            hallIds.forEach(function(hallId) {
+                const markup = data.cards[hallId];
+                if (!markup) {
+                    return;  // Deleted since the change was sent
+                }
+                const template = document.createElement('template');
+                template.innerHTML = markup.trim();
+                const column = template.content.firstElementChild;
+                const card = column.querySelector('[data-hall-id]');
+                const hallCard = document.querySelector(`[data-hall-id="${hallId}"]`);
+                if (!hallCard) {
+                    container.appendChild(column);
+                } else if (Number(card.dataset.changeSeq) >= Number(hallCard.dataset.changeSeq)) {
+                    // Responses can arrive out of order; never go back to an older card
+                    hallCard.parentNode.replaceWith(column);
+                }
+            });
+        });
+}
+
 /**
  * Initialize modal handlers
  */
@@ -0,0 +1,137 @@
+from datetime import date
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from models import Booking, ChangeCounter, Hall, HallTombstone
+import events
+
+HALLS_COUNTER = 'halls'
+
+
+def _bump_counter(name):
+    """Increment a ChangeCounter and return its new value"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        dialect_insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = dialect_insert(ChangeCounter).values(name=name, value=1)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['name'],
+            set_={'value': ChangeCounter.value + 1}
+        ).returning(ChangeCounter.value)
+        return db.session.execute(stmt).scalar_one()
+
+    # Generic fallback for other backends
+    result = db.session.execute(
+        update(ChangeCounter).where(ChangeCounter.name == name).values(value=ChangeCounter.value + 1)
+    )
+    if result.rowcount == 0:
+        db.session.add(ChangeCounter(name=name, value=1))
+        db.session.flush()
+    return db.session.execute(select(ChangeCounter.value).where(ChangeCounter.name == name)).scalar_one()
+
+
+def _uses_xids():
+    """Return True if changes are stamped with transaction ids (PostgreSQL)"""
+    return db.session.get_bind().dialect.name == 'postgresql'
+
+
+def touch_halls(hall_ids, deleted=False):
+    """Stamp halls with a new change sequence number.
+
+    Call this as the last statement before committing a change to halls or
+    their bookings. Each hall's number only ever grows, so it can key
+    caches of the hall.
+
+    On PostgreSQL the number is at least the writing transaction's id and
+    only the touched hall rows are locked, so changes to different halls
+    do not wait for each other. Transaction ids are not handed out in
+    commit order; current_seq accounts for that. Other backends bump one
+    shared counter row, which stays locked until commit, so numbers become
+    visible in commit order.
+    """
+    hall_ids = sorted(set(hall_ids))
+    if not hall_ids:
+        return None
+    if _uses_xids():
+        # Lock the hall rows in id order so two multi-hall changes cannot
+        # deadlock
+        db.session.execute(select(Hall.id).where(Hall.id.in_(hall_ids)).order_by(Hall.id).with_for_update())
+        seq = db.session.execute(select(func.txid_current())).scalar_one()
+    else:
+        seq = _bump_counter(HALLS_COUNTER)
+    if deleted:
+        for hall_id in hall_ids:
+            db.session.merge(HallTombstone(hall_id=hall_id, change_seq=seq))
+            events.emit('hall.deleted', {'id': hall_id}, seq)
+        return seq
+
+    options = {'synchronize_session': False}
+    if _uses_xids():
+        stamps = dict(db.session.execute(
+            update(Hall).where(Hall.id.in_(hall_ids))
+            .values(change_seq=func.greatest(Hall.change_seq + 1, seq))
+            .returning(Hall.id, Hall.change_seq),
+            execution_options=options
+        ).all())
+    else:
+        db.session.execute(update(Hall).where(Hall.id.in_(hall_ids)).values(change_seq=seq), execution_options=options)
+        stamps = dict.fromkeys(hall_ids, seq)
+    for payload in hall_payloads(Hall.query.filter(Hall.id.in_(hall_ids)).all()):
+        events.emit('hall.updated', payload, stamps[payload['id']])
+    return max(stamps.values(), default=seq)
+
+
+def hall_payloads(halls, today=None):
+    """Serialize halls with their count of active bookings today"""
+    today = today or date.today()
+    today_counts = dict(db.session.query(Booking.hall_id, func.count(Booking.id)).filter(
+        Booking.hall_id.in_([hall.id for hall in halls]),
+        Booking.booking_date == today,
+        Booking.status == 'active'
+    ).group_by(Booking.hall_id).all()) if halls else {}
+
+    return [{
+        'id': hall.id,
+        'name': hall.name,
+        'capacity': hall.capacity,
+        'location': hall.location,
+        'description': hall.description,
+        'is_available': hall.is_available,
+        'today_bookings': today_counts.get(hall.id, 0)
+    } for hall in halls]
+
+
+def current_seq():
+    """Return a sequence number every unseen change will be stamped above.
+
+    A client that has read the halls after this call has seen every change
+    numbered at or below it. On PostgreSQL that is just below the oldest
+    transaction still running, so changes of transactions that commit
+    later are sent again; clients must treat repeats as updates.
+    """
+    if _uses_xids():
+        return db.session.execute(select(func.txid_snapshot_xmin(func.txid_current_snapshot()) - 1)).scalar_one()
+    return db.session.execute(
+        select(ChangeCounter.value).where(ChangeCounter.name == HALLS_COUNTER)
+    ).scalar() or 0
+
+
+def version():
+    """Return a string that changes with every committed change to halls.
+
+    Every deletion raises the sum of the tombstone numbers and every other
+    change raises the touched hall's number, so the pair of sums never
+    repeats, even where numbers are not assigned in commit order.
+    """
+    tombstones, total = db.session.execute(select(
+        select(func.coalesce(func.sum(HallTombstone.change_seq), 0)).scalar_subquery(),
+        select(func.coalesce(func.sum(Hall.change_seq), 0)).scalar_subquery()
+    )).one()
+    return f'{tombstones}.{total}'
+
+
+def deleted_since(seq):
+    """Return ids of halls deleted after the given sequence number"""
+    return db.session.execute(
+        select(HallTombstone.hall_id).where(HallTombstone.change_seq > seq).order_by(HallTombstone.hall_id)
+    ).scalars().all()
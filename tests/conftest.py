@@ -0,0 +1,48 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db  # noqa: E402
+import cache  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    """App on a fresh database: TEST_DATABASE_URL if set (e.g. a scratch
+    PostgreSQL database, emptied by each test), else a SQLite file"""
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': os.environ.get('TEST_DATABASE_URL', f'sqlite:///{tmp_path / "test.db"}'),
+        'SETTINGS_VERSION_FILE': str(tmp_path / 'settings.version'),
+        'OUTBOX_WORKERS': 0,
+    })
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        # Process-wide caches outlive the database of the previous test
+        cache.invalidate_settings()
+        with cache._fragment_lock:
+            cache._fragments.clear()
+            cache._fragment_sizes['total'] = 0
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def settings(app):
+    """Complete the first-run setup so pages render instead of redirecting"""
+    from models import Settings
+    with app.app_context():
+        db.session.add(Settings(college_name='Test College', admin_emails='admin@example.com', is_setup_complete=True))
+        db.session.commit()
+        cache.invalidate_settings()
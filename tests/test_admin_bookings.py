@@ -0,0 +1,74 @@
+import html
+import re
+from datetime import date, time, timedelta
+from app import db
+from archive import archive_bookings
+from models import Hall
+import booking_service
+
+DAY = date.today() + timedelta(days=7)
+
+
+def add_bookings(app, rows):
+    """Book (student_name, department, purpose) rows in one hall, one hour
+    apart on the same day, and return their ids"""
+    with app.app_context():
+        hall = Hall(name='Main Hall', capacity=100, location='Main Block')
+        db.session.add(hall)
+        db.session.commit()
+        bookings = [booking_service.create_booking(hall.id, name, department, purpose, DAY, time(8 + n), time(9 + n))
+                    for n, (name, department, purpose) in enumerate(rows)]
+        db.session.commit()
+        return [booking.id for booking in bookings]
+
+
+def browse(client, url):
+    """Return the booking ids on a page, and its older and newer page links"""
+    page = client.get(url).get_data(as_text=True)
+    ids = [int(booking_id) for booking_id in re.findall(r'id="viewBookingModal(\d+)"', page)]
+    links = {}
+    for href in re.findall(r'href="([^"]*admin/bookings\?[^"]*)"', page):
+        href = html.unescape(href)
+        for cursor in ('before', 'after'):
+            if f'{cursor}=' in href:
+                links[cursor] = href
+    return ids, links.get('before'), links.get('after')
+
+
+def test_search_matches_every_word_as_a_prefix(app, client, settings):
+    ids = add_bookings(app, [
+        ('Asha Rao', 'Physics', 'Quantum mechanics tutorial'),
+        ('Ravi Kumar', 'Physics', 'Optics lab briefing'),
+        ('Meena Iyer', 'Chemistry', 'Quantum chemistry review'),
+        ('Arun Das', 'Physics', 'Quantitative methods seminar'),
+    ])
+    with app.app_context():
+        # Archived bookings are searched too
+        booking_service.cancel_booking(db.session.get(booking_service.Booking, ids[3]))
+        db.session.commit()
+        assert archive_bookings(batch_size=10, pause=0) == 1
+
+    assert browse(client, '/admin/bookings?q=quant+phys')[0] == [ids[3], ids[0]]
+    assert browse(client, '/admin/bookings?q=quantum')[0] == [ids[2], ids[0]]
+    assert browse(client, '/admin/bookings?q=Meena')[0] == [ids[2]]
+    assert browse(client, '/admin/bookings?q=biology')[0] == []
+
+
+def test_keyset_pages_cover_bookings_on_the_same_date_once(app, client, settings):
+    ids = add_bookings(app, [(f'Student {n}', 'Physics', 'Department seminar') for n in range(7)]
+                       + [('Other', 'Chemistry', 'Lab meeting')])
+    matching = sorted(ids[:7], reverse=True)
+
+    page, older, newer = browse(client, '/admin/bookings?q=seminar&per_page=3')
+    assert (page, newer) == (matching[:3], None)
+    assert f'before={matching[2]}' in older and 'q=seminar' in older
+
+    page, older, newer = browse(client, older)
+    assert page == matching[3:6]
+    assert f'after={matching[3]}' in newer
+
+    last, end, _ = browse(client, older)
+    assert (last, end) == (matching[6:], None)
+
+    # Going back from the last page returns the page before it
+    assert browse(client, browse(client, older)[2])[0] == matching[3:6]
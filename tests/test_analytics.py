@@ -0,0 +1,76 @@
+from datetime import date, time, timedelta
+from app import db
+from models import Hall
+import analytics
+import booking_service
+
+
+def snapshot(start_date, end_date):
+    return analytics.report(start_date, end_date, 'week', 600)
+
+
+def test_rollups_sum_across_halls_and_match_a_rebuild(app):
+    day = date.today() + timedelta(days=3)
+    with app.app_context():
+        halls = [Hall(name=f'Hall {number}', capacity=100, location='Main Block') for number in range(2)]
+        db.session.add_all(halls)
+        db.session.commit()
+        slot = dict(department='Physics', purpose='Seminar', booking_date=day)
+        for hall in halls:
+            booking_service.create_booking(hall.id, 'Student', start_time=time(9), end_time=time(10, 30), **slot)
+        cancelled = booking_service.create_booking(halls[0].id, 'Student', start_time=time(14), end_time=time(15), **slot)
+        db.session.commit()
+        booking_service.cancel_booking(cancelled)
+        db.session.commit()
+
+        report = snapshot(day, day)
+        assert report['departments'] == [{'department': 'Physics', 'booked_hours': 3.0, 'bookings': 2}]
+        hours = report['heatmap'][day.weekday()]
+        assert (hours[9], hours[10], hours[14]) == (2.0, 1.0, 0)
+
+        analytics.rebuild()
+        assert snapshot(day, day) == report
+
+
+def test_deleting_a_hall_removes_only_its_usage(app, client, settings):
+    day = date.today() + timedelta(days=3)
+    with app.app_context():
+        halls = [Hall(name=f'Hall {number}', capacity=100, location='Main Block') for number in range(2)]
+        db.session.add_all(halls)
+        db.session.commit()
+        for hall, department in zip(halls, ('Physics', 'Chemistry')):
+            booking_service.create_booking(hall.id, 'Student', department, 'Seminar', day, time(9), time(10))
+        db.session.commit()
+        hall_ids = [hall.id for hall in halls]
+
+    assert client.post(f'/admin/hall/{hall_ids[0]}/delete').status_code == 302
+    with app.app_context():
+        report = snapshot(day, day)
+        assert [hall['hall_id'] for hall in report['occupancy']] == hall_ids[1:]
+        assert report['departments'] == [{'department': 'Chemistry', 'booked_hours': 1.0, 'bookings': 1}]
+        assert report['heatmap'][day.weekday()][9] == 1.0
+        analytics.rebuild()
+        assert snapshot(day, day) == report
+
+
+def test_report_filtered_by_hall_covers_only_that_hall(app, client):
+    day = date.today() + timedelta(days=3)
+    with app.app_context():
+        halls = [Hall(name=f'Hall {number}', capacity=100, location='Main Block') for number in range(2)]
+        db.session.add_all(halls)
+        db.session.commit()
+        booking_service.create_booking(halls[0].id, 'Student', 'Physics', 'Seminar', day, time(9), time(10))
+        booking_service.create_booking(halls[1].id, 'Student', 'Chemistry', 'Seminar', day, time(14), time(16))
+        db.session.commit()
+        hall_id = halls[1].id
+
+        report = analytics.report(day, day, 'week', 600, hall_id)
+        assert [hall['hall_id'] for hall in report['occupancy']] == [hall_id]
+        assert report['departments'] == [{'department': 'Chemistry', 'booked_hours': 2.0, 'bookings': 1}]
+        hours = report['heatmap'][day.weekday()]
+        assert (hours[9], hours[14], hours[15]) == (0, 1.0, 1.0)
+
+    response = client.get(f'/api/analytics?start_date={day}&end_date={day}&hall_id={hall_id}')
+    assert response.status_code == 200
+    assert response.get_json()['departments'] == report['departments']
+    assert response.get_json()['heatmap'] == report['heatmap']
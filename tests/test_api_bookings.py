@@ -0,0 +1,116 @@
+import threading
+from datetime import date, time, timedelta
+from app import db
+from models import Booking, Hall, WaitlistEntry
+import booking_service
+
+DAY = date.today() + timedelta(days=7)
+
+
+def add_halls(app, count):
+    with app.app_context():
+        halls = [Hall(name=f'Hall {number}', capacity=100, location='Main Block') for number in range(count)]
+        db.session.add_all(halls)
+        db.session.commit()
+        return [hall.id for hall in halls]
+
+
+def item(hall_id, start, end, day=DAY, name='Student'):
+    return {'hall_id': hall_id, 'student_name': name, 'department': 'Physics', 'purpose': 'Department seminar',
+            'booking_date': day.isoformat(), 'start_time': start, 'end_time': end}
+
+
+def test_batch_create_is_all_or_none(app, client, settings):
+    first, second = add_halls(app, 2)
+    response = client.post('/api/bookings/batch', json={'bookings': [
+        item(second, '09:00', '10:00'), item(first, '09:00', '10:00'), item(second, '09:30', '11:00')
+    ]})
+    assert response.status_code == 409
+    assert response.json['index'] == 2
+    with app.app_context():
+        assert Booking.query.count() == 0
+
+    response = client.post('/api/bookings/batch', json={'bookings': [
+        item(second, '09:00', '10:00'), item(first, '09:00', '10:00', DAY + timedelta(days=1))
+    ]})
+    assert response.status_code == 201
+    assert [booking['hall_id'] for booking in response.json['bookings']] == [second, first]
+
+
+def test_batch_cancel_promotes_waitlisted_requests(app, client, settings):
+    hall_ids = add_halls(app, 2)
+    with app.app_context():
+        bookings = [booking_service.create_booking(hall_id, 'First', 'Physics', 'Seminar', DAY, time(9), time(10))
+                    for hall_id in hall_ids]
+        entries = [booking_service.join_waitlist(hall_id, 'Second', 'Physics', 'Seminar', DAY, time(9), time(10))
+                   for hall_id in hall_ids]
+        db.session.commit()
+        booking_ids = [booking.id for booking in bookings]
+        entry_ids = [entry.id for entry in entries]
+
+    response = client.post('/api/bookings/cancel', json={'ids': booking_ids + [0]})
+    assert response.status_code == 200
+    results = response.json['results']
+    assert [result['status'] for result in results] == ['cancelled', 'cancelled', 'not_found']
+    with app.app_context():
+        promoted = [db.session.get(WaitlistEntry, entry_id).booking_id for entry_id in entry_ids]
+        assert [result['promoted'] for result in results[:2]] == [[booking_id] for booking_id in promoted]
+        assert Booking.query.filter_by(status='active').count() == 2
+
+
+def test_concurrent_batches_in_opposite_orders_do_not_deadlock(app, settings):
+    hall_ids = add_halls(app, 3)
+    app.test_client().get('/')
+    days = [DAY + timedelta(days=offset) for offset in range(3)]
+    # Each batch books two of the three days, so batches overlap only partly
+    batches = [[item(hall_id, f'{8 + number:02d}:00', f'{9 + number:02d}:00', day)
+                for hall_id in hall_ids for day in (days[number % 3], days[(number + 1) % 3])]
+               for number in range(8)]
+    barrier = threading.Barrier(len(batches))
+    statuses = []
+
+    def post(number, batch):
+        client = app.test_client()
+        batch = batch if number % 2 else batch[::-1]
+        barrier.wait()
+        statuses.append(client.post('/api/bookings/batch', json={'bookings': batch}).status_code)
+
+    threads = [threading.Thread(target=post, args=pair) for pair in enumerate(batches)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert statuses == [201] * len(batches)
+    with app.app_context():
+        assert Booking.query.count() == len(batches) * len(hall_ids) * 2
+
+
+def test_concurrent_retries_with_one_idempotency_key_replay_the_first(app, settings):
+    [hall_id] = add_halls(app, 1)
+    app.test_client().get('/')
+    barrier = threading.Barrier(6)
+    responses = []
+
+    def post():
+        client = app.test_client()
+        barrier.wait()
+        response = client.post('/api/bookings', json=item(hall_id, '09:00', '10:00'),
+                               headers={'Idempotency-Key': 'retry-1'})
+        responses.append((response.status_code, response.headers.get('Idempotent-Replayed'), response.json))
+
+    threads = [threading.Thread(target=post) for _ in range(barrier.parties)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [status for status, _, _ in responses] == [201] * barrier.parties
+    assert sum(1 for _, replayed, _ in responses if replayed) == barrier.parties - 1
+    assert len({body['id'] for _, _, body in responses}) == 1
+    with app.app_context():
+        assert Booking.query.count() == 1
+
+    response = app.test_client().post('/api/bookings', json=item(hall_id, '11:00', '12:00'),
+                                      headers={'Idempotency-Key': 'retry-1'})
+    assert response.status_code == 422
@@ -0,0 +1,40 @@
+from datetime import date, time, timedelta
+from sqlalchemy import event
+from app import db
+from archive import archive_bookings
+from models import Booking, BookingArchive, Hall, WaitlistEntry
+import booking_service
+
+
+def test_archive_moves_bookings_promoted_from_the_waitlist(app):
+    """A waitlist entry keeps the id of its promoted booking after that
+    booking is cancelled and archived"""
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            # SQLite only enforces foreign keys when asked to
+            event.listen(db.engine, 'connect',
+                         lambda connection, record: connection.execute('PRAGMA foreign_keys=ON'))
+            db.engine.dispose()
+
+        hall = Hall(name='Main Hall', capacity=100, location='Main Block')
+        db.session.add(hall)
+        db.session.commit()
+        slot = dict(hall_id=hall.id, department='Physics', purpose='Seminar',
+                    booking_date=date.today() + timedelta(days=7), start_time=time(9), end_time=time(11))
+
+        first = booking_service.create_booking(student_name='First', **slot)
+        entry = booking_service.join_waitlist(student_name='Second', **slot)
+        db.session.commit()
+        [promoted] = booking_service.cancel_booking(first)
+        db.session.commit()
+        assert entry.booking_id == promoted.id
+
+        booking_service.cancel_booking(promoted)
+        booking_service.create_booking(student_name='Third', **slot)
+        db.session.commit()
+        promoted_id, entry_id = promoted.id, entry.id
+
+        assert archive_bookings(batch_size=10, pause=0) == 2
+        assert BookingArchive.query.filter_by(id=promoted_id).one().status == 'cancelled'
+        assert Booking.query.filter_by(status='active').count() == 1
+        assert db.session.get(WaitlistEntry, entry_id).booking_id == promoted_id
@@ -0,0 +1,65 @@
+from datetime import date, time, timedelta
+from app import db
+from availability import free_windows
+from models import Hall
+import booking_service
+
+DAY = date.today() + timedelta(days=7)
+
+
+def test_free_windows_merge_overlapping_and_touching_bookings():
+    busy = [(480, 600), (540, 660), (660, 720), (900, 960), (1170, 1260)]
+    assert free_windows(busy, 480, 1200, 60) == [(720, 900), (960, 1170)]
+    assert free_windows(busy, 480, 1200, 240) == []
+    assert free_windows([], 480, 1200, 60) == [(480, 1200)]
+    # Bookings outside the bookable day are ignored
+    assert free_windows([(420, 470), (1230, 1260)], 480, 1200, 720) == [(480, 1200)]
+
+
+def test_api_lists_free_windows_around_known_bookings(app, client):
+    with app.app_context():
+        halls = [
+            Hall(name='Large Hall', capacity=300, location='Main Block'),
+            Hall(name='Seminar Room', capacity=60, location='East Block'),
+            Hall(name='Small Room', capacity=20, location='East Block'),
+            Hall(name='Closed Hall', capacity=80, location='West Block', is_available=False),
+        ]
+        db.session.add_all(halls)
+        db.session.commit()
+        large, seminar = halls[0].id, halls[1].id
+        for start, end in ((time(9), time(10)), (time(10), time(12, 30)), (time(15), time(17))):
+            booking_service.create_booking(seminar, 'Student', 'Physics', 'Department seminar', DAY, start, end)
+        cancelled = booking_service.create_booking(seminar, 'Student', 'Physics', 'Department seminar',
+                                                   DAY, time(13), time(14))
+        booking_service.create_booking(large, 'Student', 'Physics', 'Department seminar',
+                                       DAY + timedelta(days=1), time(8), time(20))
+        db.session.commit()
+        booking_service.cancel_booking(cancelled)
+        db.session.commit()
+
+    response = client.get(f'/api/availability?start_date={DAY}&end_date={DAY + timedelta(days=1)}'
+                          f'&min_capacity=50&duration=120')
+    assert response.status_code == 200
+    halls = response.get_json()['halls']
+    # Closest capacity fit first; a fully booked day is left out
+    assert [(hall['name'], hall['capacity_slack']) for hall in halls] == [('Seminar Room', 10), ('Large Hall', 250)]
+    assert halls[0]['days'] == [
+        {'date': DAY.isoformat(), 'windows': [{'start': '12:30', 'end': '15:00'}, {'start': '17:00', 'end': '20:00'}]},
+        {'date': (DAY + timedelta(days=1)).isoformat(), 'windows': [{'start': '08:00', 'end': '20:00'}]},
+    ]
+    assert halls[1]['days'] == [{'date': DAY.isoformat(), 'windows': [{'start': '08:00', 'end': '20:00'}]}]
+
+    # No three-hour gap is left in the seminar room between 09:00 and 18:00
+    response = client.get(f'/api/availability?start_date={DAY}&min_capacity=50&duration=180'
+                          f'&day_start=09:00&day_end=18:00&limit=1')
+    assert response.get_json()['halls'] == [{
+        'id': large, 'name': 'Large Hall', 'capacity': 300, 'location': 'Main Block', 'capacity_slack': 250,
+        'days': [{'date': DAY.isoformat(), 'windows': [{'start': '09:00', 'end': '18:00'}]}]
+    }]
+
+
+def test_api_rejects_invalid_searches(client):
+    assert client.get('/api/availability').status_code == 400
+    assert client.get(f'/api/availability?start_date={DAY}&duration=30').status_code == 400
+    assert client.get(f'/api/availability?start_date={DAY}&end_date={DAY - timedelta(days=1)}').status_code == 400
+    assert client.get(f'/api/availability?start_date={DAY}&day_start=18:00&day_end=09:00').status_code == 400
@@ -0,0 +1,84 @@
+import threading
+from datetime import date, time, timedelta
+import pytest
+from sqlalchemy import text
+from app import db
+from models import Booking, Hall
+import booking_service
+
+THREADS_PER_HALL = 8
+
+
+def test_concurrent_bookings_of_one_slot_admit_exactly_one(app, settings):
+    """Threads race to book the same (and overlapping) slots of each hall;
+    exactly one booking per hall must get through"""
+    with app.app_context():
+        halls = [Hall(name=f'Hall {number}', capacity=100, location='Main Block') for number in range(3)]
+        db.session.add_all(halls)
+        db.session.commit()
+        hall_ids = [hall.id for hall in halls]
+
+    # Load the cached settings first: a cold cache makes every thread open
+    # a second connection at once, which can exhaust the pool
+    app.test_client().get('/')
+
+    booking_date = (date.today() + timedelta(days=7)).isoformat()
+    barrier = threading.Barrier(len(hall_ids) * THREADS_PER_HALL)
+    responses = []
+    responses_lock = threading.Lock()
+
+    def book(hall_id, number):
+        client = app.test_client()
+        # Odd threads ask for a slot overlapping the even threads' one
+        start, end = ('10:00', '12:00') if number % 2 else ('09:00', '11:00')
+        barrier.wait()
+        response = client.post(f'/book/{hall_id}', data={
+            'student_name': f'Student {number}',
+            'department': 'Physics',
+            'purpose': 'Department seminar',
+            'booking_date': booking_date,
+            'start_time': start,
+            'end_time': end,
+        })
+        with responses_lock:
+            responses.append((response.status_code, response.get_data(as_text=True)))
+
+    threads = [threading.Thread(target=book, args=(hall_id, number))
+               for hall_id in hall_ids for number in range(THREADS_PER_HALL)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with app.app_context():
+        for hall_id in hall_ids:
+            active = Booking.query.filter_by(hall_id=hall_id, status='active').count()
+            assert active == 1, f'hall {hall_id} has {active} active bookings'
+
+    # The winners were redirected; every other request saw the conflict
+    assert sum(1 for status, _ in responses if status == 302) == len(hall_ids)
+    losers = [body for status, body in responses if status != 302]
+    assert all('already booked' in body for body in losers)
+
+
+def test_bookings_of_different_halls_do_not_wait_on_each_other(app):
+    """A booking left uncommitted in one hall must not block a booking of
+    the same slot in another hall"""
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            pytest.skip('only PostgreSQL runs writers of different halls concurrently')
+        halls = [Hall(name=f'Hall {number}', capacity=100, location='Main Block') for number in range(2)]
+        db.session.add_all(halls)
+        db.session.commit()
+        hall_ids = [hall.id for hall in halls]
+
+    slot = dict(student_name='Student', department='Physics', purpose='Seminar',
+                booking_date=date.today() + timedelta(days=7), start_time=time(9), end_time=time(11))
+    with app.app_context():
+        booking_service.create_booking(hall_ids[0], **slot)
+        with app.app_context():
+            # Fail rather than hang if the second booking waits for a lock
+            db.session.execute(text("SET LOCAL lock_timeout = '2s'"))
+            booking_service.create_booking(hall_ids[1], **slot)
+            db.session.commit()
+        db.session.commit()
@@ -0,0 +1,36 @@
+import os
+from app import create_app, db
+import cache
+
+
+def test_saving_settings_reloads_them_in_other_workers(app, client, settings):
+    """Setup bumps the version file, which makes a second app instance
+    (standing in for another worker) reload its cached settings"""
+    other = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': app.config['SQLALCHEMY_DATABASE_URI'],
+        'SETTINGS_VERSION_FILE': app.config['SETTINGS_VERSION_FILE'],
+        'OUTBOX_WORKERS': 0,
+    })
+    with other.app_context():
+        assert cache.get_settings().college_name == 'Test College'
+    # The other worker's cache, as it stands when this worker saves
+    other_cache = dict(cache._settings_cache)
+    version = os.stat(app.config['SETTINGS_VERSION_FILE'])
+
+    response = client.post('/setup', data={'college_name': 'New College', 'college_logo_url': '',
+                                           'admin_emails': 'office@example.com'})
+    assert response.status_code == 302
+    assert os.stat(app.config['SETTINGS_VERSION_FILE']).st_ino != version.st_ino
+
+    cache._settings_cache.update(other_cache)
+    misses = cache.stats['settings_misses']
+    with other.app_context():
+        settings = cache.get_settings()
+        assert (settings.college_name, settings.email_list) == ('New College', ['office@example.com'])
+        assert cache.stats['settings_misses'] == misses + 1
+        # Then served from the cache again until the next save
+        with other.app_context():
+            assert cache.get_settings() is settings
+        assert cache.stats['settings_misses'] == misses + 1
+        db.engine.dispose()
@@ -0,0 +1,108 @@
+from contextlib import contextmanager
+from datetime import date, time
+from flask import template_rendered
+from sqlalchemy import event
+from app import db
+from models import Booking, Hall
+import booking_service
+import cache
+
+
+def add_halls(count, start=0):
+    """Add halls, each booked twice today, starting at hall number start"""
+    for number in range(start, start + count):
+        hall = Hall(name=f'Hall {number}', capacity=50, location='Main Block')
+        db.session.add(hall)
+        db.session.flush()
+        for hour in (9, 14):
+            db.session.add(Booking(hall_id=hall.id, student_name=f'Student {number}', department='Physics',
+                                   purpose='Weekly lab seminar', booking_date=date.today(),
+                                   start_time=time(hour), end_time=time(hour + 1)))
+    db.session.commit()
+
+
+@contextmanager
+def count_statements(app):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+
+def dashboard_statements(app, client):
+    """Return the statements one cold-cache dashboard request runs"""
+    with cache._fragment_lock:
+        cache._fragments.clear()
+        cache._fragment_sizes['total'] = 0
+    with count_statements(app) as statements:
+        response = client.get('/')
+    assert response.status_code == 200
+    return statements
+
+
+def test_dashboard_query_count_does_not_grow_with_halls(app, client, settings):
+    with app.app_context():
+        add_halls(5)
+    client.get('/')  # load the cached settings
+    few = dashboard_statements(app, client)
+
+    with app.app_context():
+        add_halls(45, start=5)
+    many = dashboard_statements(app, client)
+
+    assert len(many) == len(few), many
+
+
+def test_dashboard_lists_todays_bookings(app, client, settings):
+    with app.app_context():
+        add_halls(3)
+    page = client.get('/').get_data(as_text=True)
+    assert page.count('data-hall-id=') == 3
+    assert '2 bookings' in page
+    assert 'Student 2' in page
+
+
+@contextmanager
+def rendered_cards(app):
+    """Record the hall of every card template rendered"""
+    halls = []
+
+    def record(sender, template, context, **extra):
+        if template.name == 'hall_card.html':
+            halls.append(context['hall'].id)
+
+    template_rendered.connect(record, app)
+    try:
+        yield halls
+    finally:
+        template_rendered.disconnect(record, app)
+
+
+def test_a_booking_re_renders_only_its_hall_card(app, client, settings):
+    with app.app_context():
+        add_halls(3)
+        hall_ids = [hall.id for hall in Hall.query.order_by(Hall.id)]
+    with rendered_cards(app) as halls:
+        client.get('/')
+    assert sorted(halls) == hall_ids
+
+    with rendered_cards(app) as halls:
+        client.get('/')
+    assert halls == []
+
+    with app.app_context():
+        booking_service.create_booking(hall_ids[1], 'Latecomer', 'Physics', 'Weekly lab seminar',
+                                       date.today(), time(17), time(18))
+        db.session.commit()
+    with rendered_cards(app) as halls:
+        page = client.get('/').get_data(as_text=True)
+    assert halls == [hall_ids[1]]
+    assert 'Latecomer' in page and page.count('data-hall-id=') == 3
@@ -0,0 +1,66 @@
+from datetime import date, timedelta
+import pytest
+from app import create_app, db
+from models import Booking, Hall
+import cache
+
+
+@pytest.fixture
+def replicated_app(tmp_path):
+    """App on two SQLite files, the second configured as the read replica.
+    Nothing replicates between them, so each read shows which one served it."""
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "primary.db"}',
+        'SQLALCHEMY_BINDS': {'replica': f'sqlite:///{tmp_path / "replica.db"}'},
+        'SETTINGS_VERSION_FILE': str(tmp_path / 'settings.version'),
+        'OUTBOX_WORKERS': 0,
+    })
+    with app.app_context():
+        db.create_all()
+        db.metadata.create_all(db.engines['replica'])
+        db.session.add(Hall(name='Primary Hall', capacity=100, location='Main Block'))
+        db.session.commit()
+        with db.engines['replica'].begin() as connection:
+            connection.execute(Hall.__table__.insert(), {'name': 'Replica Hall', 'capacity': 100,
+                                                         'location': 'Main Block', 'is_available': True})
+        cache.invalidate_settings()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+    # init_app registered a metadata for the bind on the shared db, which
+    # the next app's create_all would otherwise look for an engine for
+    db.metadatas.pop('replica', None)
+
+
+def hall_names(client):
+    return [hall['name'] for hall in client.get('/api/halls').get_json()]
+
+
+def test_reads_use_the_replica_and_writes_the_primary(replicated_app):
+    client = replicated_app.test_client()
+    assert hall_names(client) == ['Replica Hall']
+
+    response = client.post('/api/bookings', json={
+        'hall_id': 1, 'student_name': 'Student', 'department': 'Physics', 'purpose': 'Department seminar',
+        'booking_date': (date.today() + timedelta(days=7)).isoformat(), 'start_time': '09:00', 'end_time': '10:00'
+    })
+    assert response.status_code == 201
+    with replicated_app.app_context():
+        assert db.session.query(Booking.student_name).all() == [('Student',)]
+        with db.engines['replica'].connect() as connection:
+            assert connection.execute(Booking.__table__.select()).all() == []
+
+    # The writing client reads its own write from the primary; others
+    # still read from the replica
+    assert hall_names(client) == ['Primary Hall']
+    assert hall_names(replicated_app.test_client()) == ['Replica Hall']
+
+
+def test_reads_return_to_the_replica_after_the_sticky_period(replicated_app):
+    replicated_app.config['DATABASE_REPLICA_STICKY'] = 0
+    client = replicated_app.test_client()
+    client.post('/api/bookings', json={})
+    assert hall_names(client) == ['Replica Hall']
@@ -0,0 +1,73 @@
+import json
+from datetime import date, time
+from app import db
+from models import Hall
+import booking_service
+import events
+import sync
+
+
+def add_hall(app, name='Main Hall'):
+    with app.app_context():
+        hall = Hall(name=name, capacity=100, location='Main Block')
+        db.session.add(hall)
+        db.session.commit()
+        return hall.id
+
+
+def read_event(chunks):
+    """Return the next event from an SSE stream as (type, id, data)"""
+    chunk = next(chunks)
+    while chunk.startswith(b':'):
+        chunk = next(chunks)
+    fields = dict(line.split(': ', 1) for line in chunk.decode().strip().split('\n'))
+    return fields['event'], fields.get('id'), json.loads(fields['data'])
+
+
+def test_stream_sends_committed_changes_only(app, client):
+    app.config['EVENT_STREAM_KEEPALIVE'] = 0.05
+    hall_id = add_hall(app)
+    response = client.get('/api/stream', buffered=False)
+    assert response.mimetype == 'text/event-stream'
+    chunks = iter(response.response)
+    assert next(chunks) == b'retry: 5000\n\n'
+
+    with app.app_context():
+        booking_service.create_booking(hall_id, 'Student', 'Physics', 'Department seminar',
+                                       date.today(), time(9), time(10))
+        db.session.rollback()
+        booking = booking_service.create_booking(hall_id, 'Student', 'Physics', 'Department seminar',
+                                                 date.today(), time(9), time(10))
+        db.session.commit()
+        change_seq = db.session.get(Hall, hall_id).change_seq
+
+    event_type, event_id, data = read_event(chunks)
+    assert (event_type, event_id) == ('hall.updated', str(change_seq))
+    assert (data['id'], data['today_bookings']) == (hall_id, 1)
+
+    assert len(events.get_bus().subscriptions) == 1
+    response.close()
+    assert len(events.get_bus().subscriptions) == 0
+
+
+def test_hall_cards_are_rendered_from_current_bookings(app, client):
+    hall_id = add_hall(app)
+    other_id = add_hall(app, 'Other Hall')
+    response = client.get(f'/api/hall-cards?ids={hall_id},{other_id},999')
+    assert response.status_code == 200
+    cards = response.get_json()['cards']
+    assert sorted(cards) == sorted([str(hall_id), str(other_id)])
+    assert 'No bookings today' in cards[str(hall_id)]
+
+    with app.app_context():
+        booking_service.create_booking(hall_id, 'Asha', 'Physics', 'Department seminar',
+                                       date.today(), time(9), time(10))
+        db.session.get(Hall, other_id).is_available = False
+        sync.touch_halls([other_id])
+        db.session.commit()
+
+    cards = client.get(f'/api/hall-cards?ids={hall_id},{other_id}').get_json()['cards']
+    assert "Today's Bookings" in cards[str(hall_id)] and 'Asha' in cards[str(hall_id)]
+    assert '1 booking' in cards[str(hall_id)]
+    assert 'Unavailable' in cards[str(other_id)]
+    assert client.get('/api/hall-cards?ids=1,x').status_code == 400
@@ -0,0 +1,90 @@
+import csv
+import io
+from datetime import date, time, timedelta
+from app import db
+from archive import archive_bookings
+from models import Hall
+import booking_service
+
+PAST = date.today() - timedelta(days=10)
+FUTURE = date.today() + timedelta(days=10)
+
+
+def add_hall(app, name='Main Hall'):
+    with app.app_context():
+        hall = Hall(name=name, capacity=100, location='Main Block')
+        db.session.add(hall)
+        db.session.commit()
+        return hall.id
+
+
+def book(hall_id, name, day, start, purpose='Department seminar'):
+    return booking_service.create_booking(hall_id, name, 'Physics', purpose, day, time(start), time(start + 1))
+
+
+def test_csv_export_includes_archived_bookings(app, client, settings):
+    hall_id = add_hall(app)
+    other_id = add_hall(app, 'Other Hall')
+    with app.app_context():
+        book(hall_id, 'Past', PAST, 9)
+        cancelled = book(hall_id, 'Cancelled', FUTURE, 9)
+        book(hall_id, '=HYPERLINK("x")', FUTURE, 11)
+        book(other_id, 'Elsewhere', FUTURE, 8)
+        db.session.commit()
+        booking_service.cancel_booking(cancelled)
+        db.session.commit()
+        assert archive_bookings(batch_size=10, pause=0) == 2
+
+    response = client.get('/admin/export/bookings.csv')
+    assert response.mimetype == 'text/csv'
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [(row['student_name'], row['booking_date'], row['status'], row['archived']) for row in rows] == [
+        ('Past', PAST.isoformat(), 'active', 'yes'),
+        ('Elsewhere', FUTURE.isoformat(), 'active', 'no'),
+        ('Cancelled', FUTURE.isoformat(), 'cancelled', 'yes'),
+        ('\'=HYPERLINK("x")', FUTURE.isoformat(), 'active', 'no'),
+    ]
+    assert (rows[0]['hall'], rows[0]['start_time'], rows[0]['end_time']) == ('Main Hall', '09:00', '10:00')
+
+    response = client.get(f'/admin/export/bookings.csv?hall_id={hall_id}&status=active')
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [(row['student_name'], row['archived']) for row in rows] == [('Past', 'yes'), ('\'=HYPERLINK("x")', 'no')]
+
+
+def test_calendar_feed_answers_304_until_the_hall_changes(app, client):
+    hall_id = add_hall(app)
+    other_id = add_hall(app, 'Other Hall')
+    with app.app_context():
+        book(hall_id, 'Past', PAST, 9)
+        book(hall_id, 'Future', FUTURE, 9, purpose='Talks on optics, lasers; and more ' * 3)
+        book(hall_id, 'Too Old', date.today() - timedelta(days=app.config['CALENDAR_PAST_DAYS'] + 1), 9)
+        db.session.commit()
+        assert archive_bookings(batch_size=10, pause=0) == 2
+
+    response = client.get(f'/halls/{hall_id}/calendar.ics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/calendar'
+    feed = response.get_data(as_text=True)
+    assert feed.startswith('BEGIN:VCALENDAR\r\n') and feed.endswith('END:VCALENDAR\r\n')
+    assert feed.count('BEGIN:VEVENT') == 2
+    assert f'DTSTART:{PAST:%Y%m%d}T090000' in feed and f'DTEND:{FUTURE:%Y%m%d}T100000' in feed
+    assert 'Too Old' not in feed
+    assert all(len(line.encode()) <= 75 for line in feed.split('\r\n'))
+    assert 'Talks on optics\\, lasers\\; and more' in feed.replace('\r\n ', '')
+    etag = response.headers['ETag']
+
+    response = client.get(f'/halls/{hall_id}/calendar.ics', headers={'If-None-Match': etag})
+    assert (response.status_code, response.headers['ETag'], response.get_data()) == (304, etag, b'')
+
+    # A booking in another hall leaves this feed alone; one in this hall changes it
+    with app.app_context():
+        book(other_id, 'Elsewhere', FUTURE, 9)
+        db.session.commit()
+    assert client.get(f'/halls/{hall_id}/calendar.ics', headers={'If-None-Match': etag}).status_code == 304
+    with app.app_context():
+        book(hall_id, 'Later', FUTURE, 12)
+        db.session.commit()
+    response = client.get(f'/halls/{hall_id}/calendar.ics', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.get_data(as_text=True).count('BEGIN:VEVENT') == 3
@@ -0,0 +1,96 @@
+from datetime import date, time, timedelta
+from app import db
+from models import Booking, Hall
+import booking_service
+
+DAY = date.today() + timedelta(days=7)
+BOOKING_HEADER = 'hall,student_name,department,purpose,booking_date,start_time,end_time,status\n'
+
+
+def run_import(app, tmp_path, kind, text, *options):
+    path = tmp_path / f'{kind}.csv'
+    path.write_text(text)
+    return app.test_cli_runner().invoke(args=['import', kind, str(path), *options])
+
+
+def add_hall(app, name):
+    with app.app_context():
+        hall = Hall(name=name, capacity=100, location='Main Block')
+        db.session.add(hall)
+        db.session.commit()
+        return hall.id
+
+
+def booking_row(hall, name, start, end, day=DAY, status=''):
+    return f'{hall},{name},Physics,Department seminar,{day.isoformat()},{start},{end},{status}\n'
+
+
+def test_halls_reject_duplicate_names_in_the_file_and_the_database(app, tmp_path):
+    add_hall(app, 'Main Hall')
+    result = run_import(app, tmp_path, 'halls', (
+        'name,capacity,location,description\n'
+        'Main Hall,100,Main Block,\n'
+        'Lecture Hall,80,East Block,Tiered seating\n'
+        'Lecture Hall,60,West Block,\n'
+        'Seminar Room,0,East Block,\n'
+    ))
+    assert result.exit_code == 1
+    assert 'Imported 1 halls.' in result.output
+    assert 'line 2: name: A hall with this name already exists' in result.output
+    assert 'line 4: name: Duplicate of line 3' in result.output
+    assert 'line 5: capacity:' in result.output
+    with app.app_context():
+        assert [(hall.name, hall.capacity) for hall in Hall.query.order_by(Hall.id)] == [
+            ('Main Hall', 100), ('Lecture Hall', 80)
+        ]
+
+
+def test_bookings_reject_overlaps_with_the_file_and_stored_bookings(app, tmp_path):
+    hall_id = add_hall(app, 'Main Hall')
+    add_hall(app, 'Other Hall')
+    with app.app_context():
+        booking_service.create_booking(hall_id, 'Stored', 'Physics', 'Department seminar', DAY, time(14), time(16))
+        db.session.commit()
+
+    result = run_import(app, tmp_path, 'bookings', BOOKING_HEADER + ''.join([
+        booking_row('Main Hall', 'First', '09:00', '11:00'),
+        booking_row('Main Hall', 'Clashes with first', '10:00', '12:00'),
+        booking_row('Main Hall', 'Back to back', '11:00', '12:00'),
+        booking_row('Main Hall', 'Clashes with stored', '15:00', '17:00'),
+        booking_row('Main Hall', 'Cancelled overlap', '10:00', '12:00', status='cancelled'),
+        booking_row('Other Hall', 'Other hall', '10:00', '12:00'),
+        booking_row('Missing Hall', 'Nowhere', '10:00', '12:00'),
+        booking_row('Main Hall', 'Past', '09:00', '10:00', day=date.today() - timedelta(days=30)),
+    ]))
+    assert result.exit_code == 1
+    assert 'Imported 5 bookings.' in result.output
+    assert 'line 3: Overlaps another booking in the file' in result.output
+    assert 'line 5: Overlaps an existing booking' in result.output
+    assert 'line 8: hall: No hall named "Missing Hall"' in result.output
+    with app.app_context():
+        assert sorted(name for name, in db.session.query(Booking.student_name)) == [
+            'Back to back', 'Cancelled overlap', 'First', 'Other hall', 'Past', 'Stored'
+        ]
+        assert db.session.get(Hall, hall_id).change_seq > 0
+
+
+def test_dry_run_validates_without_writing(app, tmp_path):
+    add_hall(app, 'Main Hall')
+    rows = BOOKING_HEADER + booking_row('Main Hall', 'First', '09:00', '11:00')
+
+    result = run_import(app, tmp_path, 'bookings', rows, '--dry-run')
+    assert (result.exit_code, result.output.strip()) == (0, 'Would import 1 bookings.')
+    result = run_import(app, tmp_path, 'halls', 'name,capacity,location\nLecture Hall,80,East Block\n', '--dry-run')
+    assert (result.exit_code, result.output.strip()) == (0, 'Would import 1 halls.')
+    with app.app_context():
+        assert Booking.query.count() == 0
+        assert Hall.query.count() == 1
+
+    result = run_import(app, tmp_path, 'bookings', rows)
+    assert (result.exit_code, result.output.strip()) == (0, 'Imported 1 bookings.')
+
+
+def test_missing_columns_fail_before_any_row(app, tmp_path):
+    result = run_import(app, tmp_path, 'halls', 'name,location\nMain Hall,Main Block\n')
+    assert result.exit_code == 1
+    assert 'Missing columns: capacity' in result.output
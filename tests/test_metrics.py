@@ -0,0 +1,46 @@
+import json
+import os
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from app import db
+import metrics
+
+
+def counter(name, labels=()):
+    return metrics.registry.values.get((name, labels), 0)
+
+
+def test_failed_statements_do_not_leak_start_times(app):
+    errors = counter('db_query_errors_total')
+    with app.app_context(), db.engine.connect() as connection:
+        for _ in range(3):
+            with pytest.raises(DBAPIError):
+                connection.execute(text('SELECT * FROM no_such_table'))
+            connection.rollback()
+        connection.execute(text('SELECT 1'))
+        assert connection.info['query_start_time'] == []
+    assert counter('db_query_errors_total') == errors + 3
+
+
+def test_metrics_endpoint_reports_requests_and_queries(app, client):
+    client.get('/api/halls')
+    body = client.get('/metrics').get_data(as_text=True)
+    assert '# TYPE http_request_duration_seconds histogram' in body
+    assert 'http_request_duration_seconds_count{endpoint="main.api_halls",method="GET",status="200"}' in body
+    assert 'http_request_db_queries_bucket{endpoint="main.api_halls",le="+Inf"}' in body
+    assert '# TYPE db_query_errors_total counter' in body
+    queries = next(line for line in body.splitlines() if line.startswith('db_queries_total '))
+    assert int(queries.split()[1]) > 0
+
+
+def test_metrics_are_summed_over_worker_snapshots(app, client, tmp_path, monkeypatch):
+    # No background writer for this process; /metrics writes its own snapshot
+    monkeypatch.setattr(metrics, 'start_flusher', lambda config: None)
+    app.config['METRICS_DIR'] = str(tmp_path)
+    (tmp_path / 'metrics-1.json').write_text(json.dumps([['smtp_messages_total', [['result', 'sent']], 5]]))
+    sent = counter('smtp_messages_total', (('result', 'sent'),))
+
+    body = client.get('/metrics').get_data(as_text=True)
+    assert f'smtp_messages_total{{result="sent"}} {sent + 5}' in body
+    assert (tmp_path / f'metrics-{os.getpid()}.json').exists()
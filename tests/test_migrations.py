@@ -0,0 +1,104 @@
+import os
+import shutil
+from datetime import date, time, timedelta
+import pytest
+from sqlalchemy import inspect, text
+from app import create_app, db
+from models import Booking, Hall
+import analytics
+import booking_service
+import cache
+import migrations
+
+SHIPPED_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance', 'hall_management.db')
+
+
+@pytest.fixture
+def upgraded_app(tmp_path):
+    """App on a copy of the shipped database, created before the schema
+    grew, after running the migrations on it"""
+    path = tmp_path / 'hall_management.db'
+    shutil.copy(SHIPPED_DB, path)
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}',
+        'SETTINGS_VERSION_FILE': str(tmp_path / 'settings.version'),
+        'OUTBOX_WORKERS': 0,
+    })
+    with app.app_context():
+        cache.invalidate_settings()
+        with cache._fragment_lock:
+            cache._fragments.clear()
+            cache._fragment_sizes['total'] = 0
+        migrations.migrate()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def test_migrating_the_shipped_database_keeps_its_rows(upgraded_app):
+    with upgraded_app.app_context():
+        assert db.session.execute(text('SELECT count(*) FROM hall')).scalar() == 2
+        assert db.session.execute(text('SELECT count(*) FROM booking')).scalar() == 4
+        tables = set(inspect(db.engine).get_table_names())
+        assert {'booking_series', 'waitlist_entry', 'hall_day_usage', 'idempotency_key'} <= tables
+        indexes = {index['name'] for index in inspect(db.engine).get_indexes('booking')}
+        # The rollups start out filled from the existing bookings
+        assert db.session.execute(text('SELECT sum(booking_count) FROM hall_day_usage')).scalar() == 4
+        assert {'ix_booking_conflict', 'ix_booking_date', 'ix_booking_department', 'ix_booking_series_id'} <= indexes
+
+
+def test_upgraded_database_serves_the_dashboard_and_hall_api(upgraded_app):
+    client = upgraded_app.test_client()
+    assert client.get('/').status_code == 200
+    assert client.get('/admin').status_code == 200
+    response = client.get('/api/halls?since=0')
+    assert response.status_code == 200
+    assert len(response.json['halls']) == 2
+    with upgraded_app.app_context():
+        assert all(hall.change_seq > 0 for hall in Hall.query)
+        name = Booking.query.first().student_name
+    response = client.get('/admin/bookings', query_string={'q': name})
+    assert response.status_code == 200
+    assert name in response.get_data(as_text=True)
+
+
+def test_migrations_are_idempotent(app, upgraded_app):
+    for each_app in (app, upgraded_app):
+        with each_app.app_context():
+            assert not [step for step in migrations.MIGRATIONS if step()]
+
+
+def test_old_shaped_rollups_are_rebuilt_per_hall(app):
+    with app.app_context():
+        hall = Hall(name='Main Hall', capacity=100, location='Main Block')
+        db.session.add(hall)
+        db.session.flush()
+        booking_service.create_booking(hall.id, 'Student', 'Physics', 'Seminar',
+                                       date.today() + timedelta(days=1), time(9), time(11))
+        db.session.commit()
+        report = analytics.report(date.today(), date.today() + timedelta(days=7), 'week', 600)
+        for table, key in (('department_day_usage', 'department VARCHAR(100), usage_date DATE'),
+                           ('hour_usage', 'usage_date DATE, hour INTEGER')):
+            db.session.execute(text(f'DROP TABLE {table}'))
+            db.session.execute(text(f'CREATE TABLE {table} ({key}, booked_minutes INTEGER, booking_count INTEGER)'))
+        db.session.commit()
+
+        migrations.migrate()
+        assert migrations.has_column('hour_usage', 'hall_id')
+        assert analytics.report(date.today(), date.today() + timedelta(days=7), 'week', 600) == report
+
+
+def test_idempotency_keys_become_nullable(app):
+    with app.app_context():
+        db.session.execute(text('DROP TABLE idempotency_key'))
+        db.session.execute(text("""CREATE TABLE idempotency_key (
+            key VARCHAR(255) PRIMARY KEY, fingerprint VARCHAR(64) NOT NULL,
+            status_code INTEGER NOT NULL, body TEXT NOT NULL, created_at TIMESTAMP NOT NULL)"""))
+        db.session.commit()
+
+        migrations.migrate()
+        columns = {column['name']: column for column in inspect(db.engine).get_columns('idempotency_key')}
+        assert columns['status_code']['nullable'] and columns['body']['nullable']
+        assert 'ix_idempotency_key_created_at' in {index['name'] for index in inspect(db.engine).get_indexes('idempotency_key')}
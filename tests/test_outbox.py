@@ -0,0 +1,120 @@
+import socket
+import threading
+from datetime import datetime, timedelta
+import pytest
+from app import db, mail
+from models import EmailOutbox
+import outbox
+
+
+def queue(count, recipient='student@example.com'):
+    for number in range(count):
+        outbox.queue_email(f'Message {number}', [recipient], 'Body')
+    db.session.commit()
+
+
+@pytest.fixture
+def smtp_server(app):
+    """A local SMTP server that accepts mail, except to bounce@ addresses,
+    with the app's mail settings pointed at it"""
+    aiosmtpd_controller = pytest.importorskip('aiosmtpd.controller')
+
+    class Handler:
+        def __init__(self):
+            self.received = []
+
+        async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+            if address.startswith('bounce@'):
+                return '550 No such user'
+            envelope.rcpt_tos.append(address)
+            return '250 OK'
+
+        async def handle_DATA(self, server, session, envelope):
+            self.received.append(envelope)
+            return '250 Message accepted'
+
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    handler = Handler()
+    controller = aiosmtpd_controller.Controller(handler, hostname='127.0.0.1', port=port)
+    controller.start()
+    app.config.update(MAIL_SERVER='127.0.0.1', MAIL_PORT=port, MAIL_USE_TLS=False, MAIL_USERNAME=None,
+                      MAIL_DEFAULT_SENDER='halls@example.com', MAIL_SUPPRESS_SEND=False)
+    mail.init_app(app)
+    yield handler
+    controller.stop()
+
+
+def test_claim_batch_claims_each_message_once_across_sessions(app):
+    with app.app_context():
+        queue(30)
+        queued = [message.id for message in EmailOutbox.query.order_by(EmailOutbox.id)]
+    claimed = []
+    barrier = threading.Barrier(2)
+
+    def worker():
+        # Each thread's app context has its own session and connection
+        with app.app_context():
+            barrier.wait()
+            while batch := outbox.claim_batch(4, 300):
+                claimed.extend(message.id for message in batch)
+
+    workers = [threading.Thread(target=worker) for _ in range(2)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    assert sorted(claimed) == queued
+    with app.app_context():
+        assert EmailOutbox.query.filter_by(status='sending').count() == 30
+        assert outbox.claim_batch(4, 300) == []
+
+
+def test_failed_sends_back_off_exponentially_then_give_up(app):
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        closed_port = probe.getsockname()[1]
+    app.config.update(MAIL_SERVER='127.0.0.1', MAIL_PORT=closed_port, MAIL_USE_TLS=False, MAIL_SUPPRESS_SEND=False,
+                      OUTBOX_MAX_ATTEMPTS=3, OUTBOX_RETRY_BASE=30)
+    mail.init_app(app)
+    with app.app_context():
+        queue(2)
+        delays = []
+        for attempt in range(1, 4):
+            started = datetime.utcnow()
+            assert outbox.deliver_pending(app.config) == 0
+            messages = EmailOutbox.query.order_by(EmailOutbox.id).all()
+            assert [message.attempts for message in messages] == [attempt, attempt]
+            if attempt < 3:
+                assert {message.status for message in messages} == {'pending'}
+                delays.append(round((messages[0].next_attempt_at - started).total_seconds()))
+                # Not due again until the backoff has passed
+                assert outbox.deliver_pending(app.config) == 0
+                assert messages[0].attempts == attempt
+                for message in messages:
+                    message.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+                db.session.commit()
+
+        assert delays == [30, 60]
+        assert {message.status for message in messages} == {'failed'}
+        assert all(message.last_error for message in messages)
+
+
+def test_deliver_pending_sends_over_smtp_and_retries_refused_messages(app, smtp_server):
+    app.config['OUTBOX_BATCH_SIZE'] = 2
+    with app.app_context():
+        queue(3)
+        queue(1, recipient='bounce@example.com')
+
+        assert outbox.deliver_pending(app.config) == 3
+        assert sorted(envelope.rcpt_tos[0] for envelope in smtp_server.received) == ['student@example.com'] * 3
+        assert b'Subject: Message 0' in smtp_server.received[0].content
+
+        statuses = [(message.recipients, message.status, message.attempts)
+                    for message in EmailOutbox.query.order_by(EmailOutbox.id)]
+        assert statuses == [('student@example.com', 'sent', 0)] * 3 + [('bounce@example.com', 'pending', 1)]
+        refused = EmailOutbox.query.filter_by(recipients='bounce@example.com').one()
+        assert refused.next_attempt_at > datetime.utcnow()
+        assert '550' in refused.last_error
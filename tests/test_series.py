@@ -0,0 +1,82 @@
+from datetime import date, time, timedelta
+from app import db
+from models import Booking, BookingSeries, Hall
+import analytics
+import booking_service
+
+START = date.today() + timedelta(days=7)
+
+
+def add_hall(app):
+    with app.app_context():
+        hall = Hall(name='Main Hall', capacity=100, location='Main Block')
+        db.session.add(hall)
+        db.session.commit()
+        return hall.id
+
+
+def series(hall_id, start_date, until_date, interval_weeks=1):
+    return booking_service.create_series(hall_id, 'Student', 'Physics', 'Weekly seminar', start_date, until_date,
+                                         interval_weeks, time(9), time(11))
+
+
+def test_create_series_books_every_occurrence(app):
+    hall_id = add_hall(app)
+    with app.app_context():
+        created = series(hall_id, START, START + timedelta(weeks=6), interval_weeks=2)
+        db.session.commit()
+
+        bookings = Booking.query.filter_by(series_id=created.id).order_by(Booking.booking_date).all()
+        assert [booking.booking_date for booking in bookings] == [START + timedelta(weeks=n) for n in (0, 2, 4, 6)]
+        assert {(booking.start_time, booking.end_time, booking.status) for booking in bookings} == {
+            (time(9), time(11), 'active')
+        }
+        assert analytics.department_hours(START, START + timedelta(weeks=6)) == [
+            {'department': 'Physics', 'booked_hours': 8.0, 'bookings': 4}
+        ]
+
+
+def test_partly_taken_series_reports_every_clash_and_books_nothing(app, client, settings):
+    hall_id = add_hall(app)
+    with app.app_context():
+        for weeks, name in ((1, 'Asha'), (3, 'Ravi')):
+            booking_service.create_booking(hall_id, name, 'Chemistry', 'Lab meeting',
+                                           START + timedelta(weeks=weeks), time(10), time(12))
+        db.session.commit()
+
+    response = client.post(f'/book/{hall_id}/series', data={
+        'student_name': 'Student', 'department': 'Physics', 'purpose': 'Weekly physics seminar',
+        'booking_date': START.isoformat(), 'until_date': (START + timedelta(weeks=4)).isoformat(),
+        'interval_weeks': 1, 'start_time': '09:00', 'end_time': '11:00'
+    })
+    assert response.status_code == 200
+    page = response.get_data(as_text=True)
+    assert '2 dates in this series are already booked' in page
+    for weeks, name in ((1, 'Asha'), (3, 'Ravi')):
+        assert f"{(START + timedelta(weeks=weeks)).strftime('%b %d, %Y')} (10:00 - 12:00 by {name})" in page
+    with app.app_context():
+        assert BookingSeries.query.count() == 0
+        assert Booking.query.count() == 2
+
+
+def test_cancel_series_keeps_past_occurrences_and_fills_freed_slots(app):
+    hall_id = add_hall(app)
+    first = date.today() - timedelta(weeks=2)
+    with app.app_context():
+        created = series(hall_id, first, first + timedelta(weeks=4))
+        entry = booking_service.join_waitlist(hall_id, 'Waiting', 'Chemistry', 'Lab meeting',
+                                              first + timedelta(weeks=3), time(9), time(10))
+        db.session.commit()
+
+        cancelled, promoted = booking_service.cancel_series(created)
+        db.session.commit()
+
+        assert cancelled == 3
+        assert created.status == 'cancelled'
+        statuses = [(booking.booking_date, booking.status) for booking in
+                    Booking.query.filter_by(series_id=created.id).order_by(Booking.booking_date)]
+        assert statuses == [(first + timedelta(weeks=n), 'active' if n < 2 else 'cancelled') for n in range(5)]
+        assert [(booking.student_name, booking.booking_date) for booking in promoted] == [
+            ('Waiting', first + timedelta(weeks=3))
+        ]
+        assert entry.booking_id == promoted[0].id
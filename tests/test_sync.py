@@ -0,0 +1,54 @@
+import pytest
+from app import db
+from models import Hall
+import sync
+
+
+def add_halls(app, count):
+    with app.app_context():
+        halls = [Hall(name=f'Hall {number}', capacity=100, location='Main Block') for number in range(count)]
+        db.session.add_all(halls)
+        db.session.flush()
+        sync.touch_halls([hall.id for hall in halls])
+        db.session.commit()
+        return [hall.id for hall in halls]
+
+
+def test_delta_sync_reports_changes_and_deletions(app, client):
+    first, second = add_halls(app, 2)
+    response = client.get('/api/halls?since=0')
+    assert [hall['id'] for hall in response.json['halls']] == [first, second]
+    since, etag = response.json['seq'], response.headers['ETag']
+
+    with app.app_context():
+        db.session.get(Hall, first).capacity = 200
+        sync.touch_halls([first])
+        db.session.delete(db.session.get(Hall, second))
+        sync.touch_halls([second], deleted=True)
+        db.session.commit()
+
+    assert client.get(f'/api/halls?since={since}', headers={'If-None-Match': etag}).status_code == 200
+    body = client.get(f'/api/halls?since={since}').json
+    assert [(hall['id'], hall['capacity']) for hall in body['halls']] == [(first, 200)]
+    assert body['deleted'] == [second]
+
+
+def test_delta_sync_does_not_skip_a_change_that_commits_late(app, client):
+    """A change numbered below one already synced must still reach the
+    client once it commits"""
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            pytest.skip('only PostgreSQL lets two changes to halls be in flight at once')
+    first, second = add_halls(app, 2)
+
+    with app.app_context():
+        sync.touch_halls([first])  # Numbered first, committed last
+        with app.app_context():
+            sync.touch_halls([second])
+            db.session.commit()
+        body = client.get('/api/halls?since=0').json
+        since = body['seq']
+        db.session.commit()
+
+    body = client.get(f'/api/halls?since={since}').json
+    assert first in [hall['id'] for hall in body['halls']]
@@ -0,0 +1,48 @@
+from datetime import date, time, timedelta
+from app import db
+from models import Booking, EmailOutbox, Hall, WaitlistEntry
+import booking_service
+
+DAY = date.today() + timedelta(days=7)
+
+
+def test_cancelling_promotes_the_first_waiting_entries_that_fit(app, client, settings):
+    with app.app_context():
+        hall = Hall(name='Main Hall', capacity=100, location='Main Block')
+        db.session.add(hall)
+        db.session.commit()
+        slot = dict(hall_id=hall.id, department='Physics', purpose='Department seminar', booking_date=DAY)
+        cancelled = booking_service.create_booking(student_name='Cancelled', start_time=time(9), end_time=time(11), **slot)
+        booking_service.create_booking(student_name='Stays', start_time=time(11, 30), end_time=time(12, 30), **slot)
+        # In the order they joined; Blocked still overlaps Stays, and Late
+        # overlaps First once First is booked
+        names = [
+            ('Blocked', time(10), time(12)),
+            ('First', time(9), time(10)),
+            ('Late', time(9, 30), time(10, 30)),
+            ('Second', time(10), time(11)),
+        ]
+        entries = {name: booking_service.join_waitlist(student_name=name, start_time=start, end_time=end, **slot)
+                   for name, start, end in names}
+        db.session.commit()
+        booking_id = cancelled.id
+        entry_ids = {name: entry.id for name, entry in entries.items()}
+
+    response = client.post(f'/admin/booking/{booking_id}/cancel', follow_redirects=True)
+    assert '2 waitlisted request(s) moved into the freed slot.' in response.get_data(as_text=True)
+
+    with app.app_context():
+        entries = {name: db.session.get(WaitlistEntry, entry_id) for name, entry_id in entry_ids.items()}
+        assert {name: entry.status for name, entry in entries.items()} == {
+            'Blocked': 'waiting', 'First': 'promoted', 'Late': 'waiting', 'Second': 'promoted'
+        }
+        active = Booking.query.filter_by(status='active').order_by(Booking.start_time).all()
+        assert [(booking.student_name, booking.start_time) for booking in active] == [
+            ('First', time(9)), ('Second', time(10)), ('Stays', time(11, 30))
+        ]
+        assert entries['First'].booking_id == active[0].id
+
+        # The admins are told about each promoted booking as a new request
+        messages = EmailOutbox.query.order_by(EmailOutbox.id).all()
+        assert [message.recipient_list for message in messages] == [['admin@example.com']] * 2
+        assert '- Name: First' in messages[0].body and '- Name: Second' in messages[1].body